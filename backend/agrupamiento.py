@@ -0,0 +1,340 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import Config
+
+try:
+    import numpy as np
+except ImportError:  # DBSCAN necesita NumPy; sin él se usa el clustering voraz
+    np = None
+
+# CLUSTERING DE ZONAS DE RIESGO (DBSCAN SOBRE GRILLA)
+#
+# Config.ALGORITMO_ZONAS elige cómo se agrupan los reportes en zonas de riesgo:
+#   'voraz'   una pasada en el orden del snapshot (predicciones.calcular_zonas_riesgo)
+#   'dbscan'  DBSCAN con eps = radio y Config.DBSCAN_MIN_PUNTOS; no depende del orden
+#
+# DBSCAN se resuelve sobre una grilla de celdas de lado eps/√2: dos puntos de la
+# misma celda siempre están a menos de eps, así que una celda con min_puntos o más
+# es toda núcleo y los clusters se arman uniendo celdas (no puntos). Cada punto
+# solo se compara con las 20 celdas vecinas.
+#
+# La ciudad se parte en teselas de Config.DBSCAN_TESELA grados que se procesan en
+# paralelo. Cada tesela recibe además un borde de 4 celdas (lo que hace falta para
+# saber qué puntos son núcleo hasta 2 celdas afuera) y devuelve la componente local
+# de cada celda núcleo que ve. Al juntar las teselas, las celdas del borde que ven
+# dos teselas unen sus componentes (union-find sobre celdas): el resultado es el
+# mismo que sin partir.
+
+# Celdas a menos de eps: ±2 en cada eje salvo las esquinas (±2, ±2)
+_VECINAS = [(df, dc) for df in range(-2, 3) for dc in range(-2, 3) if abs(df) + abs(dc) < 4]
+_VECINAS_ADELANTE = [v for v in _VECINAS if v > (0, 0)]
+_BORDE = 4
+
+# Celda (fila, col) como un solo int64
+_DESPLAZAMIENTO = 1 << 22
+_ANCHO = 1 << 23
+
+# Pares que se comparan primero al buscar si dos celdas núcleo se tocan
+_MUESTRA_PAR = 16
+
+
+def _id_celda(fila, col):
+    return (fila + _DESPLAZAMIENTO) * _ANCHO + (col + _DESPLAZAMIENTO)
+
+
+def _cerca(lat, lng, a, b, eps2):
+    """Matriz len(a) x len(b): True si los puntos están a menos de eps"""
+    return (lat[a, None] - lat[b])**2 + (lng[a, None] - lng[b])**2 < eps2
+
+
+def _hay_par_cercano(lat, lng, a, b, eps2):
+    """¿Algún punto de `a` a menos de eps de alguno de `b`?"""
+    if len(a) * len(b) > _MUESTRA_PAR * _MUESTRA_PAR:
+        # Primero los puntos de cada celda más cercanos a la otra: entre celdas
+        # densas casi siempre alcanza y no se arma la matriz completa
+        sa = _mas_cercanos(lat, lng, a, b)
+        sb = _mas_cercanos(lat, lng, b, a)
+        if _cerca(lat, lng, sa, sb, eps2).any():
+            return True
+    for inicio in range(0, len(a), 1024):
+        if _cerca(lat, lng, a[inicio:inicio + 1024], b, eps2).any():
+            return True
+    return False
+
+
+def _mas_cercanos(lat, lng, a, b):
+    if len(a) <= _MUESTRA_PAR:
+        return a
+    distancia = (lat[a] - lat[b].mean())**2 + (lng[a] - lng[b].mean())**2
+    return a[np.argpartition(distancia, _MUESTRA_PAR)[:_MUESTRA_PAR]]
+
+
+def _agrupar_celdas(filas, cols):
+    """celda (fila, col) -> posiciones de sus puntos (en orden ascendente)"""
+    orden = np.lexsort((cols, filas))
+    claves_f = filas[orden]
+    claves_c = cols[orden]
+    cortes = np.flatnonzero((np.diff(claves_f) != 0) | (np.diff(claves_c) != 0)) + 1
+    inicios = np.concatenate(([0], cortes)).tolist()
+    fines = np.concatenate((cortes, [len(orden)])).tolist()
+    return {
+        (int(claves_f[a]), int(claves_c[a])): orden[a:b]
+        for a, b in zip(inicios, fines)
+    }
+
+
+def _dbscan_tesela(tarea):
+    """
+    DBSCAN de una tesela (se ejecuta en los procesos del pool)
+    tarea: (indices, lat, lng, filas, cols, (f0, f1, c0, c1), eps, min_puntos)
+      indices: índices globales de los puntos de la tesela y de su borde
+      f0..f1 / c0..c1: celdas propias de la tesela (rangos semiabiertos)
+    Devuelve (propios, etiquetas, enlaces):
+      propios: índices globales de los puntos de la tesela
+      etiquetas: celda representante de su componente local (-1 = ruido)
+      enlaces: pares (celda, representante) de las celdas núcleo que vio la tesela
+    """
+    indices, lat, lng, filas, cols, (f0, f1, c0, c1), eps, min_puntos = tarea
+    eps2 = eps * eps
+
+    def dentro(celda, anillo):
+        return f0 - anillo <= celda[0] < f1 + anillo and c0 - anillo <= celda[1] < c1 + anillo
+
+    celdas = _agrupar_celdas(filas, cols)
+
+    # Núcleos: exactos en la tesela y hasta 2 celdas afuera
+    nucleo = np.zeros(len(indices), dtype=bool)
+    for (f, c), puntos in celdas.items():
+        if not dentro((f, c), 2):
+            continue
+        if len(puntos) >= min_puntos:
+            nucleo[puntos] = True
+            continue
+        vecinos = [celdas[k] for k in ((f + df, c + dc) for df, dc in _VECINAS if df or dc) if k in celdas]
+        cuenta = np.full(len(puntos), len(puntos))
+        if vecinos:
+            cuenta += _cerca(lat, lng, puntos, np.concatenate(vecinos), eps2).sum(axis=1)
+        nucleo[puntos] = cuenta >= min_puntos
+
+    nucleos = {}
+    for celda, puntos in celdas.items():
+        if dentro(celda, 2):
+            propios = puntos[nucleo[puntos]]
+            if propios.size:
+                nucleos[celda] = propios
+
+    # Componentes de celdas núcleo; la raíz es siempre la celda menor
+    padre = {celda: celda for celda in nucleos}
+
+    def raiz(celda):
+        while padre[celda] != celda:
+            padre[celda] = padre[padre[celda]]
+            celda = padre[celda]
+        return celda
+
+    for (f, c), a in nucleos.items():
+        for df, dc in _VECINAS_ADELANTE:
+            b = nucleos.get((f + df, c + dc))
+            if b is None:
+                continue
+            ra, rb = raiz((f, c)), raiz((f + df, c + dc))
+            if ra != rb and _hay_par_cercano(lat, lng, a, b, eps2):
+                padre[max(ra, rb)] = min(ra, rb)
+
+    representante = {celda: _id_celda(*raiz(celda)) for celda in nucleos}
+
+    etiquetas = np.full(len(indices), -1, dtype=np.int64)
+    for celda, puntos in nucleos.items():
+        if dentro(celda, 0):
+            etiquetas[puntos] = representante[celda]
+
+    # Puntos de borde: van con el núcleo de menor índice global a menos de eps,
+    # así la asignación no depende de cómo se partió la ciudad
+    for (f, c), puntos in celdas.items():
+        if not dentro((f, c), 0):
+            continue
+        libres = puntos[~nucleo[puntos]]
+        vecinos = [k for k in ((f + df, c + dc) for df, dc in _VECINAS) if k in nucleos]
+        if not libres.size or not vecinos:
+            continue
+        candidatos = np.concatenate([nucleos[k] for k in vecinos])
+        reps = np.concatenate([np.full(len(nucleos[k]), representante[k]) for k in vecinos])
+        cerca = _cerca(lat, lng, libres, candidatos, eps2)
+        globales = np.where(cerca, indices[candidatos], np.iinfo(np.int64).max)
+        mejor = globales.argmin(axis=1)
+        con_nucleo = cerca.any(axis=1)
+        etiquetas[libres[con_nucleo]] = reps[mejor[con_nucleo]]
+
+    propio = (filas >= f0) & (filas < f1) & (cols >= c0) & (cols < c1)
+    enlaces = np.array(
+        [(_id_celda(*celda), rep) for celda, rep in representante.items()], dtype=np.int64
+    ).reshape(-1, 2)
+    return indices[propio], etiquetas[propio], enlaces
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _ejecutor(procesos):
+    """Pool de procesos para las teselas (uno por proceso del servidor)"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # 'spawn': el servidor tiene hilos (pool de conexiones, LISTEN) y no
+            # conviene copiarlos con fork
+            _pool = ProcessPoolExecutor(
+                max_workers=procesos,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _descartar_ejecutor():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def dbscan(latitudes, longitudes, eps, min_puntos, tesela=None, procesos=None):
+    """
+    Etiqueta de cluster de cada punto (0, 1, ...) o -1 si es ruido
+    eps: distancia en grados (euclidiana, como el resto de las predicciones)
+    tesela: lado de las teselas en grados (Config.DBSCAN_TESELA)
+    procesos: procesos para las teselas (1 = en este proceso; Config.DBSCAN_PROCESOS)
+    """
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lng = np.asarray(longitudes, dtype=np.float64)
+    n = len(lat)
+    etiquetas = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return etiquetas
+
+    if tesela is None:
+        tesela = Config.DBSCAN_TESELA
+    if procesos is None:
+        procesos = Config.DBSCAN_PROCESOS or os.cpu_count() or 1
+
+    lado = eps / math.sqrt(2)
+    filas = np.floor(lat / lado).astype(np.int64)
+    cols = np.floor(lng / lado).astype(np.int64)
+
+    # Teselas de k x k celdas; el borde puede ocupar más de una tesela vecina
+    k = max(1, int(round(tesela / lado)))
+    alcance = -(-_BORDE // k)
+    por_tesela = _agrupar_celdas(filas // k, cols // k)
+
+    tareas = []
+    for (tf, tc), propios in por_tesela.items():
+        bloques = [por_tesela[t] for t in (
+            (tf + i, tc + j) for i in range(-alcance, alcance + 1) for j in range(-alcance, alcance + 1)
+        ) if t in por_tesela]
+        puntos = np.sort(np.concatenate(bloques))
+        f0, c0 = tf * k, tc * k
+        f1, c1 = f0 + k, c0 + k
+        puntos = puntos[
+            (filas[puntos] >= f0 - _BORDE) & (filas[puntos] < f1 + _BORDE)
+            & (cols[puntos] >= c0 - _BORDE) & (cols[puntos] < c1 + _BORDE)
+        ]
+        tareas.append((
+            puntos, lat[puntos], lng[puntos], filas[puntos], cols[puntos],
+            (f0, f1, c0, c1), eps, min_puntos
+        ))
+
+    resultados = None
+    if procesos > 1 and len(tareas) > 1 and n >= Config.DBSCAN_MIN_PARALELO:
+        try:
+            resultados = list(_ejecutor(procesos).map(_dbscan_tesela, tareas))
+        except (BrokenProcessPool, OSError) as e:
+            print(f" Pool de DBSCAN no disponible, se procesa en este proceso: {e}")
+            _descartar_ejecutor()
+    if resultados is None:
+        resultados = map(_dbscan_tesela, tareas)
+
+    # Union-find de las componentes de todas las teselas
+    padre = {}
+
+    def raiz(celda):
+        padre.setdefault(celda, celda)
+        while padre[celda] != celda:
+            padre[celda] = padre[padre[celda]]
+            celda = padre[celda]
+        return celda
+
+    for propios, locales, enlaces in resultados:
+        etiquetas[propios] = locales
+        for celda, rep in enlaces.tolist():
+            ra, rb = raiz(celda), raiz(rep)
+            if ra != rb:
+                padre[max(ra, rb)] = min(ra, rb)
+
+    # Etiquetas finales numeradas desde 0
+    agrupados = etiquetas >= 0
+    if agrupados.any():
+        componentes, inversa = np.unique(etiquetas[agrupados], return_inverse=True)
+        raices = np.array([raiz(c) for c in componentes.tolist()], dtype=np.int64)
+        _, etiquetas[agrupados] = np.unique(raices[inversa], return_inverse=True)
+    return etiquetas
+
+
+def clusters_dbscan(etiquetas):
+    """Índices de cada cluster, de más grande a más chico (empates por primer índice)"""
+    agrupados = np.flatnonzero(etiquetas >= 0)
+    if not agrupados.size:
+        return []
+    orden = agrupados[np.argsort(etiquetas[agrupados], kind='stable')]
+    cortes = np.flatnonzero(np.diff(etiquetas[orden])) + 1
+    clusters = np.split(orden, cortes)
+    return sorted(clusters, key=lambda c: (-len(c), c[0]))
+
+
+def _dbscan_referencia(latitudes, longitudes, eps, min_puntos):
+    """
+    DBSCAN O(n²) directo sobre los puntos (mismo criterio para los puntos de borde)
+    Solo se usa para verificar dbscan
+    """
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lng = np.asarray(longitudes, dtype=np.float64)
+    n = len(lat)
+    todos = np.arange(n)
+    vecinos = [np.flatnonzero(_cerca(lat, lng, np.array([i]), todos, eps * eps)[0]) for i in range(n)]
+    nucleo = np.array([len(v) >= min_puntos for v in vecinos], dtype=bool)
+
+    etiquetas = np.full(n, -1, dtype=np.int64)
+    actual = 0
+    for i in range(n):
+        if not nucleo[i] or etiquetas[i] >= 0:
+            continue
+        etiquetas[i] = actual
+        pendientes = [i]
+        while pendientes:
+            j = pendientes.pop()
+            for v in vecinos[j].tolist():
+                if nucleo[v] and etiquetas[v] < 0:
+                    etiquetas[v] = actual
+                    pendientes.append(v)
+        actual += 1
+    for i in range(n):
+        if not nucleo[i]:
+            cercanos = vecinos[i][nucleo[vecinos[i]]]
+            if cercanos.size:
+                etiquetas[i] = etiquetas[cercanos.min()]
+    return etiquetas
+
+
+def verificar_dbscan(latitudes, longitudes, eps, min_puntos, tesela=None):
+    """
+    Compara dbscan (partido en teselas) contra la implementación directa
+    Devuelve True si forman exactamente los mismos clusters
+    """
+    obtenido = clusters_dbscan(dbscan(latitudes, longitudes, eps, min_puntos, tesela=tesela, procesos=1))
+    esperado = clusters_dbscan(_dbscan_referencia(latitudes, longitudes, eps, min_puntos))
+    return [c.tolist() for c in obtenido] == [c.tolist() for c in esperado]
@@ -0,0 +1,170 @@
+import bisect
+import threading
+from datetime import datetime, timedelta
+from collections import Counter
+from indice_espacial import GrillaEspacial
+
+# ESTADO ANALÍTICO INCREMENTAL
+
+class EstadoAnalitico:
+    """
+    Conteos que usan las predicciones, mantenidos reporte a reporte
+    en vez de recalcularlos sobre todo el historial:
+    - horas (0-23) y días de la semana (0=Lunes) de fecha_incidente
+    - cantidad por tipo de robo
+    - fechas de creación de los últimos 14 días (ventanas de 7 y 14 días)
+    - pertenencia de cada reporte a una zona de riesgo (clustering voraz)
+
+    Las zonas son las del clustering voraz de calcular_zonas_riesgo sobre el
+    snapshot, en el mismo orden (del reporte más nuevo al más antiguo). Un reporte
+    nuevo es el primero de ese orden y se lleva a todos sus vecinos, así que solo
+    se agrega sin rearmar si no tiene ningún reporte a menos de `radio` (queda
+    solo y no cambia las demás zonas). Quitar un miembro tampoco afecta al resto.
+    En los demás casos las zonas se rearman al siguiente uso, sin leer la tabla.
+    """
+
+    def __init__(self, radio=0.01):
+        self.radio = radio
+        self._lock = threading.RLock()
+        self.horas = [0] * 24
+        self.dias = [0] * 7
+        self.tipos = Counter()
+        self._recientes = []           # (fecha_creacion, id) ordenados, últimos 14 días
+        self._reportes = {}            # id -> (orden, lat, lng, tipo, semilla)
+        self._zonas = {}               # semilla -> [ids en orden]
+        self._puntos = GrillaEspacial(radio)
+        self._zonas_sucias = False
+
+    @classmethod
+    def desde_reportes(cls, reportes, radio=0.01):
+        """Construcción completa (arranque en frío) a partir de filas de reportes"""
+        estado = cls(radio)
+        with estado._lock:
+            for r in reportes:
+                estado._sumar_conteos(r, 1)
+                lat, lng = float(r['latitud']), float(r['longitud'])
+                estado._reportes[r['id']] = ((r['fecha_creacion'], r['id']), lat, lng, r['tipo_robo'], None)
+                estado._puntos.agregar(r['id'], lat, lng)
+            estado._rearmar_zonas()
+        return estado
+
+    def __len__(self):
+        return len(self._reportes)
+
+    # Actualizaciones
+
+    def agregar(self, reporte):
+        """Suma un reporte nuevo; agregar dos veces el mismo id no lo duplica"""
+        with self._lock:
+            if reporte['id'] in self._reportes:
+                return
+            self._sumar_conteos(reporte, 1)
+
+            orden = (reporte['fecha_creacion'], reporte['id'])
+            lat = float(reporte['latitud'])
+            lng = float(reporte['longitud'])
+            aislado = not self._puntos.vecinos(lat, lng, self.radio)
+            self._puntos.agregar(reporte['id'], lat, lng)
+            if self._zonas_sucias or not aislado:
+                self._reportes[reporte['id']] = (orden, lat, lng, reporte['tipo_robo'], None)
+                self._zonas_sucias = True
+                return
+
+            self._zonas[reporte['id']] = [reporte['id']]
+            self._reportes[reporte['id']] = (orden, lat, lng, reporte['tipo_robo'], reporte['id'])
+
+    def eliminar(self, reporte):
+        """Resta un reporte eliminado; devuelve False si no estaba"""
+        with self._lock:
+            datos = self._reportes.pop(reporte['id'], None)
+            if datos is None:
+                return False
+            self._sumar_conteos(reporte, -1)
+            self._puntos.eliminar(reporte['id'])
+
+            semilla = datos[4]
+            if self._zonas_sucias or semilla is None:
+                return True
+            if semilla != reporte['id']:
+                self._zonas[semilla].remove(reporte['id'])
+            elif len(self._zonas[semilla]) == 1:
+                del self._zonas[semilla]
+            else:
+                self._zonas_sucias = True
+            return True
+
+    def _sumar_conteos(self, reporte, signo):
+        fecha = reporte['fecha_incidente']
+        self.horas[fecha.hour] += signo
+        self.dias[fecha.weekday()] += signo
+        self.tipos[reporte['tipo_robo']] += signo
+        if self.tipos[reporte['tipo_robo']] <= 0:
+            del self.tipos[reporte['tipo_robo']]
+
+        clave = (reporte['fecha_creacion'], reporte['id'])
+        if clave[0] < datetime.now() - timedelta(days=14):
+            return
+        if signo > 0:
+            bisect.insort(self._recientes, clave)
+        else:
+            i = bisect.bisect_left(self._recientes, clave)
+            if i < len(self._recientes) and self._recientes[i] == clave:
+                del self._recientes[i]
+
+    # Consultas
+
+    def resumen(self, ahora=None):
+        """Mismo diccionario que predicciones.resumir_snapshot, sin recorrer los reportes"""
+        if ahora is None:
+            ahora = datetime.now()
+        with self._lock:
+            # Lo que ya quedó fuera de la ventana de 14 días no vuelve a entrar
+            viejos = bisect.bisect_left(self._recientes, (datetime.now() - timedelta(days=14),))
+            del self._recientes[:viejos]
+
+            desde_14 = bisect.bisect_left(self._recientes, (ahora - timedelta(days=14),))
+            desde_7 = bisect.bisect_left(self._recientes, (ahora - timedelta(days=7),))
+            return {
+                'horas': {h: c for h, c in enumerate(self.horas) if c},
+                'dias': {d: c for d, c in enumerate(self.dias) if c},
+                'tipos': Counter(self.tipos),
+                'semana_actual': len(self._recientes) - desde_7,
+                'semana_anterior': desde_7 - desde_14,
+                'total': len(self._reportes)
+            }
+
+    def zonas(self, minimo=2):
+        """
+        Zonas con al menos `minimo` reportes, en el orden de su semilla
+        Cada zona es la lista de (lat, lng, tipo) de sus reportes en orden.
+        """
+        with self._lock:
+            if self._zonas_sucias:
+                self._rearmar_zonas()
+            return [
+                [self._reportes[i][1:4] for i in miembros]
+                for miembros in self._zonas.values()
+                if len(miembros) >= minimo
+            ]
+
+    def _rearmar_zonas(self):
+        """Clustering voraz completo en el orden del snapshot (más nuevo primero)"""
+        ordenados = sorted(self._reportes.items(), key=lambda item: item[1][0], reverse=True)
+        libres = GrillaEspacial(self.radio)
+        for reporte_id, (orden, lat, lng, tipo, _) in ordenados:
+            libres.agregar(reporte_id, lat, lng)
+
+        self._zonas = {}
+        for reporte_id, (orden, lat, lng, tipo, _) in ordenados:
+            if not libres.eliminar(reporte_id):
+                continue
+            cercanos = sorted(
+                libres.vecinos(lat, lng, self.radio), key=lambda i: self._reportes[i][0], reverse=True
+            )
+            for j in cercanos:
+                libres.eliminar(j)
+            self._zonas[reporte_id] = [reporte_id] + cercanos
+            for j in [reporte_id] + cercanos:
+                self._reportes[j] = self._reportes[j][:4] + (reporte_id,)
+
+        self._zonas_sucias = False
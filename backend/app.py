@@ -1,478 +1,329 @@
-from flask import Flask, request, jsonify
+import io
+import os
+from flask import Flask, Blueprint, request, jsonify, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from datetime import datetime
+from config import Config, mostrar_configuracion
 import database as db
+import cache
 import predicciones as pred
+import importacion
+import serializacion
+import formatos
+import compresion
+import rutas
+from rutas import ErrorPeticion
 
 # CONFIGURACIÓN DE FLASK
 
-app = Flask(__name__)
-CORS(app)  # Permite que el frontend hable con el backend
+# Las rutas se registran en un blueprint; la app se arma con crear_app()
+# La lectura de parámetros y el armado de las respuestas están en rutas.py
+# (los comparte app_async.py); aquí solo quedan las consultas con psycopg2
+api = Blueprint('api', __name__)
 
-@app.route('/')
+# FUNCIONES AUXILIARES
+
+def responder(cuerpo, estado):
+    """(cuerpo, estado) de rutas.py como respuesta JSON"""
+    return jsonify(cuerpo), estado
+
+def responder_cacheado(nombre, params, calcular, ttl):
+    """
+    Responde con el resultado guardado en la caché de resultados
+    Incluye un ETag; si el cliente manda If-None-Match con el mismo valor se responde 304
+    Si calcular() devuelve None (falló la base de datos) se responde 503 sin guardar nada
+    """
+    cuerpo, etag = cache.resultados.obtener(nombre, params, calcular, ttl)
+    if cuerpo is None:
+        raise ErrorPeticion(rutas.SIN_BASE_DE_DATOS, 503)
+    
+    if request.if_none_match.contains_weak(etag):
+        respuesta = Response(status=304)
+    else:
+        respuesta = jsonify(cuerpo)
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+@api.route('/')
 def home():
     """Página de inicio - Documentación de la API"""
-    return jsonify({
-        'mensaje': 'API de Sistema de Reportes de Robos',
-        'version': '1.0',
-        'estado': 'activo',
-        'endpoints': {
-            'GET /': 'Documentación de la API',
-            'GET /api/reportes': 'Obtener todos los reportes',
-            'POST /api/reportes': 'Crear un nuevo reporte',
-            'GET /api/reportes/<id>': 'Obtener un reporte específico',
-            'DELETE /api/reportes/<id>': 'Eliminar un reporte',
-            'GET /api/reportes-con-usuarios': 'Obtener reportes con info de usuarios',
-            'GET /api/usuarios': 'Obtener todos los usuarios',
-            'POST /api/usuarios': 'Crear un nuevo usuario',
-            'GET /api/usuarios/<id>': 'Obtener un usuario específico',
-            'GET /api/usuarios/<id>/reportes': 'Obtener reportes de un usuario',
-            'GET /api/estadisticas': 'Obtener estadísticas generales'
-        }
-    })
+    return jsonify(rutas.inicio())
 
 # RUTAS PARA REPORTES
-@app.route('/api/reportes', methods=['GET'])
+@api.route('/api/reportes', methods=['GET'])
 def obtener_reportes():
-    """Obtener todos los reportes"""
-    try:
-        reportes = db.obtener_todos_reportes()
-        
-        # Convertir a formato JSON
-        reportes_json = []
-        for reporte in reportes:
-            reporte_dict = dict(reporte)
-            reporte_dict['latitud'] = float(reporte_dict['latitud'])
-            reporte_dict['longitud'] = float(reporte_dict['longitud'])
-            reporte_dict['fecha_incidente'] = reporte_dict['fecha_incidente'].isoformat()
-            reporte_dict['fecha_creacion'] = reporte_dict['fecha_creacion'].isoformat()
-            reportes_json.append(reporte_dict)
-        
-        return jsonify({
-            'success': True,
-            'data': reportes_json,
-            'total': len(reportes_json)
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    """
+    Obtener reportes paginados (keyset sobre fecha_creacion, id)
+    Parámetros: limit (máximo Config.MAX_RESULTS_PER_PAGE) y cursor (de la página anterior)
+    Filtros: bbox, desde, hasta, tipo_robo; con_usuarios=1 agrega el nombre del usuario
+    Con formato=ndjson se transmiten todos los reportes, uno por línea
+    Con Accept de formatos.FORMATOS_COMPACTOS se responde por columnas (ver formatos.py)
+    """
+    if request.args.get('formato') == 'ndjson':
+        return transmitir_reportes_ndjson()
+    
+    formato = formatos.elegir_formato(request.accept_mimetypes)
+    reportes, siguiente = db.obtener_reportes_pagina(**rutas.leer_pagina_reportes(request.args, formato))
+    
+    cuerpo = rutas.pagina_reportes(formato, reportes, siguiente)
+    respuesta = Response(cuerpo, mimetype=formato) if isinstance(cuerpo, bytes) else jsonify(cuerpo)
+    respuesta.vary.add('Accept')
+    return respuesta, 200
 
-@app.route('/api/reportes', methods=['POST'])
+def transmitir_reportes_ndjson():
+    """Transmite todos los reportes como NDJSON usando un cursor del lado del servidor"""
+    lineas = serializacion.lineas_ndjson(db.iterar_reportes())
+    return Response(stream_with_context(lineas), mimetype='application/x-ndjson')
+
+@api.route('/api/reportes/clusters', methods=['GET'])
+def obtener_clusters():
+    """Reportes agrupados para el mapa (zoom y bbox)"""
+    return responder(*rutas.clusters(request.args))
+
+@api.route('/api/reportes/cercanos', methods=['GET'])
+def obtener_reportes_cercanos():
+    """Reportes más cercanos a un punto (latitud, longitud, cantidad)"""
+    return responder(*rutas.reportes_cercanos(request.args))
+
+@api.route('/api/reportes/cambios', methods=['GET'])
+def obtener_cambios_reportes():
+    """
+    Sincronización incremental: reportes creados y ids eliminados desde una versión
+    Parámetros: version (la de la respuesta anterior) o fecha (ISO 8601)
+    Con recargar=true el cliente debe cargar todo de nuevo y seguir desde version
+    """
+    version, fecha = rutas.leer_cambios(request.args)
+    return responder(*rutas.respuesta_cambios(db.obtener_cambios_reportes(version, fecha)))
+
+@api.route('/api/reportes', methods=['POST'])
 def crear_reporte():
     """Crear un nuevo reporte"""
-    try:
-        datos = request.get_json()
-        
-        # Validar datos requeridos
-        campos_requeridos = ['usuario_id', 'tipo_robo', 'descripcion', 'latitud', 'longitud', 'fecha_incidente']
-        for campo in campos_requeridos:
-            if campo not in datos:
-                return jsonify({
-                    'success': False,
-                    'error': f'Falta el campo requerido: {campo}'
-                }), 400
-        
-        # Crear el reporte
-        nuevo_reporte = db.crear_reporte(
-            usuario_id=int(datos['usuario_id']),
-            tipo_robo=datos['tipo_robo'],
-            descripcion=datos['descripcion'],
-            latitud=float(datos['latitud']),
-            longitud=float(datos['longitud']),
-            fecha_incidente=datos['fecha_incidente'],
-            barrio=datos.get('barrio')
-        )
-        
-        if nuevo_reporte:
-            # Convertir para JSON
-            reporte_dict = dict(nuevo_reporte)
-            reporte_dict['latitud'] = float(reporte_dict['latitud'])
-            reporte_dict['longitud'] = float(reporte_dict['longitud'])
-            reporte_dict['fecha_incidente'] = reporte_dict['fecha_incidente'].isoformat()
-            reporte_dict['fecha_creacion'] = reporte_dict['fecha_creacion'].isoformat()
-            
-            return jsonify({
-                'success': True,
-                'data': reporte_dict,
-                'mensaje': 'Reporte creado exitosamente'
-            }), 201
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'No se pudo crear el reporte'
-            }), 500
-            
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    reporte = rutas.leer_reporte_nuevo(request.get_json())
+    return responder(*rutas.respuesta_reporte_creado(db.crear_reporte(**reporte)))
+
+@api.route('/api/reportes/importar', methods=['POST'])
+def importar_reportes():
+    """
+    Importación masiva de reportes (CSV o NDJSON en el cuerpo de la petición)
+    El formato se toma de ?formato=csv|ndjson o del Content-Type.
+    El archivo se valida mientras se lee y se inserta por lotes.
+    """
+    formato = rutas.leer_formato_importacion(request.args, request.content_type)
+    archivo = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+    return responder(*rutas.respuesta_importacion(importacion.importar_reportes(archivo, formato)))
 
-@app.route('/api/reportes/<int:reporte_id>', methods=['GET'])
+@api.route('/api/reportes/<int:reporte_id>', methods=['GET'])
 def obtener_reporte(reporte_id):
     """Obtener un reporte específico"""
-    try:
-        reporte = db.obtener_reporte_por_id(reporte_id)
-        
-        if reporte:
-            reporte_dict = dict(reporte)
-            reporte_dict['latitud'] = float(reporte_dict['latitud'])
-            reporte_dict['longitud'] = float(reporte_dict['longitud'])
-            reporte_dict['fecha_incidente'] = reporte_dict['fecha_incidente'].isoformat()
-            reporte_dict['fecha_creacion'] = reporte_dict['fecha_creacion'].isoformat()
-            
-            return jsonify({
-                'success': True,
-                'data': reporte_dict
-            }), 200
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Reporte no encontrado'
-            }), 404
-            
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return responder(*rutas.encontrado(db.obtener_reporte_por_id(reporte_id), 'Reporte no encontrado'))
 
-@app.route('/api/reportes/<int:reporte_id>', methods=['DELETE'])
+@api.route('/api/reportes/<int:reporte_id>', methods=['DELETE'])
 def eliminar_reporte(reporte_id):
     """Eliminar un reporte"""
-    try:
-        eliminado = db.eliminar_reporte(reporte_id)
-        
-        if eliminado:
-            return jsonify({
-                'success': True,
-                'mensaje': f'Reporte {reporte_id} eliminado exitosamente'
-            }), 200
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Reporte no encontrado'
-            }), 404
-            
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return responder(*rutas.respuesta_reporte_eliminado(db.eliminar_reporte(reporte_id), reporte_id))
 
-@app.route('/api/reportes-con-usuarios', methods=['GET'])
+@api.route('/api/reportes-con-usuarios', methods=['GET'])
 def obtener_reportes_con_info_usuarios():
     """Obtener reportes con información completa de usuarios"""
-    try:
-        reportes = db.obtener_reportes_con_usuarios()
-        
-        reportes_json = []
-        for reporte in reportes:
-            reporte_dict = dict(reporte)
-            reporte_dict['latitud'] = float(reporte_dict['latitud'])
-            reporte_dict['longitud'] = float(reporte_dict['longitud'])
-            reporte_dict['fecha_incidente'] = reporte_dict['fecha_incidente'].isoformat()
-            reporte_dict['fecha_creacion'] = reporte_dict['fecha_creacion'].isoformat()
-            reportes_json.append(reporte_dict)
-        
-        return jsonify({
-            'success': True,
-            'data': reportes_json,
-            'total': len(reportes_json)
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return responder(*rutas.lista(db.obtener_reportes_con_usuarios()))
 
 # RUTAS PARA USUARIOS
 
-@app.route('/api/usuarios', methods=['GET'])
+@api.route('/api/usuarios', methods=['GET'])
 def obtener_usuarios():
     """Obtener todos los usuarios"""
-    try:
-        usuarios = db.obtener_todos_usuarios()
-        
-        usuarios_json = []
-        for usuario in usuarios:
-            usuario_dict = dict(usuario)
-            usuario_dict['fecha_registro'] = usuario_dict['fecha_registro'].isoformat()
-            usuarios_json.append(usuario_dict)
-        
-        return jsonify({
-            'success': True,
-            'data': usuarios_json,
-            'total': len(usuarios_json)
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return responder(*rutas.lista(db.obtener_todos_usuarios()))
 
-@app.route('/api/usuarios', methods=['POST'])
+@api.route('/api/usuarios', methods=['POST'])
 def crear_nuevo_usuario():
     """Crear un nuevo usuario"""
-    try:
-        datos = request.get_json()
-        
-        # Validar campos requeridos
-        if not datos.get('nombre') or not datos.get('email'):
-            return jsonify({
-                'success': False,
-                'error': 'Nombre y email son requeridos'
-            }), 400
-        
-        # Por ahora usamos un hash simple (en producción usar bcrypt)
-        password = datos.get('password', 'password123')
-        password_hash = f"hash_{password}"
-        
-        nuevo_usuario = db.crear_usuario(
-            nombre=datos['nombre'],
-            email=datos['email'],
-            telefono=datos.get('telefono'),
-            password_hash=password_hash
-        )
-        
-        if nuevo_usuario:
-            usuario_dict = dict(nuevo_usuario)
-            usuario_dict['fecha_registro'] = usuario_dict['fecha_registro'].isoformat()
-            # No devolver el password_hash
-            del usuario_dict['password_hash']
-            
-            return jsonify({
-                'success': True,
-                'data': usuario_dict,
-                'mensaje': 'Usuario creado exitosamente'
-            }), 201
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'No se pudo crear el usuario. Es posible que el email ya esté registrado.'
-            }), 400
-            
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    usuario = rutas.leer_usuario_nuevo(request.get_json())
+    return responder(*rutas.respuesta_usuario_creado(db.crear_usuario(**usuario)))
 
-@app.route('/api/usuarios/<int:usuario_id>', methods=['GET'])
+@api.route('/api/usuarios/<int:usuario_id>', methods=['GET'])
 def obtener_usuario(usuario_id):
     """Obtener un usuario específico"""
-    try:
-        usuario = db.obtener_usuario_por_id(usuario_id)
-        
-        if usuario:
-            usuario_dict = dict(usuario)
-            usuario_dict['fecha_registro'] = usuario_dict['fecha_registro'].isoformat()
-            
-            return jsonify({
-                'success': True,
-                'data': usuario_dict
-            }), 200
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Usuario no encontrado'
-            }), 404
-            
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return responder(*rutas.encontrado(db.obtener_usuario_por_id(usuario_id), 'Usuario no encontrado'))
 
-@app.route('/api/usuarios/<int:usuario_id>/reportes', methods=['GET'])
+@api.route('/api/usuarios/<int:usuario_id>/reportes', methods=['GET'])
 def obtener_reportes_usuario(usuario_id):
     """Obtener todos los reportes de un usuario específico"""
-    try:
-        reportes = db.obtener_reportes_por_usuario(usuario_id)
-        
-        reportes_json = []
-        for reporte in reportes:
-            reporte_dict = dict(reporte)
-            reporte_dict['latitud'] = float(reporte_dict['latitud'])
-            reporte_dict['longitud'] = float(reporte_dict['longitud'])
-            reporte_dict['fecha_incidente'] = reporte_dict['fecha_incidente'].isoformat()
-            reporte_dict['fecha_creacion'] = reporte_dict['fecha_creacion'].isoformat()
-            reportes_json.append(reporte_dict)
-        
-        return jsonify({
-            'success': True,
-            'data': reportes_json,
-            'total': len(reportes_json)
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return responder(*rutas.lista(db.obtener_reportes_por_usuario(usuario_id)))
 
-@app.route('/api/usuarios/<int:usuario_id>', methods=['PUT'])
+@api.route('/api/usuarios/<int:usuario_id>', methods=['PUT'])
 def actualizar_usuario(usuario_id):
     """Actualizar información de un usuario"""
-    try:
-        datos = request.get_json()
-        
-        usuario_actualizado = db.actualizar_usuario(
-            usuario_id=usuario_id,
-            nombre=datos.get('nombre'),
-            telefono=datos.get('telefono')
-        )
-        
-        if usuario_actualizado:
-            usuario_dict = dict(usuario_actualizado)
-            usuario_dict['fecha_registro'] = usuario_dict['fecha_registro'].isoformat()
-            del usuario_dict['password_hash']
-            
-            return jsonify({
-                'success': True,
-                'data': usuario_dict,
-                'mensaje': 'Usuario actualizado exitosamente'
-            }), 200
-        else:
-            return jsonify({
-                'success': False,
-                'error': 'Usuario no encontrado o no se pudo actualizar'
-            }), 404
-            
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    cambios = rutas.leer_usuario_actualizado(request.get_json())
+    return responder(*rutas.respuesta_usuario_actualizado(db.actualizar_usuario(usuario_id=usuario_id, **cambios)))
 
 # RUTAS PARA ESTADÍSTICAS
 
-@app.route('/api/estadisticas', methods=['GET'])
+@api.route('/api/estadisticas', methods=['GET'])
 def obtener_estadisticas():
     """Obtener estadísticas generales del sistema"""
-    try:
-        stats = db.obtener_estadisticas()
-        
-        # Convertir por_tipo a formato JSON serializable
-        if 'por_tipo' in stats:
-            stats['por_tipo'] = [dict(item) for item in stats['por_tipo']]
-        
-        # Convertir usuario_mas_activo
-        if stats.get('usuario_mas_activo'):
-            stats['usuario_mas_activo'] = dict(stats['usuario_mas_activo'])
-        
-        return jsonify({
-            'success': True,
-            'data': stats
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    def calcular():
+        return rutas.cuerpo_estadisticas(db.obtener_estadisticas())
+    
+    return responder_cacheado('estadisticas', {}, calcular, Config.CACHE_TTL_ESTADISTICAS)
+
+# RUTAS DEL SISTEMA
+
+@api.route('/api/sistema/cache', methods=['GET'])
+def estado_cache():
+    """Estadísticas de las cachés de resultados y de teselas"""
+    return responder(*rutas.estado_cache())
+
+@api.route('/api/sistema/pool', methods=['GET'])
+def estado_pool():
+    """Estadísticas del pool de conexiones (en uso, esperando, tiempos de espera)"""
+    return responder(*rutas.exito(db.obtener_estadisticas_pool()))
 
 # MANEJO DE ERRORES
 
-@app.errorhandler(404)
+@api.app_errorhandler(ErrorPeticion)
+def error_peticion(error):
+    """Errores de validación o de datos que las rutas responden con su propio código"""
+    return jsonify(rutas.cuerpo_error(str(error))), error.estado
+
+@api.app_errorhandler(Exception)
+def error_inesperado(error):
+    """Cualquier otra excepción de una ruta: 500 con el mensaje"""
+    if isinstance(error, HTTPException):
+        return error
+    return jsonify(rutas.cuerpo_error(str(error))), 500
+
+@api.app_errorhandler(404)
 def not_found(error):
     """Manejo de rutas no encontradas"""
-    return jsonify({
-        'success': False,
-        'error': 'Ruta no encontrada'
-    }), 404
+    return jsonify(rutas.cuerpo_error('Ruta no encontrada')), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     """Manejo de errores internos del servidor"""
-    return jsonify({
-        'success': False,
-        'error': 'Error interno del servidor'
-    }), 500
+    return jsonify(rutas.cuerpo_error('Error interno del servidor')), 500
     
-@app.route('/api/predicciones', methods=['GET'])
+@api.route('/api/predicciones', methods=['GET'])
 def obtener_predicciones():
     """Obtener todas las predicciones"""
-    try:
-        predicciones = pred.generar_reporte_completo()
-        
-        return jsonify({
-            'success': True,
-            'data': predicciones
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    return responder_cacheado('predicciones', {}, rutas.cuerpo_predicciones, Config.CACHE_TTL_PREDICCIONES)
 
-@app.route('/api/predicciones/zonas-riesgo', methods=['GET'])
+@api.route('/api/predicciones/zonas-riesgo', methods=['GET'])
 def obtener_zonas_riesgo():
-    """Obtener solo zonas de riesgo"""
-    try:
-        zonas = pred.calcular_zonas_riesgo()
-        
-        return jsonify({
-            'success': True,
-            'data': zonas,
-            'total': len(zonas)
-        }), 200
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    """Obtener solo zonas de riesgo (parámetro opcional radio, en grados)"""
+    radio = rutas.leer_radio_zonas(request.args)
+    
+    def calcular():
+        return rutas.cuerpo_zonas_riesgo(radio)
+    
+    return responder_cacheado('zonas-riesgo', {'radio': radio}, calcular, Config.CACHE_TTL_PREDICCIONES)
 
-@app.route('/api/predicciones/ubicacion', methods=['POST'])
+@api.route('/api/predicciones/heatmap/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def obtener_tesela_calor(z, x, y):
+    """Tesela PNG (256x256) del mapa de calor de robos"""
+    respuesta = Response(rutas.tesela_calor(z, x, y), mimetype='image/png')
+    respuesta.headers['Cache-Control'] = 'public, max-age=60'
+    return respuesta
+
+@api.route('/api/predicciones/ubicacion', methods=['POST'])
 def predecir_ubicacion():
     """Predecir riesgo de una ubicación específica"""
+    return responder(*rutas.predecir_ubicacion(request.get_json()))
+
+@api.route('/api/predicciones/ubicaciones', methods=['POST'])
+def predecir_ubicaciones():
+    """Predecir riesgo de muchas ubicaciones (lista de puntos o una ruta)"""
+    return responder(*rutas.predecir_ubicaciones(request.get_json()))
+
+
+# CREAR LA APLICACIÓN
+
+class ProveedorJSON(DefaultJSONProvider):
+    """jsonify con serializacion.dumps: las filas de la base de datos se pasan sin convertir"""
+    
+    def dumps(self, obj, **kwargs):
+        return serializacion.dumps(obj).decode()
+
+@api.after_app_request
+def comprimir_respuesta(respuesta):
+    """Comprime con brotli o gzip las respuestas grandes si el cliente lo acepta"""
+    codificacion = compresion.elegir_codificacion(request.accept_encodings)
+    if (codificacion is None or respuesta.status_code != 200
+            or respuesta.direct_passthrough or respuesta.is_streamed
+            or 'Content-Encoding' in respuesta.headers):
+        return respuesta
+    
+    datos = respuesta.get_data()
+    if not compresion.comprimible(respuesta.mimetype, len(datos)):
+        return respuesta
+    
+    datos = compresion.comprimir(datos, codificacion)
+    respuesta.set_data(datos)
+    compresion.preparar_encabezados(respuesta, codificacion, len(datos))
+    return respuesta
+
+def crear_app(iniciar=True):
+    """
+    Crea la aplicación Flask (la usan wsgi.py en producción y app.py en desarrollo)
+    Cada proceso que la crea tiene su propio pool de conexiones y sus cachés.
+    iniciar: False no escucha avisos ni precalienta (el proceso que no atiende
+    peticiones, como el vigilante del recargador de Flask)
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = Config.SECRET_KEY
+    app.json = ProveedorJSON(app)
+    CORS(app, origins=Config.CORS_ORIGINS)  # Permite que el frontend hable con el backend
+    app.register_blueprint(api)
+    if not iniciar:
+        return app
+    
+    # Avisos de los reportes que crean o eliminan otros workers
+    db.iniciar_escucha_cambios()
+    
+    if Config.PRECALENTAR:
+        precalentar(app)
+    return app
+
+def precalentar(app):
+    """
+    Abre el pool y carga los índices, el estado analítico y las respuestas
+    cacheadas más pedidas antes de atender la primera petición
+    """
+    inicio = datetime.now()
     try:
-        datos = request.get_json()
-        
-        if 'latitud' not in datos or 'longitud' not in datos:
-            return jsonify({
-                'success': False,
-                'error': 'Se requieren latitud y longitud'
-            }), 400
-        
-        prediccion = pred.predecir_riesgo_ubicacion(
-            float(datos['latitud']),
-            float(datos['longitud'])
-        )
-        
-        return jsonify({
-            'success': True,
-            'data': prediccion
-        }), 200
+        db.obtener_pool()
+        pred.obtener_indice_ubicaciones()
+        pred.obtener_estado_analitico()
+        with app.test_client() as cliente:
+            for ruta in ('/api/estadisticas', '/api/predicciones'):
+                cliente.get(ruta)
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
-
+        # Sin base de datos el servidor arranca igual; todo se carga en la primera petición
+        print(f" No se pudo precalentar: {e}")
+        return
+    print(f" Precalentado en {(datetime.now() - inicio).total_seconds():.2f} s")
 
-# INICIAR SERVIDOR=
+# INICIAR SERVIDOR (DESARROLLO)
 
 if __name__ == '__main__':
+    mostrar_configuracion()
     print('=' * 50)
-    print('Iniciando servidor Flask...')
+    print('Iniciando servidor Flask (desarrollo)...')
     print('=' * 50)
-    print('Servidor corriendo en: http://localhost:5000')
-    print('Documentación API: http://localhost:5000/')
+    print(f'Servidor corriendo en: http://localhost:{Config.SERVIDOR_PUERTO}')
+    print(f'Documentación API: http://localhost:{Config.SERVIDOR_PUERTO}/')
+    print('Para producción: gunicorn -c gunicorn.conf.py wsgi:app')
     print('=' * 50)
     print('Rutas disponibles:')
-    print('   GET  /api/reportes')
-    print('   POST /api/reportes')
-    print('   GET  /api/reportes/<id>')
-    print('   DELETE /api/reportes/<id>')
-    print('   GET  /api/reportes-con-usuarios')
-    print('   GET  /api/usuarios')
-    print('   POST /api/usuarios')
-    print('   GET  /api/usuarios/<id>')
-    print('   PUT  /api/usuarios/<id>')
-    print('   GET  /api/usuarios/<id>/reportes')
-    print('   GET  /api/estadisticas')
+    for ruta in rutas.RUTAS_API:
+        print(f'   {ruta}')
     print(' Presiona Ctrl+C para detener el servidor')
     print('=' * 50)
     
-    app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
+    # Con debug el recargador de Flask deja un proceso padre que solo vigila los
+    # archivos y atiende en un hijo (WERKZEUG_RUN_MAIN=true): solo el hijo
+    # escucha avisos y precalienta
+    atiende = not Config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+    crear_app(iniciar=atiende).run(debug=Config.DEBUG, port=Config.SERVIDOR_PUERTO, host=Config.SERVIDOR_HOST)
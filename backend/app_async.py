@@ -0,0 +1,415 @@
+import asyncio
+import io
+from quart import Quart, request, jsonify, Response
+from quart.json.provider import DefaultJSONProvider
+from quart.wrappers.response import DataBody
+from werkzeug.exceptions import HTTPException
+from config import Config, mostrar_configuracion
+import database_async as adb
+import database as db
+import cache
+import predicciones as pred
+import importacion
+import serializacion
+import formatos
+import eventos
+import compresion
+import rutas
+from rutas import ErrorPeticion
+
+# SERVIDOR ASÍNCRONO (QUART + ASYNCPG)
+#
+# Mismas rutas y mismas respuestas JSON que app.py, pero cada petición espera
+# a PostgreSQL sin bloquear un hilo. Las consultas van por el pool de asyncpg
+# (database_async.py); los cálculos en CPU (predicciones, teselas, importación)
+# reutilizan los módulos síncronos en un hilo aparte. La lectura de parámetros
+# y el armado de las respuestas son los de rutas.py, igual que en app.py.
+#
+# Uso: hypercorn app_async:app --bind 0.0.0.0:5000
+#      (o python app_async.py para desarrollo)
+
+class ProveedorJSON(DefaultJSONProvider):
+    """Igual que app.ProveedorJSON: jsonify con serializacion.dumps"""
+
+    def dumps(self, obj, **kwargs):
+        return serializacion.dumps(obj).decode()
+
+
+app = Quart(__name__)
+app.json = ProveedorJSON(app)
+
+
+canal = eventos.CanalEventos()
+_escucha = None
+
+
+def recibir_aviso(texto):
+    """
+    NOTIFY de cualquier proceso: actualiza este proceso (en el hilo de avisos,
+    fuera del loop) y después lo reparte a los clientes SSE
+    """
+    adb.aplicar_aviso(texto).add_done_callback(_repartir_aviso)
+
+
+def _repartir_aviso(futuro):
+    try:
+        evento, reporte = futuro.result()
+    except (ValueError, KeyError) as e:
+        print(f" Aviso de cambio inválido: {e}")
+        return
+    canal.agregar(evento, reporte)
+
+
+class CuerpoPeticion(io.RawIOBase):
+    """
+    El cuerpo de la petición como archivo binario para leerlo desde un hilo:
+    cada lectura pide el siguiente pedazo al loop (request.body), así el archivo
+    nunca está completo en memoria
+    """
+
+    def __init__(self, cuerpo, loop):
+        self._cuerpo = cuerpo
+        self._loop = loop
+        self._pendiente = b''
+        self._terminado = False
+
+    def readable(self):
+        return True
+
+    async def _siguiente(self):
+        try:
+            return await self._cuerpo.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def readinto(self, destino):
+        while not self._pendiente:
+            if self._terminado:
+                return 0
+            pedazo = asyncio.run_coroutine_threadsafe(self._siguiente(), self._loop).result()
+            if pedazo is None:
+                self._terminado = True
+            else:
+                self._pendiente = pedazo
+        cantidad = min(len(destino), len(self._pendiente))
+        destino[:cantidad] = self._pendiente[:cantidad]
+        self._pendiente = self._pendiente[cantidad:]
+        return cantidad
+
+
+@app.before_serving
+async def abrir_pool():
+    global _escucha
+    await adb.abrir_pool()
+    _escucha = asyncio.create_task(adb.escuchar_cambios(recibir_aviso))
+    if Config.PRECALENTAR:
+        try:
+            await asyncio.to_thread(pred.obtener_indice_ubicaciones)
+            await asyncio.to_thread(pred.obtener_estado_analitico)
+        except Exception as e:
+            # Igual que app.precalentar: sin base de datos se carga en la primera petición
+            print(f" No se pudo precalentar: {e}")
+
+
+@app.after_serving
+async def cerrar_pool():
+    canal.cerrar()
+    if _escucha is not None:
+        _escucha.cancel()
+    await adb.cerrar_pool()
+    await asyncio.to_thread(db.cerrar_pool)
+
+
+@app.after_request
+async def agregar_cors(respuesta):
+    """Equivalente a CORS(app) en app.py"""
+    respuesta.headers['Access-Control-Allow-Origin'] = Config.CORS_ORIGINS
+    respuesta.headers['Access-Control-Allow-Headers'] = 'Content-Type, If-None-Match'
+    respuesta.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+    respuesta.headers['Access-Control-Expose-Headers'] = 'ETag'
+    return respuesta
+
+
+@app.after_request
+async def comprimir_respuesta(respuesta):
+    """Igual que app.comprimir_respuesta; las respuestas transmitidas no se tocan"""
+    codificacion = compresion.elegir_codificacion(request.accept_encodings)
+    if (codificacion is None or respuesta.status_code != 200
+            or not isinstance(respuesta.response, DataBody)
+            or 'Content-Encoding' in respuesta.headers):
+        return respuesta
+
+    datos = await respuesta.get_data()
+    if not compresion.comprimible(respuesta.mimetype, len(datos)):
+        return respuesta
+
+    # Comprimir varios cientos de KB bloquea: se hace en un hilo
+    datos = await asyncio.to_thread(compresion.comprimir, datos, codificacion)
+    respuesta.set_data(datos)
+    compresion.preparar_encabezados(respuesta, codificacion, len(datos))
+    return respuesta
+
+# FUNCIONES AUXILIARES
+
+def responder(cuerpo, estado):
+    """(cuerpo, estado) de rutas.py como respuesta JSON"""
+    return jsonify(cuerpo), estado
+
+async def en_hilo(funcion, *args):
+    """Una ruta de rutas.py que usa los módulos síncronos, en un hilo aparte"""
+    return responder(*await asyncio.to_thread(funcion, *args))
+
+async def responder_cacheado(nombre, params, calcular, ttl):
+    """
+    Igual que app.responder_cacheado; calcular puede ser una corrutina
+    La caché es síncrona, así que se consulta en un hilo y las corrutinas
+    se ejecutan de vuelta en el loop del servidor.
+    """
+    loop = asyncio.get_running_loop()
+
+    def calcular_sync():
+        resultado = calcular()
+        if asyncio.iscoroutine(resultado):
+            return asyncio.run_coroutine_threadsafe(resultado, loop).result()
+        return resultado
+
+    cuerpo, etag = await asyncio.to_thread(cache.resultados.obtener, nombre, params, calcular_sync, ttl)
+    if cuerpo is None:
+        raise ErrorPeticion(rutas.SIN_BASE_DE_DATOS, 503)
+
+    if request.if_none_match.contains_weak(etag):
+        respuesta = Response('', status=304)
+    else:
+        respuesta = jsonify(cuerpo)
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+@app.route('/')
+async def home():
+    """Página de inicio - Documentación de la API"""
+    return jsonify(rutas.inicio(modo='asincrono'))
+
+# EVENTOS EN TIEMPO REAL
+
+@app.route('/api/eventos', methods=['GET'])
+async def transmitir_eventos():
+    """Server-Sent Events con los reportes nuevos/eliminados y las zonas de riesgo (ver eventos.py)"""
+    cola = canal.conectar()
+
+    async def generar():
+        try:
+            yield b'retry: 5000\n\n'
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(cola.get(), Config.EVENTOS_LATIDO)
+                except asyncio.TimeoutError:
+                    # Comentario para que los proxies no cierren la conexión inactiva
+                    mensaje = b': latido\n\n'
+                if mensaje is None:
+                    break
+                yield mensaje
+        finally:
+            canal.desconectar(cola)
+
+    respuesta = Response(generar(), mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    respuesta.timeout = None
+    return respuesta
+
+# RUTAS PARA REPORTES
+
+@app.route('/api/reportes', methods=['GET'])
+async def obtener_reportes():
+    """Reportes paginados (ver app.obtener_reportes)"""
+    if request.args.get('formato') == 'ndjson':
+        return transmitir_reportes_ndjson()
+
+    formato = formatos.elegir_formato(request.accept_mimetypes)
+    reportes, siguiente = await adb.obtener_reportes_pagina(**rutas.leer_pagina_reportes(request.args, formato))
+
+    cuerpo = rutas.pagina_reportes(formato, reportes, siguiente)
+    respuesta = Response(cuerpo, mimetype=formato) if isinstance(cuerpo, bytes) else jsonify(cuerpo)
+    respuesta.vary.add('Accept')
+    return respuesta, 200
+
+def transmitir_reportes_ndjson():
+    async def generar():
+        try:
+            async for reporte in adb.iterar_reportes():
+                yield serializacion.dumps(reporte) + b'\n'
+        except Exception as e:
+            print(f" Error recorriendo reportes: {e}")
+            yield serializacion.linea_error_ndjson(e)
+
+    return Response(generar(), mimetype='application/x-ndjson')
+
+@app.route('/api/reportes/clusters', methods=['GET'])
+async def obtener_clusters():
+    """Reportes agrupados para el mapa (zoom y bbox)"""
+    return await en_hilo(rutas.clusters, request.args)
+
+@app.route('/api/reportes/cercanos', methods=['GET'])
+async def obtener_reportes_cercanos():
+    """Reportes más cercanos a un punto (ver rutas.reportes_cercanos)"""
+    return await en_hilo(rutas.reportes_cercanos, request.args)
+
+@app.route('/api/reportes/cambios', methods=['GET'])
+async def obtener_cambios_reportes():
+    """Sincronización incremental (ver app.obtener_cambios_reportes)"""
+    version, fecha = rutas.leer_cambios(request.args)
+    return responder(*rutas.respuesta_cambios(await adb.obtener_cambios_reportes(version, fecha)))
+
+@app.route('/api/reportes', methods=['POST'])
+async def crear_reporte():
+    """Crear un nuevo reporte"""
+    reporte = rutas.leer_reporte_nuevo(await request.get_json())
+    return responder(*rutas.respuesta_reporte_creado(await adb.crear_reporte(**reporte)))
+
+@app.route('/api/reportes/importar', methods=['POST'])
+async def importar_reportes():
+    """Importación masiva (CSV o NDJSON); el archivo se lee por pedazos y se importa en un hilo"""
+    formato = rutas.leer_formato_importacion(request.args, request.content_type)
+    cuerpo = CuerpoPeticion(request.body.__aiter__(), asyncio.get_running_loop())
+    archivo = io.TextIOWrapper(io.BufferedReader(cuerpo), encoding='utf-8-sig', newline='')
+    resumen = await asyncio.to_thread(importacion.importar_reportes, archivo, formato)
+    return responder(*rutas.respuesta_importacion(resumen))
+
+@app.route('/api/reportes/<int:reporte_id>', methods=['GET'])
+async def obtener_reporte(reporte_id):
+    """Obtener un reporte específico"""
+    return responder(*rutas.encontrado(await adb.obtener_reporte_por_id(reporte_id), 'Reporte no encontrado'))
+
+@app.route('/api/reportes/<int:reporte_id>', methods=['DELETE'])
+async def eliminar_reporte(reporte_id):
+    """Eliminar un reporte"""
+    return responder(*rutas.respuesta_reporte_eliminado(await adb.eliminar_reporte(reporte_id), reporte_id))
+
+@app.route('/api/reportes-con-usuarios', methods=['GET'])
+async def obtener_reportes_con_info_usuarios():
+    """Obtener reportes con información completa de usuarios"""
+    return responder(*rutas.lista(await adb.obtener_reportes_con_usuarios()))
+
+# RUTAS PARA USUARIOS
+
+@app.route('/api/usuarios', methods=['GET'])
+async def obtener_usuarios():
+    """Obtener todos los usuarios"""
+    return responder(*rutas.lista(await adb.obtener_todos_usuarios()))
+
+@app.route('/api/usuarios', methods=['POST'])
+async def crear_nuevo_usuario():
+    """Crear un nuevo usuario"""
+    usuario = rutas.leer_usuario_nuevo(await request.get_json())
+    return responder(*rutas.respuesta_usuario_creado(await adb.crear_usuario(**usuario)))
+
+@app.route('/api/usuarios/<int:usuario_id>', methods=['GET'])
+async def obtener_usuario(usuario_id):
+    """Obtener un usuario específico"""
+    return responder(*rutas.encontrado(await adb.obtener_usuario_por_id(usuario_id), 'Usuario no encontrado'))
+
+@app.route('/api/usuarios/<int:usuario_id>/reportes', methods=['GET'])
+async def obtener_reportes_usuario(usuario_id):
+    """Obtener todos los reportes de un usuario específico"""
+    return responder(*rutas.lista(await adb.obtener_reportes_por_usuario(usuario_id)))
+
+@app.route('/api/usuarios/<int:usuario_id>', methods=['PUT'])
+async def actualizar_usuario(usuario_id):
+    """Actualizar información de un usuario"""
+    cambios = rutas.leer_usuario_actualizado(await request.get_json())
+    return responder(*rutas.respuesta_usuario_actualizado(await adb.actualizar_usuario(usuario_id=usuario_id, **cambios)))
+
+# RUTAS PARA ESTADÍSTICAS
+
+@app.route('/api/estadisticas', methods=['GET'])
+async def obtener_estadisticas():
+    """Obtener estadísticas generales del sistema"""
+    async def calcular():
+        return rutas.cuerpo_estadisticas(await adb.obtener_estadisticas())
+
+    return await responder_cacheado('estadisticas', {}, calcular, Config.CACHE_TTL_ESTADISTICAS)
+
+# RUTAS DEL SISTEMA
+
+@app.route('/api/sistema/cache', methods=['GET'])
+async def estado_cache():
+    """Estadísticas de las cachés de resultados y de teselas"""
+    return responder(*rutas.estado_cache())
+
+@app.route('/api/sistema/pool', methods=['GET'])
+async def estado_pool():
+    """Estado del pool de asyncpg y del pool síncrono (que usan predicciones y teselas)"""
+    return responder(*rutas.exito({
+        'asincrono': adb.obtener_estadisticas_pool(),
+        'sincrono': db.obtener_estadisticas_pool()
+    }))
+
+# MANEJO DE ERRORES
+
+@app.errorhandler(ErrorPeticion)
+async def error_peticion(e):
+    return jsonify(rutas.cuerpo_error(str(e))), e.estado
+
+@app.errorhandler(Exception)
+async def error_inesperado(e):
+    """Como app.error_inesperado: 500 con el mensaje"""
+    if isinstance(e, HTTPException):
+        return e
+    return jsonify(rutas.cuerpo_error(str(e))), 500
+
+@app.errorhandler(404)
+async def not_found(e):
+    return jsonify(rutas.cuerpo_error('Ruta no encontrada')), 404
+
+@app.errorhandler(500)
+async def internal_error(e):
+    return jsonify(rutas.cuerpo_error('Error interno del servidor')), 500
+
+# RUTAS PARA PREDICCIONES
+
+@app.route('/api/predicciones', methods=['GET'])
+async def obtener_predicciones():
+    """Obtener todas las predicciones"""
+    return await responder_cacheado('predicciones', {}, rutas.cuerpo_predicciones, Config.CACHE_TTL_PREDICCIONES)
+
+@app.route('/api/predicciones/zonas-riesgo', methods=['GET'])
+async def obtener_zonas_riesgo():
+    """Obtener solo zonas de riesgo (parámetro opcional radio, en grados)"""
+    radio = rutas.leer_radio_zonas(request.args)
+
+    def calcular():
+        return rutas.cuerpo_zonas_riesgo(radio)
+
+    return await responder_cacheado('zonas-riesgo', {'radio': radio}, calcular, Config.CACHE_TTL_PREDICCIONES)
+
+@app.route('/api/predicciones/heatmap/<int:z>/<int:x>/<int:y>', methods=['GET'])
+async def obtener_tesela_calor(z, x, y):
+    """Tesela PNG (256x256) del mapa de calor de robos"""
+    png = await asyncio.to_thread(rutas.tesela_calor, z, x, y)
+    respuesta = Response(png, mimetype='image/png')
+    respuesta.headers['Cache-Control'] = 'public, max-age=60'
+    return respuesta
+
+@app.route('/api/predicciones/ubicacion', methods=['POST'])
+async def predecir_ubicacion():
+    """Predecir riesgo de una ubicación específica"""
+    return await en_hilo(rutas.predecir_ubicacion, await request.get_json())
+
+@app.route('/api/predicciones/ubicaciones', methods=['POST'])
+async def predecir_ubicaciones():
+    """Predecir riesgo de muchas ubicaciones (lista de puntos o una ruta)"""
+    return await en_hilo(rutas.predecir_ubicaciones, await request.get_json())
+
+
+# INICIAR SERVIDOR
+
+if __name__ == '__main__':
+    mostrar_configuracion()
+    print('=' * 50)
+    print('Iniciando servidor asíncrono (Quart + asyncpg)...')
+    print('Servidor corriendo en: http://localhost:5000')
+    print('Para producción: hypercorn app_async:app --bind 0.0.0.0:5000')
+    print('=' * 50)
+
+    app.run(port=5000, host='0.0.0.0')
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+import database as db
+import serializacion
+
+# VERSIÓN DE LOS DATOS
+
+_version = 0
+_version_lock = threading.Lock()
+
+
+def version_datos():
+    """
+    Contador que aumenta cada vez que se crea o elimina un reporte
+    (y cuando se crea o modifica un usuario: las estadísticas los incluyen)
+    """
+    return _version
+
+
+def incrementar_version(evento=None, reporte=None):
+    global _version
+    with _version_lock:
+        _version += 1
+
+
+db.suscribir_cambios(incrementar_version)
+
+# CACHÉ DE RESULTADOS (TTL + LRU)
+
+class CacheResultados:
+    """
+    Caché en memoria para resultados costosos (predicciones, estadísticas)
+    Cada entrada se guarda con la versión de los datos con la que se calculó:
+    si la versión cambió o pasó el TTL, se vuelve a calcular.
+    Cada entrada tiene un ETag derivado de su contenido para responder 304.
+    """
+
+    def __init__(self, maximo=256):
+        self.maximo = maximo
+        self._datos = OrderedDict()   # clave -> (valor, etag, version, expira)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, nombre, params, calcular, ttl):
+        """
+        Devuelve (valor, etag) para nombre + params
+        calcular: función sin argumentos que produce el valor si no está en caché
+        Si calcular() devuelve None (falló la base de datos) o lanza una excepción
+        no se guarda nada y se devuelve (None, None), o se propaga la excepción
+        """
+        clave = (nombre, tuple(sorted(params.items())))
+        version = version_datos()
+        ahora = time.monotonic()
+
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada and entrada[2] == version and entrada[3] > ahora:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[0], entrada[1]
+            self.fallos += 1
+
+        valor = calcular()
+        if valor is None:
+            return None, None
+        etag = hashlib.sha1(serializacion.dumps(valor, ordenar=True)).hexdigest()
+
+        with self._lock:
+            self._datos[clave] = (valor, etag, version, ahora + ttl)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+        return valor, etag
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._datos),
+                'maximo': self.maximo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'version_datos': version_datos()
+            }
+
+
+resultados = CacheResultados(Config.CACHE_RESULTADOS_MAX)
@@ -0,0 +1,174 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él se usa el camino en Python puro
+    np = None
+
+NUMPY_DISPONIBLE = np is not None
+
+_EPOCA = datetime(1970, 1, 1)
+_MICROSEGUNDO = timedelta(microseconds=1)
+US_POR_HORA = 3600 * 1000000
+US_POR_DIA = 24 * US_POR_HORA
+
+# SNAPSHOT COLUMNAR
+
+def a_epoca_us(fecha):
+    """Convierte un datetime (sin zona horaria) a microsegundos desde 1970-01-01"""
+    return (fecha - _EPOCA) // _MICROSEGUNDO
+
+
+class SnapshotColumnar:
+    """
+    Snapshot de reportes en columnas NumPy
+    ids: int64 (id de cada reporte)
+    latitud / longitud: float64
+    fecha_incidente / fecha_creacion: int64 en microsegundos desde epoch
+    tipo: códigos enteros que indexan la lista `tipos`
+    Las filas conservan el orden del snapshot original (fecha_creacion DESC).
+    """
+
+    def __init__(self, latitud, longitud, fecha_incidente, fecha_creacion, tipo, tipos, ids=None):
+        self.latitud = latitud
+        self.longitud = longitud
+        self.fecha_incidente = fecha_incidente
+        self.fecha_creacion = fecha_creacion
+        self.tipo = tipo
+        self.tipos = list(tipos)
+        self.ids = ids
+
+    @classmethod
+    def desde_reportes(cls, reportes):
+        """Construye las columnas a partir de las filas (RealDictRow) de la base de datos"""
+        if np is None:
+            raise RuntimeError("NumPy no está instalado")
+
+        codigos = {}
+        tipo = []
+        for r in reportes:
+            tipo.append(codigos.setdefault(r['tipo_robo'], len(codigos)))
+
+        return cls(
+            latitud=np.array([float(r['latitud']) for r in reportes], dtype=np.float64),
+            longitud=np.array([float(r['longitud']) for r in reportes], dtype=np.float64),
+            fecha_incidente=np.array([a_epoca_us(r['fecha_incidente']) for r in reportes], dtype=np.int64),
+            fecha_creacion=np.array([a_epoca_us(r['fecha_creacion']) for r in reportes], dtype=np.int64),
+            tipo=np.array(tipo, dtype=np.int32),
+            tipos=list(codigos),
+            ids=np.array([r['id'] for r in reportes], dtype=np.int64)
+        )
+
+    def __len__(self):
+        return len(self.latitud)
+
+    def horas(self):
+        """Hora del día (0-23) de cada incidente"""
+        return (self.fecha_incidente // US_POR_HORA) % 24
+
+    def dias_semana(self):
+        """Día de la semana de cada incidente (0=Lunes, 6=Domingo; 1970-01-01 fue jueves)"""
+        return (self.fecha_incidente // US_POR_DIA + 3) % 7
+
+# CONTEOS VECTORIZADOS
+
+def contar_en_orden(codigos, minlength=0):
+    """
+    Histograma con bincount, devuelto como lista (código, cantidad) en el orden
+    de primera aparición; es el mismo orden que tendría un dict/Counter llenado fila a fila
+    """
+    if len(codigos) == 0:
+        return []
+    conteos = np.bincount(codigos, minlength=minlength)
+    valores, primera = np.unique(codigos, return_index=True)
+    orden = valores[np.argsort(primera, kind='stable')]
+    return [(int(v), int(conteos[v])) for v in orden]
+
+
+def resumir_columnas(snapshot, ahora=None):
+    """Versión vectorizada de predicciones.resumir_snapshot (mismo formato de salida)"""
+    if ahora is None:
+        ahora = datetime.now()
+    ahora_us = a_epoca_us(ahora)
+    hace_7_dias = ahora_us - 7 * US_POR_DIA
+    hace_14_dias = ahora_us - 14 * US_POR_DIA
+
+    creacion = snapshot.fecha_creacion
+    semana_actual = int(np.count_nonzero(creacion >= hace_7_dias))
+    semana_anterior = int(np.count_nonzero((creacion >= hace_14_dias) & (creacion < hace_7_dias)))
+
+    tipos = Counter()
+    for codigo, cantidad in contar_en_orden(snapshot.tipo, len(snapshot.tipos)):
+        tipos[snapshot.tipos[codigo]] = cantidad
+
+    return {
+        'horas': dict(contar_en_orden(snapshot.horas(), 24)),
+        'dias': dict(contar_en_orden(snapshot.dias_semana(), 7)),
+        'tipos': tipos,
+        'semana_actual': semana_actual,
+        'semana_anterior': semana_anterior,
+        'total': len(snapshot)
+    }
+
+
+def agrupar_zonas_columnas(snapshot, radio):
+    """
+    Clustering voraz de calcular_zonas_riesgo sobre columnas NumPy
+    Los puntos se ordenan por celda de la grilla (tamaño = radio) y para cada semilla
+    se calculan de una vez las distancias a los puntos libres de las 9 celdas vecinas.
+    Devuelve la lista de clusters como arreglos de índices en orden del snapshot.
+    """
+    n = len(snapshot)
+    lat = snapshot.latitud
+    lng = snapshot.longitud
+
+    filas = np.floor(lat / radio).astype(np.int64)
+    cols = np.floor(lng / radio).astype(np.int64)
+
+    # Índices agrupados por celda: celda -> (inicio, fin) dentro de `orden`
+    orden = np.lexsort((cols, filas))
+    claves_f = filas[orden]
+    claves_c = cols[orden]
+    cortes = np.flatnonzero((np.diff(claves_f) != 0) | (np.diff(claves_c) != 0)) + 1
+    inicios = np.concatenate(([0], cortes))
+    fines = np.concatenate((cortes, [n]))
+    celdas = {
+        (int(claves_f[a]), int(claves_c[a])): orden[a:b]
+        for a, b in zip(inicios.tolist(), fines.tolist())
+    }
+
+    libre = np.ones(n, dtype=bool)
+    filas_l = filas.tolist()
+    cols_l = cols.tolist()
+    clusters = []
+
+    for i in range(n):
+        if not libre[i]:
+            continue
+        libre[i] = False
+
+        f, c = filas_l[i], cols_l[i]
+        bloques = [celdas[k] for k in (
+            (f - 1, c - 1), (f - 1, c), (f - 1, c + 1),
+            (f, c - 1), (f, c), (f, c + 1),
+            (f + 1, c - 1), (f + 1, c), (f + 1, c + 1)
+        ) if k in celdas]
+        candidatos = np.concatenate(bloques) if len(bloques) > 1 else bloques[0]
+        candidatos = candidatos[libre[candidatos]]
+        if candidatos.size == 0:
+            continue
+
+        distancia = np.sqrt((lat[i] - lat[candidatos])**2 + (lng[i] - lng[candidatos])**2)
+        cercanos = np.sort(candidatos[distancia < radio])
+        if cercanos.size:
+            libre[cercanos] = False
+            clusters.append(np.concatenate(([i], cercanos)))
+
+    return clusters
+
+
+def contar_cercanos_columnas(snapshot, latitud, longitud, radio):
+    """Cantidad de reportes a distancia < radio (suma enmascarada)"""
+    distancia = np.sqrt((latitud - snapshot.latitud)**2 + (longitud - snapshot.longitud)**2)
+    return int(np.count_nonzero(distancia < radio))
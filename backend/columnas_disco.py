@@ -0,0 +1,269 @@
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from config import Config
+import database as db
+from columnas import SnapshotColumnar, np
+
+try:
+    import fcntl
+except ImportError:  # sin flock (Windows) las exportaciones solo se ordenan dentro del proceso
+    fcntl = None
+
+# SNAPSHOT COLUMNAR EN DISCO (.npy CON MMAP)
+#
+# Con Config.SNAPSHOT_DIR los reportes (sin descripcion) se exportan a un .npy
+# por columna, en el mismo orden y con los mismos códigos que
+# SnapshotColumnar.desde_reportes. Las predicciones abren esas columnas con
+# mmap de solo lectura: no pasan por psycopg2 ni arman un dict por fila, y todos
+# los procesos del servidor comparten la misma copia en la caché de páginas.
+#
+# Cada exportación va a una carpeta nueva; el archivo `actual` dice cuál es la
+# vigente y se reemplaza al final (os.replace), así un proceso nunca abre una
+# exportación a medias. Se vuelve a exportar cuando la firma de la tabla
+# (database.obtener_firma_reportes) ya no coincide, o con
+# `comandos.py exportar-snapshot` (por ejemplo desde cron). Sin la tabla
+# reportes_cambios la firma es solo cantidad y último id (se avisa una vez).
+#
+# Se exporta de a uno entre todos los procesos (flock sobre `directorio`/.lock):
+# quien esperaba el lock vuelve a leer `actual` y abre lo que exportó el otro, y
+# ninguna limpieza borra una exportación antes de que quien la hizo la abra.
+
+# (atributo de SnapshotColumnar, dtype)
+COLUMNAS = (
+    ('ids', 'int64'),
+    ('latitud', 'float64'),
+    ('longitud', 'float64'),
+    ('fecha_incidente', 'int64'),
+    ('fecha_creacion', 'int64'),
+    ('tipo', 'int32'),
+)
+
+_SQL_REPORTES = """
+    SELECT
+        id,
+        latitud::float8,
+        longitud::float8,
+        (EXTRACT(EPOCH FROM fecha_incidente) * 1000000)::int8,
+        (EXTRACT(EPOCH FROM fecha_creacion) * 1000000)::int8,
+        tipo_robo
+    FROM reportes
+    ORDER BY fecha_creacion DESC, id DESC
+"""
+
+# Filas que se traen por vuelta del cursor del servidor
+_LOTE = 50000
+
+# Exportaciones que se conservan (la vigente y la anterior, que algún proceso
+# puede estar abriendo todavía)
+_CONSERVAR = 2
+
+
+def _leer_actual(directorio):
+    try:
+        with open(os.path.join(directorio, 'actual')) as archivo:
+            return archivo.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _escribir(ruta, texto):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w') as archivo:
+        archivo.write(texto)
+    os.replace(temporal, ruta)
+
+
+def _bloquear(directorio):
+    """Toma el lock de exportación de `directorio` (se suelta al cerrar el archivo devuelto)"""
+    archivo = open(os.path.join(directorio, '.lock'), 'w')
+    if fcntl is not None:
+        fcntl.flock(archivo, fcntl.LOCK_EX)
+    return archivo
+
+
+def exportar_snapshot(directorio=None):
+    """
+    Escribe las columnas de todos los reportes en una carpeta nueva de `directorio`
+    y la marca como vigente. Devuelve la ruta de la carpeta, o None si falla
+    """
+    directorio = directorio or Config.SNAPSHOT_DIR
+    os.makedirs(directorio, exist_ok=True)
+    with _bloquear(directorio):
+        return _exportar(directorio)
+
+
+def _exportar(directorio):
+    """exportar_snapshot con el lock de exportación ya tomado"""
+    nombre = f"{datetime.now():%Y%m%d%H%M%S%f}-{os.getpid()}"
+    destino = os.path.join(directorio, nombre)
+
+    conn = db.get_connection()
+    if not conn:
+        return None
+    try:
+        cur = conn.cursor()
+        # La firma y las filas salen de la misma instantánea
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        firma = db.leer_firma_reportes(cur)
+        cur.close()
+        total = firma[0]
+
+        os.makedirs(destino)
+        columnas = {
+            atributo: np.lib.format.open_memmap(
+                os.path.join(destino, f"{atributo}.npy"), mode='w+', dtype=tipo, shape=(total,)
+            )
+            for atributo, tipo in COLUMNAS
+        }
+
+        # Cursor del servidor: las filas llegan de a _LOTE y se escriben directo en
+        # las columnas, sin tener toda la tabla en memoria
+        lector = conn.cursor(name='exportar_snapshot')
+        lector.itersize = _LOTE
+        lector.execute(_SQL_REPORTES)
+        codigos = {}
+        inicio = 0
+        while True:
+            filas = lector.fetchmany(_LOTE)
+            if not filas:
+                break
+            fin = inicio + len(filas)
+            ids, latitudes, longitudes, incidentes, creaciones, tipos = zip(*filas)
+            columnas['ids'][inicio:fin] = ids
+            columnas['latitud'][inicio:fin] = latitudes
+            columnas['longitud'][inicio:fin] = longitudes
+            columnas['fecha_incidente'][inicio:fin] = incidentes
+            columnas['fecha_creacion'][inicio:fin] = creaciones
+            columnas['tipo'][inicio:fin] = [codigos.setdefault(t, len(codigos)) for t in tipos]
+            inicio = fin
+        lector.close()
+        conn.commit()
+
+        for columna in columnas.values():
+            columna.flush()
+        _escribir(os.path.join(destino, 'meta.json'), json.dumps({
+            'total': total,
+            'tipos': list(codigos),
+            'firma': firma,
+            'fecha': datetime.now().isoformat()
+        }))
+        _escribir(os.path.join(directorio, 'actual'), nombre)
+    except Exception as e:
+        conn.rollback()
+        print(f" Error exportando el snapshot columnar: {e}")
+        shutil.rmtree(destino, ignore_errors=True)
+        return None
+    finally:
+        db.liberar_conexion(conn)
+
+    _limpiar(directorio, nombre)
+    return destino
+
+
+def _limpiar(directorio, vigente):
+    """Borra las exportaciones viejas (los procesos que las tienen abiertas las siguen leyendo)"""
+    anteriores = sorted(
+        nombre for nombre in os.listdir(directorio)
+        if nombre != vigente and os.path.isfile(os.path.join(directorio, nombre, 'meta.json'))
+    )
+    for nombre in anteriores[:max(0, len(anteriores) - (_CONSERVAR - 1))]:
+        shutil.rmtree(os.path.join(directorio, nombre), ignore_errors=True)
+
+
+def abrir_snapshot(carpeta):
+    """SnapshotColumnar con las columnas de `carpeta` abiertas con mmap (solo lectura)"""
+    with open(os.path.join(carpeta, 'meta.json')) as archivo:
+        meta = json.load(archivo)
+    columnas = {
+        atributo: np.load(os.path.join(carpeta, f"{atributo}.npy"), mmap_mode='r')
+        for atributo, _ in COLUMNAS
+    }
+    return SnapshotColumnar(tipos=meta['tipos'], **columnas), meta
+
+
+def _abrir_vigente(directorio, firma):
+    """(carpeta, snapshot) de la exportación vigente; snapshot es None si falta o no corresponde a `firma`"""
+    nombre = _leer_actual(directorio)
+    if not nombre:
+        return None, None
+    carpeta = os.path.join(directorio, nombre)
+    try:
+        snapshot, meta = abrir_snapshot(carpeta)
+    except (OSError, ValueError, KeyError):
+        return carpeta, None
+    return carpeta, snapshot if meta['firma'] == firma else None
+
+
+_abierto = None  # (carpeta, firma, SnapshotColumnar)
+_abierto_lock = threading.Lock()
+_fallo_avisado = False
+
+
+def _avisar_fallo(motivo):
+    """Una sola vez por proceso: las predicciones siguen leyendo las filas con psycopg2"""
+    global _fallo_avisado
+    if not _fallo_avisado:
+        _fallo_avisado = True
+        print(f" Snapshot en disco no disponible ({motivo}), se leen los reportes de la base de datos")
+
+
+def obtener_snapshot_disco(directorio=None):
+    """
+    El snapshot vigente de `directorio` (Config.SNAPSHOT_DIR), exportándolo antes
+    si falta o si la tabla cambió. None si no se pudo exportar
+    """
+    global _abierto
+    if np is None:
+        return None
+    directorio = directorio or Config.SNAPSHOT_DIR
+    os.makedirs(directorio, exist_ok=True)
+
+    firma = db.obtener_firma_reportes()
+    if firma is None:
+        _avisar_fallo("no se pudo leer la firma de los reportes")
+        return None
+
+    with _abierto_lock:
+        nombre = _leer_actual(directorio)
+        carpeta = os.path.join(directorio, nombre) if nombre else None
+        if _abierto is not None and _abierto[0] == carpeta and _abierto[1] == firma:
+            return _abierto[2]
+
+        carpeta, snapshot = _abrir_vigente(directorio, firma)
+        if snapshot is None:
+            with _bloquear(directorio):
+                # Otro proceso pudo haber exportado mientras se esperaba el lock
+                carpeta, snapshot = _abrir_vigente(directorio, firma)
+                if snapshot is None:
+                    carpeta = _exportar(directorio)
+                    if carpeta is None:
+                        _avisar_fallo("no se pudo exportar")
+                        return None
+                    try:
+                        snapshot, meta = abrir_snapshot(carpeta)
+                    except (OSError, ValueError, KeyError) as e:
+                        _avisar_fallo(f"no se pudo abrir la exportación: {e}")
+                        return None
+                    firma = meta['firma']
+
+        _abierto = (carpeta, firma, snapshot)
+        return snapshot
+
+
+def verificar_snapshot_disco(reportes, directorio):
+    """
+    Exporta a `directorio` y compara las columnas abiertas con mmap contra
+    SnapshotColumnar.desde_reportes sobre las mismas filas
+    """
+    carpeta = exportar_snapshot(directorio)
+    if carpeta is None:
+        return False
+    disco, _ = abrir_snapshot(carpeta)
+    esperado = SnapshotColumnar.desde_reportes(reportes)
+    return disco.tipos == esperado.tipos and all(
+        np.array_equal(getattr(disco, atributo), getattr(esperado, atributo))
+        for atributo, _ in COLUMNAS
+    )
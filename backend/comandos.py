@@ -0,0 +1,432 @@
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from decimal import Decimal
+from config import Config
+import database as db
+import agrupamiento
+import cubo
+import columnas_disco
+import espacial
+import importacion
+import serializacion
+from indice_espacial import GrillaEspacial
+
+# COMANDOS DE ADMINISTRACIÓN
+#
+# Uso: python comandos.py <comando> [opciones]
+#   esquema                   Crea los índices y estructuras auxiliares en la base de datos
+#   refrescar-estadisticas    Reconstruye desde cero las tablas de resumen de estadísticas
+#   importar ARCHIVO          Importa reportes desde un archivo CSV o NDJSON
+#   cubo                      Reconstruye el cubo de riesgo (Config.CUBO_ARCHIVO o --archivo)
+#   exportar-snapshot         Exporta los reportes a columnas .npy (Config.SNAPSHOT_DIR o --directorio)
+#   benchmark-servidor URL    Mide peticiones/segundo contra un servidor corriendo (app.py o app_async.py)
+#   benchmark-json            Compara la serialización fila por fila anterior con serializacion.dumps
+#   benchmark-espacial        Latencia de las consultas por radio con cada motor (10k / 100k / 1M reportes)
+#   benchmark-zonas           DBSCAN de las zonas de riesgo en uno y varios procesos
+
+def comando_esquema(args):
+    """Aplica database.ESQUEMA (idempotente) y llena las tablas de resumen"""
+    if not db.preparar_esquema():
+        return 1
+    espacial.preparar_esquema()
+    return 0 if db.refrescar_estadisticas() else 1
+
+
+def comando_refrescar_estadisticas(args):
+    return 0 if db.refrescar_estadisticas() else 1
+
+
+def comando_cubo(args):
+    archivo = args.archivo or Config.CUBO_ARCHIVO
+    if cubo.np is None:
+        print(" El cubo de riesgo necesita NumPy")
+        return 1
+    if not archivo:
+        print(" Falta --archivo (o Config.CUBO_ARCHIVO)")
+        return 1
+    inicio = time.perf_counter()
+    construido, firma = cubo.construir_cubo(archivo)
+    if construido is None:
+        return 1
+    print(f" Cubo {construido.conteos.shape} con {firma[0]} reportes en {archivo} "
+          f"({time.perf_counter() - inicio:.2f} s)")
+    return 0
+
+
+def comando_exportar_snapshot(args):
+    """Una exportación, o una cada `--cada` segundos si la tabla cambió (para correr aparte)"""
+    directorio = args.directorio or Config.SNAPSHOT_DIR
+    if columnas_disco.np is None:
+        print(" El snapshot columnar necesita NumPy")
+        return 1
+    if not directorio:
+        print(" Falta --directorio (o Config.SNAPSHOT_DIR)")
+        return 1
+    os.makedirs(directorio, exist_ok=True)
+    
+    ultima_firma = None
+    while True:
+        firma = db.obtener_firma_reportes()
+        if firma is not None and firma != ultima_firma:
+            inicio = time.perf_counter()
+            carpeta = columnas_disco.exportar_snapshot(directorio)
+            if carpeta is None:
+                return 1
+            tamano = sum(os.path.getsize(os.path.join(carpeta, f)) for f in os.listdir(carpeta))
+            print(f" {firma[0]} reportes en {carpeta} ({tamano / 1e6:.1f} MB, "
+                  f"{time.perf_counter() - inicio:.2f} s)")
+            ultima_firma = firma
+        if not args.cada:
+            return 0
+        time.sleep(args.cada)
+
+
+def comando_importar(args):
+    formato = args.formato
+    if not formato:
+        formato = 'csv' if args.archivo.lower().endswith('.csv') else 'ndjson'
+    
+    def progreso(resumen):
+        print(f" {resumen['filas']} filas leídas, {resumen['insertados']} insertadas "
+              f"({resumen['filas_por_segundo']} filas/s)")
+    
+    with open(args.archivo, encoding='utf-8-sig', newline='') as archivo:
+        resumen = importacion.importar_reportes(archivo, formato, args.lote, progreso)
+    
+    for error in resumen['errores']:
+        print(f"   Línea {error['linea']}: {error['error']}")
+    if resumen['con_errores'] > len(resumen['errores']):
+        print(f"   ... y {resumen['con_errores'] - len(resumen['errores'])} errores más")
+    print(f" Importación terminada: {resumen['insertados']} de {resumen['filas']} reportes "
+          f"en {resumen['segundos']} s ({resumen['filas_por_segundo']} filas/s)")
+    return 0 if not resumen['con_errores'] else 2
+
+
+def comando_benchmark_servidor(args):
+    """
+    Varios clientes en paralelo piden las rutas durante `segundos` segundos
+    Sirve para comparar el modo síncrono (app.py) con el asíncrono (app_async.py)
+    """
+    base = args.url.rstrip('/')
+    rutas = args.rutas or ['/api/reportes?limit=50', '/api/estadisticas', '/api/reportes/clusters?zoom=13&bbox=-74.2,4.5,-74.0,4.8']
+    tiempos = []
+    errores = [0]
+    lock = threading.Lock()
+    fin = time.perf_counter() + args.segundos
+    
+    def cliente(numero):
+        i = numero
+        while time.perf_counter() < fin:
+            ruta = rutas[i % len(rutas)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base + ruta, timeout=30) as respuesta:
+                    respuesta.read()
+                duracion = time.perf_counter() - inicio
+                with lock:
+                    tiempos.append(duracion)
+            except Exception:
+                with lock:
+                    errores[0] += 1
+    
+    hilos = [threading.Thread(target=cliente, args=(n,)) for n in range(args.concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    total = time.perf_counter() - inicio
+    
+    tiempos.sort()
+    if not tiempos:
+        print(f" Ninguna petición respondió ({errores[0]} errores)")
+        return 1
+    print(f" {base} - {args.concurrencia} clientes, {total:.1f} s")
+    print(f"   Peticiones: {len(tiempos)} ({errores[0]} errores)")
+    print(f"   Peticiones/s: {len(tiempos) / total:.1f}")
+    print(f"   Latencia p50: {tiempos[len(tiempos) // 2] * 1000:.1f} ms, "
+          f"p95: {tiempos[int(len(tiempos) * 0.95)] * 1000:.1f} ms")
+    return 0
+
+
+def comando_benchmark_json(args):
+    """Serializa `filas` reportes sintéticos (con Decimal y datetime como los de psycopg2)"""
+    base = datetime(2024, 1, 1, 8, 30, 15, 123456)
+    filas = [
+        {
+            'id': i,
+            'usuario_id': i % 50,
+            'tipo_robo': ('celular', 'moto', 'vehiculo', 'persona')[i % 4],
+            'descripcion': f'Reporte de prueba número {i}',
+            'latitud': Decimal('4.60971000') + Decimal(i % 1000) / 100000,
+            'longitud': Decimal('-74.08175000') - Decimal(i % 700) / 100000,
+            'fecha_incidente': base + timedelta(minutes=7 * i),
+            'fecha_creacion': base + timedelta(minutes=7 * i + 3),
+            'barrio': None
+        }
+        for i in range(args.filas)
+    ]
+    
+    def anterior():
+        # Lo que hacía cada ruta de app.py antes de serializacion.py
+        reportes_json = []
+        for reporte in filas:
+            reporte_dict = dict(reporte)
+            reporte_dict['latitud'] = float(reporte_dict['latitud'])
+            reporte_dict['longitud'] = float(reporte_dict['longitud'])
+            reporte_dict['fecha_incidente'] = reporte_dict['fecha_incidente'].isoformat()
+            reporte_dict['fecha_creacion'] = reporte_dict['fecha_creacion'].isoformat()
+            reportes_json.append(reporte_dict)
+        return json.dumps({'success': True, 'data': reportes_json}).encode()
+    
+    def nuevo():
+        return serializacion.dumps({'success': True, 'data': filas})
+    
+    resultados = {}
+    for nombre, funcion in (('anterior', anterior), ('serializacion', nuevo)):
+        mejor = None
+        for _ in range(args.repeticiones):
+            inicio = time.perf_counter()
+            salida = funcion()
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        resultados[nombre] = (mejor, salida)
+    
+    if json.loads(resultados['anterior'][1]) != json.loads(resultados['serializacion'][1]):
+        print(" Los dos métodos no producen el mismo JSON")
+        return 1
+    
+    motor = 'orjson' if serializacion.orjson is not None else 'json (sin orjson)'
+    print(f" {args.filas} filas, mejor de {args.repeticiones} repeticiones")
+    for nombre, (duracion, salida) in resultados.items():
+        print(f"   {nombre:14s} {duracion * 1000:8.1f} ms  {len(salida) / 1e6:6.1f} MB")
+    print(f"   Aceleración: {resultados['anterior'][0] / resultados['serializacion'][0]:.1f}x ({motor})")
+    return 0
+
+
+def _percentil(tiempos, p):
+    tiempos = sorted(tiempos)
+    return tiempos[min(len(tiempos) - 1, int(len(tiempos) * p))] * 1000
+
+
+def comando_benchmark_espacial(args):
+    """
+    Cuenta reportes a `radio` grados de puntos al azar con cada motor de espacial.py
+    Los reportes sintéticos (repartidos sobre Bogotá) van a la tabla reportes_benchmark,
+    que se borra al terminar; la tabla reportes no se toca.
+    """
+    sur, oeste, norte, este = 4.45, -74.25, 4.85, -74.00
+    metros = args.radio * espacial.METROS_POR_GRADO
+    motores = ['sql']
+    if espacial.detectar_motor('postgis') == 'postgis':
+        motores.append('postgis')
+    
+    conn = db.get_connection()
+    if not conn:
+        return 1
+    try:
+        cur = conn.cursor()
+        cur.execute("DROP TABLE IF EXISTS reportes_benchmark")
+        cur.execute("""
+            CREATE UNLOGGED TABLE reportes_benchmark (
+                id SERIAL PRIMARY KEY,
+                latitud DECIMAL(10, 8) NOT NULL,
+                longitud DECIMAL(11, 8) NOT NULL
+            )
+        """)
+        conn.commit()
+        
+        print(f" Radio {args.radio} grados (~{metros:.0f} m), {args.consultas} consultas por motor")
+        print(f"   {'reportes':>9s}  {'motor':18s} {'preparación':>11s} {'p50':>9s} {'p95':>9s} {'promedio':>9s}")
+        for tamano in args.tamanos:
+            cur.execute("TRUNCATE reportes_benchmark")
+            cur.execute("DROP INDEX IF EXISTS idx_benchmark_ubicacion")
+            cur.execute("DROP INDEX IF EXISTS idx_benchmark_geografia")
+            cur.execute("""
+                INSERT INTO reportes_benchmark (latitud, longitud)
+                SELECT %s + random() * %s, %s + random() * %s FROM generate_series(1, %s)
+            """, (sur, norte - sur, oeste, este - oeste, tamano))
+            
+            # Los mismos índices que espacial.ESQUEMA_SQL y espacial.ESQUEMA_POSTGIS
+            inicio = time.perf_counter()
+            cur.execute(f"CREATE INDEX idx_benchmark_ubicacion ON reportes_benchmark USING gist ({espacial.PUNTO_PLANO})")
+            preparacion = {'sql': time.perf_counter() - inicio}
+            if 'postgis' in motores:
+                inicio = time.perf_counter()
+                cur.execute(f"CREATE INDEX idx_benchmark_geografia ON reportes_benchmark USING gist ({espacial.PUNTO_REPORTE})")
+                preparacion['postgis'] = time.perf_counter() - inicio
+            cur.execute("ANALYZE reportes_benchmark")
+            conn.commit()
+            
+            azar = random.Random(tamano)
+            puntos = [(azar.uniform(sur, norte), azar.uniform(oeste, este)) for _ in range(args.consultas)]
+            
+            # Motor 'python': cargar todas las filas y armar el índice en memoria
+            inicio = time.perf_counter()
+            cur.execute("SELECT id, latitud::float8, longitud::float8 FROM reportes_benchmark")
+            filas = cur.fetchall()
+            grilla = GrillaEspacial(Config.INDICE_TAM_CELDA)
+            for reporte_id, lat, lng in filas:
+                grilla.agregar(reporte_id, lat, lng)
+            preparacion['python'] = time.perf_counter() - inicio
+            
+            resultados = {}
+            tiempos = []
+            for lat, lng in puntos:
+                inicio = time.perf_counter()
+                grilla.contar_cercanos(lat, lng, args.radio)
+                tiempos.append(time.perf_counter() - inicio)
+            resultados['python'] = tiempos
+            
+            # Sin índice: como predecir_riesgo_ubicacion con la lista de reportes (pocas consultas)
+            tiempos = []
+            for lat, lng in puntos[:args.consultas_lineales]:
+                inicio = time.perf_counter()
+                sum(1 for _, lat2, lng2 in filas if ((lat - lat2)**2 + (lng - lng2)**2)**0.5 < args.radio)
+                tiempos.append(time.perf_counter() - inicio)
+            resultados['python sin índice'] = tiempos
+            preparacion['python sin índice'] = preparacion['python']
+            
+            conteos = {}
+            for motor in motores:
+                sql = espacial.sql_contar_cercanos(motor, 'reportes_benchmark')
+                tiempos = []
+                conteos[motor] = []
+                for lat, lng in puntos:
+                    inicio = time.perf_counter()
+                    cur.execute(sql, {'lat': [lat], 'lng': [lng], 'metros': metros})
+                    conteos[motor].append(cur.fetchone()[0])
+                    tiempos.append(time.perf_counter() - inicio)
+                resultados[motor] = tiempos
+            conn.commit()
+            
+            # Haversine en Python sobre las mismas filas: la consulta SQL debe dar lo mismo
+            for (lat, lng), esperado in list(zip(puntos, conteos['sql']))[:3]:
+                real = sum(1 for _, lat2, lng2 in filas if espacial.distancia_metros(lat, lng, lat2, lng2) <= metros)
+                if real != esperado:
+                    print(f" El motor sql contó {esperado} reportes y Haversine en Python {real}")
+                    return 1
+            
+            for motor, tiempos in resultados.items():
+                print(f"   {tamano:>9d}  {motor:18s} {preparacion[motor]:>9.2f} s "
+                      f"{_percentil(tiempos, 0.5):>6.2f} ms {_percentil(tiempos, 0.95):>6.2f} ms "
+                      f"{sum(tiempos) / len(tiempos) * 1000:>6.2f} ms")
+            del filas, grilla
+        return 0
+    finally:
+        cur = conn.cursor()
+        cur.execute("DROP TABLE IF EXISTS reportes_benchmark")
+        conn.commit()
+        db.liberar_conexion(conn)
+
+
+def comando_benchmark_zonas(args):
+    """
+    DBSCAN (agrupamiento.py) sobre reportes sintéticos: focos con ruido alrededor y
+    reportes sueltos repartidos sobre Bogotá. Verifica que todas las cantidades de
+    procesos formen los mismos clusters.
+    """
+    np = agrupamiento.np
+    if np is None:
+        print(" DBSCAN necesita NumPy")
+        return 1
+    
+    sur, oeste, norte, este = 4.45, -74.25, 4.85, -74.00
+    generador = np.random.default_rng(0)
+    procesos = args.procesos or sorted({1, os.cpu_count() or 1})
+    
+    print(f" eps {args.radio} grados, {args.min_puntos} puntos por núcleo, teselas de {args.tesela} grados")
+    print(f"   {'reportes':>9s}  {'procesos':>8s} {'tiempo':>9s} {'clusters':>9s} {'ruido':>9s}")
+    for tamano in args.tamanos:
+        focos = generador.uniform((sur, oeste), (norte, este), (max(1, tamano // 2000), 2))
+        agrupados = focos[generador.integers(0, len(focos), tamano // 2)]
+        agrupados += generador.normal(0, args.radio * 2, agrupados.shape)
+        sueltos = generador.uniform((sur, oeste), (norte, este), (tamano - len(agrupados), 2))
+        puntos = np.concatenate((agrupados, sueltos))
+        
+        referencia = None
+        for cantidad in procesos:
+            inicio = time.perf_counter()
+            etiquetas = agrupamiento.dbscan(
+                puntos[:, 0], puntos[:, 1], args.radio, args.min_puntos,
+                tesela=args.tesela, procesos=cantidad
+            )
+            duracion = time.perf_counter() - inicio
+            print(f"   {tamano:>9d}  {cantidad:>8d} {duracion:>8.2f}s "
+                  f"{int(etiquetas.max()) + 1:>9d} {int((etiquetas < 0).sum()):>9d}")
+            if referencia is None:
+                referencia = etiquetas
+            elif not np.array_equal(referencia, etiquetas):
+                print(f" Los clusters con {cantidad} procesos no coinciden con {procesos[0]}")
+                return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Comandos de administración del sistema de reportes')
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+    
+    p = subcomandos.add_parser('esquema', help='Crea índices y estructuras auxiliares')
+    p.set_defaults(funcion=comando_esquema)
+    
+    p = subcomandos.add_parser('refrescar-estadisticas', help='Reconstruye las tablas de resumen de estadísticas')
+    p.set_defaults(funcion=comando_refrescar_estadisticas)
+    
+    p = subcomandos.add_parser('cubo', help='Reconstruye el archivo del cubo de riesgo')
+    p.add_argument('--archivo', help='Ruta del .npy (por defecto Config.CUBO_ARCHIVO)')
+    p.set_defaults(funcion=comando_cubo)
+    
+    p = subcomandos.add_parser('exportar-snapshot', help='Exporta los reportes a columnas .npy para mmap')
+    p.add_argument('--directorio', help='Carpeta de las exportaciones (por defecto Config.SNAPSHOT_DIR)')
+    p.add_argument('--cada', type=float, help='Repetir cada tantos segundos si la tabla cambió')
+    p.set_defaults(funcion=comando_exportar_snapshot)
+    
+    p = subcomandos.add_parser('importar', help='Importa reportes desde CSV o NDJSON')
+    p.add_argument('archivo', help='Ruta del archivo (.csv o .ndjson)')
+    p.add_argument('--formato', choices=['csv', 'ndjson'], help='Por defecto según la extensión')
+    p.add_argument('--lote', type=int, help='Filas por transacción (por defecto Config.IMPORTACION_LOTE)')
+    p.set_defaults(funcion=comando_importar)
+    
+    p = subcomandos.add_parser('benchmark-servidor', help='Peticiones/segundo contra un servidor corriendo')
+    p.add_argument('url', help='Por ejemplo http://localhost:5000')
+    p.add_argument('--ruta', dest='rutas', action='append', help='Ruta a pedir (se puede repetir)')
+    p.add_argument('--concurrencia', type=int, default=16, help='Clientes en paralelo')
+    p.add_argument('--segundos', type=float, default=10, help='Duración de la prueba')
+    p.set_defaults(funcion=comando_benchmark_servidor)
+    
+    p = subcomandos.add_parser('benchmark-json', help='Microbenchmark de la serialización de reportes')
+    p.add_argument('--filas', type=int, default=100000)
+    p.add_argument('--repeticiones', type=int, default=3)
+    p.set_defaults(funcion=comando_benchmark_json)
+    
+    p = subcomandos.add_parser('benchmark-espacial', help='Latencia de consultas por radio: python, sql y postgis')
+    p.add_argument('--tamanos', type=int, nargs='+', default=[10000, 100000, 1000000])
+    p.add_argument('--consultas', type=int, default=200, help='Puntos al azar por motor')
+    p.add_argument('--consultas-lineales', type=int, default=5, help='Puntos para el recorrido sin índice')
+    p.add_argument('--radio', type=float, default=0.005, help='Radio en grados (como predecir_riesgo_ubicacion)')
+    p.set_defaults(funcion=comando_benchmark_espacial)
+    
+    p = subcomandos.add_parser('benchmark-zonas', help='DBSCAN de zonas de riesgo en uno y varios procesos')
+    p.add_argument('--tamanos', type=int, nargs='+', default=[100000, 1000000])
+    p.add_argument('--procesos', type=int, nargs='+', help='Por defecto 1 y la cantidad de núcleos')
+    p.add_argument('--radio', type=float, default=0.002, help='eps en grados')
+    p.add_argument('--min-puntos', type=int, default=Config.DBSCAN_MIN_PUNTOS)
+    p.add_argument('--tesela', type=float, default=Config.DBSCAN_TESELA, help='Lado de las teselas en grados')
+    p.set_defaults(funcion=comando_benchmark_zonas)
+    
+    args = parser.parse_args(argv)
+    try:
+        return args.funcion(args)
+    finally:
+        db.cerrar_pool()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,42 @@
+import gzip
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # sin brotli solo se comprime con gzip
+    brotli = None
+
+# COMPRESIÓN DE RESPUESTAS (GZIP / BROTLI)
+
+_COMPRIMIBLES = ('application/json', 'application/x-ndjson', 'application/vnd.reportes', 'application/x-msgpack', 'text/')
+
+
+def elegir_codificacion(accept_encoding):
+    """'br', 'gzip' o None según el encabezado Accept-Encoding (werkzeug)"""
+    if brotli is not None and accept_encoding['br']:
+        return 'br'
+    if accept_encoding['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimible(content_type, tamano):
+    """Las imágenes PNG ya vienen comprimidas y las respuestas pequeñas no lo valen"""
+    return tamano >= Config.COMPRESION_MIN_BYTES and (content_type or '').startswith(_COMPRIMIBLES)
+
+
+def comprimir(datos, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=Config.COMPRESION_NIVEL_BROTLI)
+    return gzip.compress(datos, compresslevel=Config.COMPRESION_NIVEL_GZIP)
+
+
+def preparar_encabezados(respuesta, codificacion, tamano):
+    """Encabezados comunes a Flask y Quart después de comprimir el cuerpo"""
+    respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.headers['Content-Length'] = str(tamano)
+    respuesta.vary.add('Accept-Encoding')
+    # El ETag es del contenido sin comprimir: se marca como débil
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(etag, weak=True)
@@ -19,6 +19,20 @@ class Config:
     
     DB_PASSWORD = '130521'  
     
+    # POOL DE CONEXIONES
+    
+    # Conexiones que se mantienen abiertas siempre
+    DB_POOL_MIN = 1
+    
+    # Máximo de conexiones simultáneas contra PostgreSQL
+    DB_POOL_MAX = 10
+    
+    # Segundos que se espera por una conexión libre antes de fallar
+    DB_POOL_TIMEOUT = 30
+    
+    # Si una conexión estuvo sin usarse más de estos segundos se verifica con SELECT 1
+    DB_POOL_VERIFICAR_TRAS = 30
+    
     # CONFIGURACIÓN DE FLASK
     
     # Clave secreta para sesiones 
@@ -36,21 +50,163 @@ class Config:
     # Zona horaria
     TIMEZONE = 'America/Bogota'
     
-    # Número máximo de resultados por página (para paginación futura)
+    # ANALÍTICA
+    
+    # Usar columnas NumPy para las predicciones si NumPy está instalado
+    USAR_NUMPY = True
+    
+    # Carpeta del snapshot columnar en disco que las predicciones abren con mmap
+    # (ver columnas_disco.py; None = leer las filas de la base de datos)
+    SNAPSHOT_DIR = None
+    
+    # Tamaño de celda (grados) del índice espacial para riesgo por ubicación
+    INDICE_TAM_CELDA = 0.005
+    
+    # Dónde se resuelven las consultas por radio (ver espacial.py):
+    # 'python' (índice en memoria), 'sql' (Haversine en PostgreSQL) o 'postgis'
+    MOTOR_ESPACIAL = 'python'
+    
+    # Distancia máxima (metros) de GET /api/reportes/cercanos
+    VECINOS_METROS_MAX = 50000
+    # Máximo de reportes que devuelve GET /api/reportes/cercanos
+    VECINOS_MAX = 100
+    
+    # Algoritmo de las zonas de riesgo (ver agrupamiento.py): 'voraz' o 'dbscan'
+    ALGORITMO_ZONAS = 'voraz'
+    # DBSCAN: reportes a menos del radio (incluido el propio) para ser núcleo
+    DBSCAN_MIN_PUNTOS = 5
+    # Lado (grados) de las teselas que se procesan en paralelo
+    DBSCAN_TESELA = 0.05
+    # Procesos para las teselas (None = uno por núcleo) y reportes mínimos para usarlos
+    DBSCAN_PROCESOS = None
+    DBSCAN_MIN_PARALELO = 100000
+    
+    # Cubo de riesgo por celda x día x hora x tipo (ver cubo.py):
+    # límites (sur, oeste, norte, este) y lado de las celdas en grados
+    CUBO_LIMITES = (4.45, -74.25, 4.85, -73.95)
+    CUBO_TAM_CELDA = 0.005
+    # Tipos con índice propio en el cubo (el resto se cuenta como 'otro')
+    CUBO_TIPOS = ('celular', 'moto', 'vehiculo', 'persona', 'residencia', 'comercio')
+    # Archivo .npy del cubo compartido por los procesos (None = solo en memoria)
+    CUBO_ARCHIVO = None
+    
+    # Vidas medias (días) del riesgo con decaimiento exponencial (ver decaimiento.py);
+    # cada una es un acumulador por celda y las consultas eligen entre ellas
+    RIESGO_VIDAS_MEDIAS_DIAS = (7, 30, 90, 365)
+    
+    # Máximo de puntos que acepta una consulta de riesgo por lotes (rutas)
+    MAX_PUNTOS_LOTE = 2000
+    
+    # Radio máximo (grados) de las consultas de riesgo por ubicación: cada punto
+    # recorre (2 * radio / INDICE_TAM_CELDA + 1)² celdas de la grilla
+    MAX_RADIO_PREDICCION = 0.05
+    
+    # MAPA
+    
+    # Zoom máximo del mapa (Leaflet / OpenStreetMap)
+    ZOOM_MAX = 19
+    
+    # Cada tesela se divide en CLUSTER_DIVISIONES x CLUSTER_DIVISIONES grupos
+    CLUSTER_DIVISIONES = 8
+    
+    # Máximo de teselas por consulta de clusters
+    CLUSTER_MAX_TESELAS = 64
+    
+    # Teselas que se guardan en memoria
+    CACHE_TESELAS_MAX = 5000
+    
+    # Radio del kernel del mapa de calor, en píxeles de la tesela
+    HEATMAP_RADIO_PX = 16
+    
+    # Densidad (reportes superpuestos) con la que el mapa de calor llega al rojo
+    HEATMAP_SATURACION = 6.0
+    
+    # Teselas PNG del mapa de calor que se guardan en memoria
+    HEATMAP_CACHE_MAX = 2000
+    
+    # Carpeta para guardar las teselas en disco (None = solo en memoria)
+    HEATMAP_DIR = None
+    
+    # CACHÉ DE RESULTADOS
+    
+    # Entradas que guarda la caché de predicciones / estadísticas
+    CACHE_RESULTADOS_MAX = 256
+    
+    # Segundos que vale un resultado aunque no cambien los reportes
+    # (la tendencia y "reportes de hoy" dependen de la hora actual)
+    CACHE_TTL_PREDICCIONES = 300
+    CACHE_TTL_ESTADISTICAS = 30
+    
+    # IMPORTACIÓN MASIVA
+    
+    # Filas que se insertan por transacción al importar CSV / NDJSON
+    IMPORTACION_LOTE = 5000
+    
+    # Errores por fila que se devuelven como máximo (el resto solo se cuentan)
+    IMPORTACION_MAX_ERRORES = 1000
+    
+    # SERVIDOR (wsgi.py / gunicorn.conf.py)
+    
+    SERVIDOR_HOST = '0.0.0.0'
+    SERVIDOR_PUERTO = 5000
+    
+    # Procesos (cada uno con su propio pool de conexiones y sus cachés en memoria)
+    SERVIDOR_WORKERS = 4
+    
+    # Hilos por proceso; conviene que no supere DB_POOL_MAX
+    SERVIDOR_HILOS = 8
+    
+    # Cargar índices y cachés al arrancar cada worker en vez de en la primera petición
+    PRECALENTAR = True
+    
+    # Número máximo de resultados por página en GET /api/reportes
     MAX_RESULTS_PER_PAGE = 100
+    
+    # Máximo por página con los formatos compactos del mapa (Accept: columnas / binario / msgpack)
+    MAX_RESULTS_COMPACTO = 5000
+    
+    # Máximo de cambios en GET /api/reportes/cambios; con más, el cliente recarga todo
+    MAX_CAMBIOS_SINCRONIZACION = 5000
+    
+    # EVENTOS EN TIEMPO REAL (GET /api/eventos en app_async.py)
+    
+    # Segundos durante los que se juntan cambios antes de enviarlos
+    EVENTOS_INTERVALO = 0.25
+    # Con más cambios en un lote se envía "recargar" en lugar de los reportes
+    EVENTOS_MAX_LOTE = 500
+    # Mensajes pendientes por cliente antes de desconectarlo por lento
+    EVENTOS_MAX_COLA = 100
+    # Segundos sin mensajes tras los que se envía un latido
+    EVENTOS_LATIDO = 15
+    # Zonas de riesgo (las de más robos) que se envían tras cada lote
+    EVENTOS_MAX_ZONAS = 20
+    
+    # COMPRESIÓN DE RESPUESTAS
+    
+    # Respuestas más pequeñas que esto (bytes) no se comprimen
+    COMPRESION_MIN_BYTES = 1024
+    
+    COMPRESION_NIVEL_GZIP = 6
+    COMPRESION_NIVEL_BROTLI = 5
 
-# Mensaje de confirmación al cargar el módulo
-print("=" * 60)
-print("Configuración cargada correctamente")
-print("=" * 60)
-print(f"Base de datos:")
-print(f"   - Nombre: {Config.DB_NAME}")
-print(f"   - Host: {Config.DB_HOST}")
-print(f"   - Puerto: {Config.DB_PORT}")
-print(f"   - Usuario: {Config.DB_USER}")
-print(f"   - Password: {'*' * len(Config.DB_PASSWORD)} (oculta)")
-print("=" * 60)
-print(f"Flask:")
-print(f"   - Debug mode: {Config.DEBUG}")
-print(f"   - CORS: {Config.CORS_ORIGINS}")
-print("=" * 60)
\ No newline at end of file
+def mostrar_configuracion():
+    """Resumen de la configuración (lo muestran los puntos de entrada al arrancar, no el import)"""
+    print("=" * 60)
+    print("Configuración cargada correctamente")
+    print("=" * 60)
+    print(f"Base de datos:")
+    print(f"   - Nombre: {Config.DB_NAME}")
+    print(f"   - Host: {Config.DB_HOST}")
+    print(f"   - Puerto: {Config.DB_PORT}")
+    print(f"   - Usuario: {Config.DB_USER}")
+    print(f"   - Password: {'*' * len(Config.DB_PASSWORD)} (oculta)")
+    print(f"   - Pool: {Config.DB_POOL_MIN}-{Config.DB_POOL_MAX} conexiones")
+    print("=" * 60)
+    print(f"Flask:")
+    print(f"   - Debug mode: {Config.DEBUG}")
+    print(f"   - CORS: {Config.CORS_ORIGINS}")
+    print("=" * 60)
+    print(f"Servidor:")
+    print(f"   - Workers: {Config.SERVIDOR_WORKERS} x {Config.SERVIDOR_HILOS} hilos")
+    print(f"   - Dirección: {Config.SERVIDOR_HOST}:{Config.SERVIDOR_PUERTO}")
+    print("=" * 60)
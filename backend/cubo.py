@@ -0,0 +1,296 @@
+import json
+import math
+import os
+import threading
+from config import Config
+import database as db
+
+try:
+    import numpy as np
+except ImportError:  # sin NumPy no hay cubo: las predicciones por franja no están disponibles
+    np = None
+
+# CUBO DE RIESGO (CELDA x DÍA x HORA x TIPO)
+#
+# Conteo de reportes por celda de la grilla (Config.CUBO_TAM_CELDA dentro de
+# Config.CUBO_LIMITES), día de la semana (0=Lunes) y hora de fecha_incidente, y
+# tipo de robo (Config.CUBO_TIPOS; el último índice es 'otro'). Es un arreglo
+# uint32 de NumPy, así "riesgo aquí el viernes a las 22:00" es sumar unas pocas
+# posiciones en vez de recorrer los reportes.
+#
+# Se construye con un GROUP BY en PostgreSQL y se mantiene con cada reporte
+# creado o eliminado (database.suscribir_cambios). Con Config.CUBO_ARCHIVO el
+# arreglo se guarda en un .npy que los procesos abren con mmap copy-on-write:
+# comparten las páginas del archivo y cada uno escribe solo las celdas que
+# cambian después. Si el archivo no coincide con la tabla (firma: cantidad,
+# último id y eliminados) se vuelve a construir.
+
+def celda_grilla(latitud, longitud, limites, tam_celda, forma):
+    """(fila, col) del punto en la grilla de `limites`, o None si está afuera"""
+    sur, oeste, norte, este = limites
+    if not (sur <= latitud < norte and oeste <= longitud < este):
+        return None
+    return (
+        min(int(math.floor((latitud - sur) / tam_celda)), forma[0] - 1),
+        min(int(math.floor((longitud - oeste) / tam_celda)), forma[1] - 1)
+    )
+
+
+def bloque_grilla(latitud, longitud, radio, limites, tam_celda, forma):
+    """(slice de filas, slice de columnas) que cubren el cuadrado de lado 2*radio"""
+    sur, oeste, _, _ = limites
+    f0 = max(0, int(math.floor((latitud - radio - sur) / tam_celda)))
+    f1 = min(forma[0], int(math.floor((latitud + radio - sur) / tam_celda)) + 1)
+    c0 = max(0, int(math.floor((longitud - radio - oeste) / tam_celda)))
+    c1 = min(forma[1], int(math.floor((longitud + radio - oeste) / tam_celda)) + 1)
+    if f0 >= f1 or c0 >= c1:
+        return None
+    return slice(f0, f1), slice(c0, c1)
+
+
+class CuboRiesgo:
+
+    def __init__(self, conteos, limites, tam_celda, tipos):
+        self.conteos = conteos
+        self.limites = tuple(limites)
+        self.tam_celda = tam_celda
+        self.tipos = list(tipos)
+        self._indice_tipo = {tipo: i for i, tipo in enumerate(self.tipos)}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_reportes(cls, reportes):
+        """Cubo en memoria sumando reporte a reporte (lo usa verificar_cubo)"""
+        forma = cls.forma(Config.CUBO_LIMITES, Config.CUBO_TAM_CELDA, Config.CUBO_TIPOS)
+        cubo = cls(np.zeros(forma, dtype=np.uint32), Config.CUBO_LIMITES, Config.CUBO_TAM_CELDA, Config.CUBO_TIPOS)
+        for reporte in reportes:
+            cubo.sumar(reporte, 1)
+        return cubo
+
+    @staticmethod
+    def forma(limites, tam_celda, tipos):
+        sur, oeste, norte, este = limites
+        filas = math.ceil(round((norte - sur) / tam_celda, 9))
+        cols = math.ceil(round((este - oeste) / tam_celda, 9))
+        return (filas, cols, 7, 24, len(tipos) + 1)
+
+    def celda(self, latitud, longitud):
+        """(fila, col) de la grilla, o None si el punto está fuera de los límites"""
+        return celda_grilla(latitud, longitud, self.limites, self.tam_celda, self.conteos.shape)
+
+    def indice_tipo(self, tipo):
+        return self._indice_tipo.get(tipo, len(self.tipos))
+
+    def sumar(self, reporte, signo):
+        """Suma (signo=1) o resta (signo=-1) un reporte"""
+        celda = self.celda(float(reporte['latitud']), float(reporte['longitud']))
+        if celda is None:
+            return
+        fecha = reporte['fecha_incidente']
+        posicion = celda + (fecha.weekday(), fecha.hour, self.indice_tipo(reporte['tipo_robo']))
+        with self._lock:
+            if signo > 0:
+                self.conteos[posicion] += 1
+            elif self.conteos[posicion] > 0:
+                self.conteos[posicion] -= 1
+
+    def _bloque(self, latitud, longitud, radio):
+        rango = bloque_grilla(latitud, longitud, radio, self.limites, self.tam_celda, self.conteos.shape)
+        return None if rango is None else self.conteos[rango]
+
+    def contar(self, latitud, longitud, radio, dia_semana=None, hora=None, tipo=None):
+        """
+        Reportes en las celdas alrededor del punto, en el día / hora / tipo pedidos
+        (None = todos). El área es la de las celdas, no un círculo exacto.
+        """
+        bloque = self._bloque(latitud, longitud, radio)
+        if bloque is None:
+            return 0
+        seleccion = (
+            slice(None), slice(None),
+            slice(None) if dia_semana is None else dia_semana,
+            slice(None) if hora is None else hora,
+            slice(None) if tipo is None else self.indice_tipo(tipo)
+        )
+        return int(bloque[seleccion].sum(dtype=np.int64))
+
+    def perfil(self, latitud, longitud, radio, tipo=None):
+        """Matriz 7 x 24 (día, hora) de reportes alrededor del punto"""
+        bloque = self._bloque(latitud, longitud, radio)
+        if bloque is None:
+            return np.zeros((7, 24), dtype=np.int64)
+        if tipo is not None:
+            bloque = bloque[..., self.indice_tipo(tipo)]
+        else:
+            bloque = bloque.sum(axis=4, dtype=np.int64)
+        return bloque.sum(axis=(0, 1), dtype=np.int64)
+
+# CONSTRUCCIÓN Y ARCHIVO
+
+_SQL_CONTEOS = """
+    SELECT
+        floor((latitud::float8 - %(sur)s) / %(tam)s)::int AS fila,
+        floor((longitud::float8 - %(oeste)s) / %(tam)s)::int AS col,
+        EXTRACT(ISODOW FROM fecha_incidente)::int - 1 AS dia,
+        EXTRACT(HOUR FROM fecha_incidente)::int AS hora,
+        tipo_robo,
+        COUNT(*) AS cantidad
+    FROM reportes
+    WHERE latitud::float8 >= %(sur)s AND latitud::float8 < %(norte)s
+      AND longitud::float8 >= %(oeste)s AND longitud::float8 < %(este)s
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+def _configuracion():
+    return {
+        'limites': list(Config.CUBO_LIMITES),
+        'tam_celda': Config.CUBO_TAM_CELDA,
+        'tipos': list(Config.CUBO_TIPOS)
+    }
+
+
+def construir_cubo(archivo=None):
+    """
+    Cuenta los reportes en PostgreSQL y arma el cubo (en memoria, o en `archivo`
+    con su firma en `archivo`.json). Devuelve (CuboRiesgo, firma)
+    """
+    return db.en_instantanea(_construir_cubo, 'construyendo el cubo de riesgo', archivo) or (None, None)
+
+
+def _construir_cubo(cur, archivo):
+    """construir_cubo dentro de la transacción de cur: conteos y firma de la misma instantánea"""
+    configuracion = _configuracion()
+    sur, oeste, norte, este = configuracion['limites']
+    forma = CuboRiesgo.forma(configuracion['limites'], configuracion['tam_celda'], configuracion['tipos'])
+
+    firma = db.leer_firma_reportes(cur)
+    cur.execute(_SQL_CONTEOS, {
+        'sur': sur, 'oeste': oeste, 'norte': norte, 'este': este,
+        'tam': configuracion['tam_celda']
+    })
+    filas = cur.fetchall()
+
+    if archivo:
+        temporal = f"{archivo}.{os.getpid()}.tmp"
+        conteos = np.lib.format.open_memmap(temporal, mode='w+', dtype=np.uint32, shape=forma)
+    else:
+        conteos = np.zeros(forma, dtype=np.uint32)
+
+    cubo = CuboRiesgo(conteos, configuracion['limites'], configuracion['tam_celda'], configuracion['tipos'])
+    if filas:
+        fila, col, dia, hora, tipo, cantidad = zip(*filas)
+        indice = (
+            np.minimum(np.array(fila), forma[0] - 1),
+            np.minimum(np.array(col), forma[1] - 1),
+            np.array(dia), np.array(hora),
+            np.array([cubo.indice_tipo(t) for t in tipo])
+        )
+        np.add.at(conteos, indice, np.array(cantidad, dtype=np.uint32))
+
+    if archivo:
+        conteos.flush()
+        del conteos
+        os.replace(temporal, archivo)
+        temporal = f"{archivo}.json.{os.getpid()}.tmp"
+        with open(temporal, 'w') as meta:
+            json.dump(dict(configuracion, firma=firma), meta)
+        os.replace(temporal, f"{archivo}.json")
+        cubo.conteos = np.load(archivo, mmap_mode='c')
+    return cubo, firma
+
+
+def abrir_cubo(archivo):
+    """
+    Abre el cubo guardado si corresponde a la configuración y a la tabla actual;
+    si no, lo vuelve a construir. Devuelve (CuboRiesgo, firma)
+    """
+    return db.en_instantanea(_abrir_cubo, 'abriendo el cubo de riesgo', archivo) or (None, None)
+
+
+def _abrir_cubo(cur, archivo):
+    try:
+        with open(f"{archivo}.json") as meta:
+            guardado = json.load(meta)
+        firma = guardado.pop('firma')
+    except (OSError, ValueError, KeyError):
+        return _construir_cubo(cur, archivo)
+
+    if guardado != _configuracion() or db.leer_firma_reportes(cur) != firma:
+        return _construir_cubo(cur, archivo)
+    conteos = np.load(archivo, mmap_mode='c')
+    return CuboRiesgo(conteos, guardado['limites'], guardado['tam_celda'], guardado['tipos']), firma
+
+# CUBO DEL PROCESO
+
+_cubo = None
+_cubo_al_dia = False
+_cubo_lock = threading.RLock()        # una construcción a la vez
+_cubo_avisos = threading.Lock()       # publicación del cubo y avisos pendientes
+_cubo_pendientes = None               # avisos recibidos durante la construcción
+
+
+def obtener_cubo():
+    """El cubo de este proceso (None si NumPy no está instalado)"""
+    if np is None:
+        return None
+    with _cubo_lock:
+        if _cubo is None or not _cubo_al_dia:
+            _cargar_cubo()
+        return _cubo
+
+
+def _cargar_cubo():
+    """
+    Construye (o abre) el cubo y lo publica. Los avisos que llegan mientras
+    tanto se guardan y, antes de publicar, se concilian por id contra la misma
+    instantánea del cubo (db.conciliar_avisos): solo se suman los que no
+    estaban en ella. Con un lote ('recargar') en ese rato el cubo se publica
+    sin marcarlo al día y se vuelve a construir en el próximo uso.
+    """
+    global _cubo_pendientes
+    with _cubo_avisos:
+        _cubo_pendientes = []
+    try:
+        db.en_instantanea(_publicar_cubo, 'construyendo el cubo de riesgo')
+    finally:
+        with _cubo_avisos:
+            _cubo_pendientes = None
+
+
+def _publicar_cubo(cur):
+    global _cubo, _cubo_al_dia
+    if Config.CUBO_ARCHIVO:
+        nuevo, _ = _abrir_cubo(cur, Config.CUBO_ARCHIVO)
+    else:
+        nuevo, _ = _construir_cubo(cur, None)
+
+    with _cubo_avisos:
+        al_dia = not any(evento == 'recargar' for evento, _ in _cubo_pendientes)
+        if al_dia:
+            for reporte, signo in db.conciliar_avisos(cur, _cubo_pendientes):
+                nuevo.sumar(reporte, signo)
+        _cubo = nuevo
+        _cubo_al_dia = al_dia
+
+
+def _actualizar_cubo(evento, reporte):
+    """Mantiene el cubo al día con los avisos de database.py"""
+    global _cubo_al_dia
+    with _cubo_avisos:
+        if _cubo_pendientes is not None:
+            # Se aplica al cubo nuevo al publicarlo; el anterior ya no está al día
+            _cubo_pendientes.append((evento, reporte))
+            return
+        if evento == 'recargar':
+            _cubo_al_dia = False  # se vuelve a construir en el próximo uso
+            return
+        cubo = _cubo
+    if cubo is None:
+        return  # se construirá completo al primer uso
+    if evento == 'creado':
+        cubo.sumar(reporte, 1)
+    elif evento == 'eliminado':
+        cubo.sumar(reporte, -1)
+
+
+db.suscribir_cambios(_actualizar_cubo)
@@ -1,24 +1,393 @@
+import json
+import os
+import select
+import socket
+import threading
+import time
+from datetime import datetime
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor, execute_values
 from config import Config
+import serializacion
+
+# POOL DE CONEXIONES
+
+class PoolAgotado(Exception):
+    """Se lanza cuando no se libera ninguna conexión dentro del tiempo de espera"""
+    pass
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones acotado y seguro entre hilos
+    Mantiene como mínimo `minimo` conexiones abiertas y nunca más de `maximo`.
+    Si todas están ocupadas, quien pide una conexión espera hasta `timeout` segundos.
+    """
+    
+    def __init__(self, minimo, maximo, timeout=30, verificar_tras=30, **parametros):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.verificar_tras = verificar_tras
+        self._parametros = parametros
+        self._condicion = threading.Condition()
+        self._libres = []        # (conexion, momento en que se devolvió)
+        self._en_uso = set()     # id() de las conexiones prestadas
+        self._abiertas = 0       # libres + en uso + las que se están abriendo
+        self._esperando = 0
+        self._stats = {
+            'prestamos': 0,
+            'esperas': 0,
+            'tiempo_espera_total': 0.0,
+            'tiempo_espera_max': 0.0,
+            'agotado': 0,
+            'descartadas': 0
+        }
+        
+        # Abrir las conexiones mínimas; si la base no responde se abrirán bajo demanda
+        try:
+            for _ in range(minimo):
+                conn = self._abrir()
+                self._abiertas += 1
+                self._libres.append((conn, time.monotonic()))
+        except Exception as e:
+            print(f" No se pudieron abrir las conexiones iniciales del pool: {e}")
+    
+    def _abrir(self):
+        return psycopg2.connect(**self._parametros)
+    
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _saludable(self, conn, devuelta_en):
+        """Verifica la conexión antes de prestarla"""
+        if conn.closed:
+            return False
+        # Solo se hace el round trip si la conexión estuvo quieta un buen rato
+        if time.monotonic() - devuelta_en < self.verificar_tras:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+    
+    def obtener(self):
+        """Presta una conexión del pool (espera si están todas ocupadas)"""
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        
+        while True:
+            conn = None
+            devuelta_en = None
+            with self._condicion:
+                if not self._libres and self._abiertas >= self.maximo:
+                    self._esperando += 1
+                    try:
+                        while not self._libres and self._abiertas >= self.maximo:
+                            restante = limite - time.monotonic()
+                            if restante <= 0:
+                                self._stats['agotado'] += 1
+                                raise PoolAgotado(
+                                    f"No hay conexiones libres tras {self.timeout}s "
+                                    f"(máximo {self.maximo})"
+                                )
+                            self._condicion.wait(restante)
+                    finally:
+                        self._esperando -= 1
+                
+                if self._libres:
+                    conn, devuelta_en = self._libres.pop()
+                else:
+                    # Reservar el cupo antes de abrir fuera del lock
+                    self._abiertas += 1
+            
+            if conn is None:
+                try:
+                    conn = self._abrir()
+                except Exception:
+                    with self._condicion:
+                        self._abiertas -= 1
+                        self._condicion.notify()
+                    raise
+            elif not self._saludable(conn, devuelta_en):
+                self._cerrar(conn)
+                with self._condicion:
+                    self._abiertas -= 1
+                    self._stats['descartadas'] += 1
+                    self._condicion.notify()
+                continue
+            
+            espera = time.monotonic() - inicio
+            with self._condicion:
+                self._en_uso.add(id(conn))
+                self._stats['prestamos'] += 1
+                if espera > 0.001:
+                    self._stats['esperas'] += 1
+                self._stats['tiempo_espera_total'] += espera
+                self._stats['tiempo_espera_max'] = max(self._stats['tiempo_espera_max'], espera)
+            return conn
+    
+    def devolver(self, conn, descartar=False):
+        """Devuelve una conexión al pool, deshaciendo cualquier transacción a medias"""
+        if conn is None:
+            return
+        
+        with self._condicion:
+            if id(conn) not in self._en_uso:
+                return  # ya fue devuelta
+            self._en_uso.discard(id(conn))
+        
+        if not descartar and not conn.closed:
+            try:
+                estado = conn.get_transaction_status()
+                if estado == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    descartar = True
+                elif estado != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                descartar = True
+        else:
+            descartar = True
+        
+        with self._condicion:
+            if descartar:
+                self._abiertas -= 1
+                self._stats['descartadas'] += 1
+            else:
+                self._libres.append((conn, time.monotonic()))
+            self._condicion.notify()
+        
+        if descartar:
+            self._cerrar(conn)
+    
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool"""
+        with self._condicion:
+            libres = self._libres
+            self._libres = []
+            self._abiertas -= len(libres)
+        for conn, _ in libres:
+            self._cerrar(conn)
+    
+    def estadisticas(self):
+        """Estado actual del pool para monitoreo"""
+        with self._condicion:
+            stats = dict(self._stats)
+            prestamos = stats['prestamos']
+            stats.update({
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'abiertas': self._abiertas,
+                'en_uso': len(self._en_uso),
+                'libres': len(self._libres),
+                'esperando': self._esperando,
+                'tiempo_espera_promedio': stats['tiempo_espera_total'] / prestamos if prestamos else 0.0
+            })
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def obtener_pool():
+    """
+    Devuelve el pool compartido por todo el módulo (se crea al primer uso)
+    Cada proceso tiene su propio pool: si el proceso viene de un fork (workers
+    de gunicorn) las conexiones heredadas se abandonan sin cerrarlas, porque
+    sus sockets siguen siendo del proceso padre.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool_pid = os.getpid()
+                _pool = PoolConexiones(
+                    minimo=Config.DB_POOL_MIN,
+                    maximo=Config.DB_POOL_MAX,
+                    timeout=Config.DB_POOL_TIMEOUT,
+                    verificar_tras=Config.DB_POOL_VERIFICAR_TRAS,
+                    host=Config.DB_HOST,
+                    port=Config.DB_PORT,
+                    database=Config.DB_NAME,
+                    user=Config.DB_USER,
+                    password=Config.DB_PASSWORD
+                )
+    return _pool
+
+def cerrar_pool():
+    """Cierra el pool compartido (al apagar el servidor)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.cerrar()
+            _pool = None
+
+def obtener_estadisticas_pool():
+    """Estadísticas del pool: conexiones en uso, en espera y tiempos de espera"""
+    if _pool is None:
+        return {'minimo': Config.DB_POOL_MIN, 'maximo': Config.DB_POOL_MAX, 'abiertas': 0, 'en_uso': 0}
+    return _pool.estadisticas()
 
 # FUNCIÓN DE CONEXIÓN
 
 def get_connection():
-    """Obtiene una conexión a la base de datos PostgreSQL"""
+    """Obtiene una conexión del pool (hay que devolverla con liberar_conexion)"""
     try:
-        conn = psycopg2.connect(
-            host=Config.DB_HOST,
-            port=Config.DB_PORT,
-            database=Config.DB_NAME,
-            user=Config.DB_USER,
-            password=Config.DB_PASSWORD
-        )
-        return conn
+        return obtener_pool().obtener()
     except Exception as e:
         print(f"Error conectando a la base de datos: {e}")
         return None
 
+def liberar_conexion(conn):
+    """Devuelve al pool una conexión obtenida con get_connection"""
+    if conn is None:
+        return
+    if _pool is not None:
+        _pool.devolver(conn)
+    else:
+        conn.close()
+
+# AVISOS DE CAMBIOS EN REPORTES
+
+_suscriptores = []
+
+def suscribir_cambios(funcion):
+    """
+    Registra una función que se llama cada vez que se crea o elimina un reporte
+    La función recibe (evento, reporte) con evento 'creado' o 'eliminado', o
+    ('recargar', None) después de una inserción por lotes: cambiaron muchos
+    reportes a la vez y conviene invalidar o reconstruir todo de una vez
+    """
+    if funcion not in _suscriptores:
+        _suscriptores.append(funcion)
+    return funcion
+
+def _notificar_cambio(evento, reporte):
+    for funcion in list(_suscriptores):
+        try:
+            funcion(evento, reporte)
+        except Exception as e:
+            # Un suscriptor con errores no debe deshacer la escritura ya confirmada
+            print(f" Error notificando {evento} a {getattr(funcion, '__name__', funcion)}: {e}")
+
+# AVISOS ENTRE PROCESOS (LISTEN/NOTIFY)
+#
+# Cada escritura hace NOTIFY en su transacción: PostgreSQL lo entrega al
+# confirmarse a todos los procesos que escuchan (workers de gunicorn y el
+# servidor de eventos de app_async.py). Quien escucha pasa a sus suscriptores
+# locales los cambios hechos por otros procesos; los propios ya se avisaron.
+
+CANAL_CAMBIOS = 'reportes_cambios'
+
+# Campos del reporte que viajan en el aviso (NOTIFY admite hasta 8000 bytes)
+CAMPOS_AVISO = ('id', 'usuario_id', 'tipo_robo', 'latitud', 'longitud', 'fecha_incidente', 'fecha_creacion')
+
+_escucha_pid = None
+
+
+def _origen():
+    """Identifica a este proceso en los avisos (cambia después de un fork)"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def avisos_cambio(evento, reportes):
+    """Texto de un NOTIFY por reporte"""
+    origen = _origen()
+    return [
+        serializacion.dumps({
+            'evento': evento,
+            'origen': origen,
+            'reporte': {campo: reporte[campo] for campo in CAMPOS_AVISO}
+        }).decode()
+        for reporte in reportes
+    ]
+
+def aviso_recargar(cantidad):
+    """Texto del NOTIFY de una inserción por lotes (uno por lote, sin los reportes)"""
+    return serializacion.dumps({'evento': 'recargar', 'origen': _origen(), 'cantidad': cantidad}).decode()
+
+def _avisar_cambios(cur, evento, reportes):
+    """NOTIFY de los reportes escritos; se envía solo si la transacción se confirma"""
+    if reportes:
+        cur.execute(
+            "SELECT pg_notify(%s, aviso) FROM unnest(%s::text[]) AS aviso",
+            (CANAL_CAMBIOS, avisos_cambio(evento, reportes))
+        )
+
+def _avisar_recarga(cur, cantidad):
+    """Un solo NOTIFY 'recargar' por lote: quien escucha invalida o reconstruye una vez"""
+    if cantidad:
+        cur.execute("SELECT pg_notify(%s, %s)", (CANAL_CAMBIOS, aviso_recargar(cantidad)))
+
+def aplicar_aviso(texto):
+    """
+    Lee un aviso recibido con LISTEN y, si viene de otro proceso, lo pasa a
+    los suscriptores locales. Devuelve (evento, reporte) con las fechas como datetime
+    (reporte es None en los avisos 'recargar' de una inserción por lotes)
+    """
+    aviso = json.loads(texto)
+    if aviso['evento'] == 'recargar':
+        reporte = None
+    else:
+        reporte = aviso['reporte']
+        for campo in ('fecha_incidente', 'fecha_creacion'):
+            if reporte.get(campo):
+                reporte[campo] = datetime.fromisoformat(reporte[campo])
+    if aviso['origen'] != _origen():
+        _notificar_cambio(aviso['evento'], reporte)
+    return aviso['evento'], reporte
+
+def iniciar_escucha_cambios():
+    """
+    Escucha los avisos de otros procesos en un hilo con su propia conexión
+    (uno por proceso, no por cliente). Lo usa app.crear_app; app_async.py
+    escucha con asyncpg.
+    """
+    global _escucha_pid
+    with _pool_lock:
+        if _escucha_pid == os.getpid():
+            return
+        _escucha_pid = os.getpid()
+    threading.Thread(target=_escuchar_cambios, name='escucha-cambios', daemon=True).start()
+
+def _escuchar_cambios():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(
+                host=Config.DB_HOST,
+                port=Config.DB_PORT,
+                database=Config.DB_NAME,
+                user=Config.DB_USER,
+                password=Config.DB_PASSWORD
+            )
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CANAL_CAMBIOS}")
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    try:
+                        aplicar_aviso(conn.notifies.pop(0).payload)
+                    except (ValueError, KeyError) as e:
+                        print(f" Aviso de cambio inválido: {e}")
+        except Exception as e:
+            # Sin conexión se reintenta; mientras tanto solo se pierden avisos de otros procesos
+            print(f" Error escuchando cambios: {e}")
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
 # FUNCIONES PARA USUARIOS
 
 def crear_usuario(nombre, email, telefono, password_hash):
@@ -38,7 +407,6 @@ def crear_usuario(nombre, email, telefono, password_hash):
         nuevo_usuario = cur.fetchone()
         conn.commit()
         cur.close()
-        conn.close()
         
         print(f"Usuario creado: {nuevo_usuario['email']}")
         return nuevo_usuario
@@ -48,6 +416,8 @@ def crear_usuario(nombre, email, telefono, password_hash):
     except Exception as e:
         print(f" Error creando usuario: {e}")
         return None
+    finally:
+        liberar_conexion(conn)
 
 def obtener_usuario_por_email(email):
     """Obtiene un usuario por su email"""
@@ -63,12 +433,13 @@ def obtener_usuario_por_email(email):
         
         usuario = cur.fetchone()
         cur.close()
-        conn.close()
         
         return usuario
     except Exception as e:
         print(f"Error obteniendo usuario: {e}")
         return None
+    finally:
+        liberar_conexion(conn)
 
 def obtener_usuario_por_id(usuario_id):
     """Obtiene un usuario por su ID"""
@@ -85,12 +456,13 @@ def obtener_usuario_por_id(usuario_id):
         
         usuario = cur.fetchone()
         cur.close()
-        conn.close()
         
         return usuario
     except Exception as e:
         print(f" Error obteniendo usuario: {e}")
         return None
+    finally:
+        liberar_conexion(conn)
 
 def obtener_todos_usuarios():
     """Obtiene todos los usuarios de la base de datos"""
@@ -108,12 +480,13 @@ def obtener_todos_usuarios():
         
         usuarios = cur.fetchall()
         cur.close()
-        conn.close()
         
         return usuarios
     except Exception as e:
         print(f" Error obteniendo usuarios: {e}")
         return []
+    finally:
+        liberar_conexion(conn)
 
 # FUNCIONES PARA REPORTES
 
@@ -133,21 +506,27 @@ def crear_reporte(usuario_id, tipo_robo, descripcion, latitud, longitud, fecha_i
         """, (usuario_id, tipo_robo, descripcion, latitud, longitud, fecha_incidente, barrio))
         
         nuevo_reporte = cur.fetchone()
+        _avisar_cambios(cur, 'creado', [nuevo_reporte])
         conn.commit()
         cur.close()
-        conn.close()
         
         print(f" Reporte creado: ID {nuevo_reporte['id']} por usuario {usuario_id}")
+        _notificar_cambio('creado', nuevo_reporte)
         return nuevo_reporte
     except Exception as e:
         print(f" Error creando reporte: {e}")
         return None
+    finally:
+        liberar_conexion(conn)
 
 def obtener_todos_reportes():
-    """Obtiene todos los reportes de la base de datos"""
+    """
+    Obtiene todos los reportes de la base de datos
+    Devuelve None si la consulta falla (distinto de una tabla vacía)
+    """
     conn = get_connection()
     if not conn:
-        return []
+        return None
     
     try:
         cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -163,15 +542,453 @@ def obtener_todos_reportes():
                 fecha_creacion,
                 barrio
             FROM reportes 
-            ORDER BY fecha_creacion DESC
+            ORDER BY fecha_creacion DESC, id DESC
         """)
         reportes = cur.fetchall()
         cur.close()
-        conn.close()
         return reportes
     except Exception as e:
         print(f" Error obteniendo reportes: {e}")
+        return None
+    finally:
+        liberar_conexion(conn)
+
+def obtener_reportes_pagina(limite, cursor=None, filtros=None, con_usuarios=False, compacto=False):
+    """
+    Obtiene una página de reportes con paginación keyset sobre (fecha_creacion, id)
+    cursor: (fecha_creacion, id) del último reporte de la página anterior
+    filtros: dict opcional con
+        bbox: (oeste, sur, este, norte) en grados
+        desde / hasta: rango de fecha_incidente (ambos incluidos)
+        antes_de: fecha_incidente estrictamente anterior (hasta sin hora, ver rutas.leer_filtros_reportes)
+        tipo_robo: tipo exacto
+    con_usuarios: agrega el nombre del usuario que hizo el reporte
+    compacto: solo las columnas que usa el mapa (sin descripción, barrio ni usuario)
+    Devuelve (reportes, siguiente_cursor); siguiente_cursor es None en la última página
+    """
+    conn = get_connection()
+    if not conn:
+        return [], None
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        condiciones, params = _condiciones_filtros(filtros)
+        if cursor:
+            condiciones.append("(r.fecha_creacion, r.id) < (%s, %s)")
+            params.extend(cursor)
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        
+        columnas = """
+                r.id, 
+                r.usuario_id,
+                r.tipo_robo, 
+                r.descripcion, 
+                r.latitud, 
+                r.longitud, 
+                r.fecha_incidente, 
+                r.fecha_creacion,
+                r.barrio"""
+        join_usuario = ""
+        if compacto:
+            columnas = "r.id, r.tipo_robo, r.latitud, r.longitud, r.fecha_incidente, r.fecha_creacion"
+        elif con_usuarios:
+            columnas += ", u.nombre AS usuario_nombre"
+            join_usuario = "INNER JOIN usuarios u ON r.usuario_id = u.id"
+        
+        # Se pide un reporte de más para saber si hay otra página
+        params.append(limite + 1)
+        cur.execute(f"""
+            SELECT {columnas}
+            FROM reportes r
+            {join_usuario}
+            {where}
+            ORDER BY r.fecha_creacion DESC, r.id DESC
+            LIMIT %s
+        """, params)
+        reportes = cur.fetchall()
+        cur.close()
+        
+        siguiente = None
+        if len(reportes) > limite:
+            reportes = reportes[:limite]
+            siguiente = (reportes[-1]['fecha_creacion'], reportes[-1]['id'])
+        return reportes, siguiente
+    except Exception as e:
+        print(f" Error obteniendo página de reportes: {e}")
+        return [], None
+    finally:
+        liberar_conexion(conn)
+
+# Cambia con cada reporte creado o eliminado: cantidad, último id y eliminados
+# (la usan los archivos y estructuras derivados de la tabla, ver cubo.py y columnas_disco.py)
+SQL_FIRMA_REPORTES = """
+    SELECT
+        (SELECT COUNT(*) FROM reportes) AS cantidad,
+        (SELECT COALESCE(MAX(id), 0) FROM reportes) AS ultimo_id,
+        (SELECT COUNT(*) FROM reportes_cambios WHERE eliminado) AS eliminados
+"""
+
+# Sin reportes_cambios (todavía no se ejecutó "python comandos.py esquema"):
+# cantidad y último id alcanzan para notar cualquier cambio que no se anule,
+# porque los ids solo crecen
+SQL_FIRMA_REPORTES_SIN_CAMBIOS = """
+    SELECT
+        (SELECT COUNT(*) FROM reportes) AS cantidad,
+        (SELECT COALESCE(MAX(id), 0) FROM reportes) AS ultimo_id,
+        NULL AS eliminados
+"""
+
+_firma_sin_cambios_avisada = False
+
+def leer_firma_reportes(cur):
+    """
+    [cantidad, último id, eliminados] con un cursor sin RealDictCursor, dentro de
+    su transacción (así sale de la misma instantánea que lo que se lea después)
+    Sin la tabla reportes_cambios, eliminados es None
+    """
+    global _firma_sin_cambios_avisada
+    cur.execute("SAVEPOINT firma_reportes")
+    try:
+        cur.execute(SQL_FIRMA_REPORTES)
+    except psycopg2.errors.UndefinedTable:
+        cur.execute("ROLLBACK TO SAVEPOINT firma_reportes")
+        if not _firma_sin_cambios_avisada:
+            _firma_sin_cambios_avisada = True
+            print(" Tabla reportes_cambios no encontrada (falta \"python comandos.py esquema\"), "
+                  "la firma de los reportes no cuenta los eliminados")
+        cur.execute(SQL_FIRMA_REPORTES_SIN_CAMBIOS)
+    firma = list(cur.fetchone())
+    cur.execute("RELEASE SAVEPOINT firma_reportes")
+    return firma
+
+def obtener_firma_reportes():
+    """[cantidad, último id, eliminados] de la tabla reportes, o None si falla"""
+    conn = get_connection()
+    if not conn:
+        return None
+    
+    try:
+        cur = conn.cursor()
+        firma = leer_firma_reportes(cur)
+        conn.commit()
+        cur.close()
+        return firma
+    except Exception as e:
+        conn.rollback()
+        print(f" Error leyendo la firma de los reportes: {e}")
+        return None
+    finally:
+        liberar_conexion(conn)
+
+def en_instantanea(funcion, descripcion, *args):
+    """
+    funcion(cur, *args) dentro de una transacción REPEATABLE READ (todas sus
+    consultas ven la misma instantánea), con un cursor sin RealDictCursor
+    Devuelve su resultado, o None si falla (se imprime con `descripcion`)
+    """
+    conn = get_connection()
+    if not conn:
+        return None
+    
+    try:
+        cur = conn.cursor()
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        resultado = funcion(cur, *args)
+        conn.commit()
+        cur.close()
+        return resultado
+    except Exception as e:
+        conn.rollback()
+        print(f" Error {descripcion}: {e}")
+        return None
+    finally:
+        liberar_conexion(conn)
+
+def conciliar_avisos(cur, avisos):
+    """
+    Avisos 'creado' / 'eliminado' recibidos mientras se armaba algo a partir de
+    la instantánea de cur, reducidos a los (reporte, signo) que le faltan
+    Por id, el último aviso dice si el reporte existe y la instantánea si ya
+    estaba contado: un aviso de algo confirmado antes de la instantánea no se
+    cuenta dos veces, y crear y eliminar el mismo reporte en ese rato se anula
+    """
+    ultimos = {}
+    for evento, reporte in avisos:
+        if evento in ('creado', 'eliminado'):
+            ultimos[reporte['id']] = (evento, reporte)
+    if not ultimos:
         return []
+    
+    cur.execute("SELECT id FROM reportes WHERE id = ANY(%s)", (list(ultimos),))
+    contados = {fila[0] for fila in cur.fetchall()}
+    faltantes = []
+    for reporte_id, (evento, reporte) in ultimos.items():
+        existe = evento == 'creado'
+        if existe != (reporte_id in contados):
+            faltantes.append((reporte, 1 if existe else -1))
+    return faltantes
+
+def obtener_cambios_reportes(version=None, fecha=None, limite=None):
+    """
+    Reportes creados y eliminados desde una versión (sincronización incremental)
+    version: la devuelta por la llamada anterior; es el xmin de la instantánea
+    de PostgreSQL, así que todas las transacciones anteriores ya terminaron y
+    ningún cambio se pierde aunque se confirme en otro orden (alguno puede
+    repetirse: los clientes aplican los cambios por id)
+    fecha: alternativa aproximada a version (hora del último cambio)
+    Sin version ni fecha, o con más de `limite` cambios, devuelve recargar=True:
+    el cliente carga todo con GET /api/reportes y sigue desde la versión devuelta
+    """
+    if limite is None:
+        limite = Config.MAX_CAMBIOS_SINCRONIZACION
+    conn = get_connection()
+    if not conn:
+        return None
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text AS version")
+        cambios = {
+            'version': int(cur.fetchone()['version']),
+            'creados': [],
+            'eliminados': [],
+            'recargar': version is None and fecha is None
+        }
+        if cambios['recargar']:
+            cur.close()
+            return cambios
+        
+        if version is not None:
+            condicion, desde = "c.version >= %s::xid8", str(version)
+        else:
+            condicion, desde = "c.fecha >= %s", fecha
+        
+        cur.execute(f"""
+            SELECT 
+                c.id,
+                c.eliminado,
+                r.usuario_id,
+                r.tipo_robo, 
+                r.descripcion, 
+                r.latitud, 
+                r.longitud, 
+                r.fecha_incidente, 
+                r.fecha_creacion,
+                r.barrio,
+                u.nombre AS usuario_nombre
+            FROM reportes_cambios c
+            LEFT JOIN reportes r ON r.id = c.id
+            LEFT JOIN usuarios u ON u.id = r.usuario_id
+            WHERE {condicion}
+            ORDER BY c.version, c.id
+            LIMIT %s
+        """, (desde, limite + 1))
+        filas = cur.fetchall()
+        cur.close()
+        
+        if len(filas) > limite:
+            cambios['recargar'] = True
+            return cambios
+        for fila in filas:
+            # Una lápida, o un reporte eliminado después de tomar la versión
+            if fila.pop('eliminado') or fila['tipo_robo'] is None:
+                cambios['eliminados'].append(fila['id'])
+            else:
+                cambios['creados'].append(fila)
+        return cambios
+    except Exception as e:
+        print(f" Error obteniendo cambios de reportes: {e}")
+        return None
+    finally:
+        liberar_conexion(conn)
+
+def _condiciones_filtros(filtros):
+    """Traduce los filtros de la API a condiciones SQL (tabla reportes con alias r)"""
+    condiciones = []
+    params = []
+    if not filtros:
+        return condiciones, params
+    
+    if filtros.get('bbox'):
+        oeste, sur, este, norte = filtros['bbox']
+        condiciones.append("r.latitud BETWEEN %s AND %s AND r.longitud BETWEEN %s AND %s")
+        params.extend([sur, norte, oeste, este])
+    if filtros.get('desde'):
+        condiciones.append("r.fecha_incidente >= %s")
+        params.append(filtros['desde'])
+    if filtros.get('hasta'):
+        condiciones.append("r.fecha_incidente <= %s")
+        params.append(filtros['hasta'])
+    if filtros.get('antes_de'):
+        condiciones.append("r.fecha_incidente < %s")
+        params.append(filtros['antes_de'])
+    if filtros.get('tipo_robo'):
+        condiciones.append("r.tipo_robo = %s")
+        params.append(filtros['tipo_robo'])
+    
+    return condiciones, params
+
+def obtener_clusters_bbox(bbox, divisiones):
+    """
+    Agrupa en PostgreSQL los reportes de un bbox en una grilla de divisiones x divisiones
+    bbox: (oeste, sur, este, norte); el borde este/norte es abierto para que
+    teselas vecinas no cuenten dos veces el mismo reporte
+    Devuelve None si la consulta falla (distinto de una zona sin reportes)
+    """
+    conn = get_connection()
+    if not conn:
+        return None
+    
+    oeste, sur, este, norte = bbox
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("""
+            SELECT 
+                LEAST(FLOOR((longitud - %(oeste)s) / %(ancho)s), %(ultima)s) AS columna,
+                LEAST(FLOOR((%(norte)s - latitud) / %(alto)s), %(ultima)s) AS fila,
+                COUNT(*) AS cantidad,
+                AVG(latitud) AS latitud,
+                AVG(longitud) AS longitud,
+                MODE() WITHIN GROUP (ORDER BY tipo_robo) AS tipo_mas_comun
+            FROM reportes
+            WHERE latitud >= %(sur)s AND latitud < %(norte)s
+              AND longitud >= %(oeste)s AND longitud < %(este)s
+            GROUP BY columna, fila
+        """, {
+            'oeste': oeste,
+            'sur': sur,
+            'este': este,
+            'norte': norte,
+            'ancho': (este - oeste) / divisiones,
+            'alto': (norte - sur) / divisiones,
+            'ultima': divisiones - 1
+        })
+        
+        clusters = cur.fetchall()
+        cur.close()
+        
+        return clusters
+    except Exception as e:
+        print(f" Error agrupando reportes: {e}")
+        return None
+    finally:
+        liberar_conexion(conn)
+
+def obtener_coordenadas_bbox(bbox):
+    """
+    Solo las coordenadas (lat, lng) de los reportes dentro de un bbox (oeste, sur, este, norte)
+    Devuelve None si la consulta falla (distinto de una zona sin reportes)
+    """
+    conn = get_connection()
+    if not conn:
+        return None
+    
+    oeste, sur, este, norte = bbox
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT latitud::float8, longitud::float8
+            FROM reportes
+            WHERE latitud BETWEEN %s AND %s AND longitud BETWEEN %s AND %s
+        """, (sur, norte, oeste, este))
+        
+        coordenadas = cur.fetchall()
+        cur.close()
+        
+        return coordenadas
+    except Exception as e:
+        print(f" Error obteniendo coordenadas: {e}")
+        return None
+    finally:
+        liberar_conexion(conn)
+
+def insertar_reportes_lote(filas):
+    """
+    Inserta muchos reportes en una sola transacción
+    filas: lista de tuplas (usuario_id, tipo_robo, descripcion, latitud, longitud, fecha_incidente, barrio)
+    Devuelve (insertados, errores) donde errores es [(posicion_en_filas, mensaje), ...].
+    Si el lote falla completo se reintenta fila por fila con SAVEPOINT para saber cuáles fallan.
+    """
+    conn = get_connection()
+    if not conn:
+        return 0, [(i, 'Sin conexión a la base de datos') for i in range(len(filas))]
+    
+    sql = """
+        INSERT INTO reportes
+        (usuario_id, tipo_robo, descripcion, latitud, longitud, fecha_incidente, barrio)
+        VALUES %s
+        RETURNING id, usuario_id, tipo_robo, latitud, longitud, fecha_incidente, fecha_creacion
+    """
+    
+    try:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        errores = []
+        try:
+            nuevos = execute_values(cur, sql, filas, page_size=len(filas) or 1, fetch=True)
+        except psycopg2.Error:
+            conn.rollback()
+            nuevos = []
+            for i, fila in enumerate(filas):
+                cur.execute("SAVEPOINT fila")
+                try:
+                    nuevos.extend(execute_values(cur, sql, [fila], fetch=True))
+                    cur.execute("RELEASE SAVEPOINT fila")
+                except psycopg2.Error as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT fila")
+                    errores.append((i, e.diag.message_primary or str(e).strip()))
+        
+        _avisar_recarga(cur, len(nuevos))
+        conn.commit()
+        cur.close()
+        
+        # Un solo aviso por lote: con miles de filas es más barato reconstruir que
+        # aplicar cada reporte en cada suscriptor
+        if nuevos:
+            _notificar_cambio('recargar', None)
+        return len(nuevos), errores
+    except Exception as e:
+        print(f" Error insertando lote de reportes: {e}")
+        return 0, [(i, str(e)) for i in range(len(filas))]
+    finally:
+        liberar_conexion(conn)
+
+def iterar_reportes(tamano_lote=1000):
+    """
+    Recorre todos los reportes con un cursor con nombre (del lado del servidor)
+    Solo hay `tamano_lote` filas en memoria a la vez, sin importar el tamaño de la tabla.
+    La conexión vuelve al pool cuando el generador termina o se cierra.
+    Un error a mitad de camino se propaga: quien transmite ya envió parte de las filas
+    """
+    conn = get_connection()
+    if not conn:
+        raise ConnectionError('No hay conexión a la base de datos')
+    
+    try:
+        cur = conn.cursor(name='iterar_reportes', cursor_factory=RealDictCursor)
+        cur.itersize = tamano_lote
+        cur.execute("""
+            SELECT 
+                id, 
+                usuario_id,
+                tipo_robo, 
+                descripcion, 
+                latitud, 
+                longitud, 
+                fecha_incidente, 
+                fecha_creacion,
+                barrio
+            FROM reportes 
+            ORDER BY fecha_creacion DESC, id DESC
+        """)
+        for reporte in cur:
+            yield reporte
+        cur.close()
+    except Exception as e:
+        print(f" Error recorriendo reportes: {e}")
+        raise
+    finally:
+        liberar_conexion(conn)
 
 def obtener_reportes_con_usuarios():
     """Obtiene todos los reportes con información del usuario que los creó"""
@@ -202,12 +1019,13 @@ def obtener_reportes_con_usuarios():
         
         reportes = cur.fetchall()
         cur.close()
-        conn.close()
         
         return reportes
     except Exception as e:
         print(f" Error obteniendo reportes con usuarios: {e}")
         return []
+    finally:
+        liberar_conexion(conn)
 
 def obtener_reportes_por_usuario(usuario_id):
     """Obtiene todos los reportes de un usuario específico"""
@@ -226,12 +1044,13 @@ def obtener_reportes_por_usuario(usuario_id):
         
         reportes = cur.fetchall()
         cur.close()
-        conn.close()
         
         return reportes
     except Exception as e:
         print(f" Error obteniendo reportes del usuario: {e}")
         return []
+    finally:
+        liberar_conexion(conn)
 
 def obtener_reporte_por_id(reporte_id):
     """Obtiene un reporte específico por su ID"""
@@ -253,108 +1072,213 @@ def obtener_reporte_por_id(reporte_id):
         
         reporte = cur.fetchone()
         cur.close()
-        conn.close()
         
         return reporte
     except Exception as e:
         print(f" Error obteniendo reporte: {e}")
         return None
+    finally:
+        liberar_conexion(conn)
 
 # FUNCIONES PARA ESTADÍSTICAS
 
 def obtener_estadisticas():
-    """Obtiene estadísticas generales de los reportes"""
+    """
+    Obtiene estadísticas generales de los reportes
+    Se leen de las tablas de resumen (estadisticas_*) que mantienen los triggers
+    de reportes y usuarios, así que es una sola consulta barata
+    Devuelve None si la consulta falla
+    """
     conn = get_connection()
     if not conn:
-        return {}
+        return None
     
     try:
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
-        # Total de reportes
-        cur.execute("SELECT COUNT(*) as total FROM reportes")
-        total = cur.fetchone()['total']
+        try:
+            cur.execute("""
+                SELECT
+                    COALESCE((SELECT cantidad FROM estadisticas_totales WHERE clave = 'reportes'), 0) AS total_reportes,
+                    COALESCE((SELECT cantidad FROM estadisticas_totales WHERE clave = 'usuarios'), 0) AS total_usuarios,
+                    COALESCE((SELECT cantidad FROM estadisticas_por_dia WHERE dia = CURRENT_DATE), 0) AS reportes_hoy,
+                    COALESCE((
+                        SELECT SUM(cantidad)::bigint FROM estadisticas_por_dia
+                        WHERE dia >= CURRENT_DATE - 7
+                    ), 0) AS reportes_semana,
+                    COALESCE((
+                        SELECT json_agg(json_build_object('tipo_robo', tipo_robo, 'cantidad', cantidad)
+                                        ORDER BY cantidad DESC)
+                        FROM estadisticas_por_tipo
+                    ), '[]'::json) AS por_tipo,
+                    COALESCE((
+                        SELECT json_build_object('nombre', u.nombre, 'email', u.email, 'total_reportes', e.cantidad)
+                        FROM estadisticas_por_usuario e
+                        INNER JOIN usuarios u ON u.id = e.usuario_id
+                        ORDER BY e.cantidad DESC
+                        LIMIT 1
+                    ), (
+                        SELECT json_build_object('nombre', nombre, 'email', email, 'total_reportes', 0)
+                        FROM usuarios
+                        LIMIT 1
+                    )) AS usuario_mas_activo
+            """)
+        except psycopg2.errors.UndefinedTable:
+            # Todavía no se ejecutó "python comandos.py esquema"
+            conn.rollback()
+            print(" Tablas de estadísticas no encontradas, calculando directamente")
+            return _calcular_estadisticas(cur)
         
-        # Total de usuarios
-        cur.execute("SELECT COUNT(*) as total_usuarios FROM usuarios")
-        total_usuarios = cur.fetchone()['total_usuarios']
+        stats = dict(cur.fetchone())
+        cur.close()
         
-        # Reportes por tipo
+        return stats
+    except Exception as e:
+        print(f" Error obteniendo estadísticas: {e}")
+        return None
+    finally:
+        liberar_conexion(conn)
+
+def _calcular_estadisticas(cur):
+    """Calcula las estadísticas recorriendo las tablas (sin tablas de resumen)"""
+    # Total de reportes
+    cur.execute("SELECT COUNT(*) as total FROM reportes")
+    total = cur.fetchone()['total']
+    
+    # Total de usuarios
+    cur.execute("SELECT COUNT(*) as total_usuarios FROM usuarios")
+    total_usuarios = cur.fetchone()['total_usuarios']
+    
+    # Reportes por tipo
+    cur.execute("""
+        SELECT tipo_robo, COUNT(*) as cantidad 
+        FROM reportes 
+        GROUP BY tipo_robo
+        ORDER BY cantidad DESC
+    """)
+    por_tipo = cur.fetchall()
+    
+    # Reportes de hoy
+    cur.execute("""
+        SELECT COUNT(*) as hoy 
+        FROM reportes 
+        WHERE fecha_creacion >= CURRENT_DATE AND fecha_creacion < CURRENT_DATE + 1
+    """)
+    hoy = cur.fetchone()['hoy']
+    
+    # Reportes de esta semana
+    cur.execute("""
+        SELECT COUNT(*) as semana
+        FROM reportes 
+        WHERE fecha_creacion >= CURRENT_DATE - INTERVAL '7 days'
+    """)
+    semana = cur.fetchone()['semana']
+    
+    # Usuario con más reportes
+    cur.execute("""
+        SELECT 
+            u.nombre,
+            u.email,
+            COUNT(r.id) as total_reportes
+        FROM usuarios u
+        LEFT JOIN reportes r ON u.id = r.usuario_id
+        GROUP BY u.id, u.nombre, u.email
+        ORDER BY total_reportes DESC
+        LIMIT 1
+    """)
+    usuario_mas_activo = cur.fetchone()
+    
+    cur.close()
+    
+    return {
+        'total_reportes': total,
+        'total_usuarios': total_usuarios,
+        'reportes_hoy': hoy,
+        'reportes_semana': semana,
+        'por_tipo': por_tipo,
+        'usuario_mas_activo': usuario_mas_activo
+    }
+
+def refrescar_estadisticas():
+    """
+    Reconstruye desde cero las tablas de resumen de estadísticas
+    Bloquea las escrituras en reportes y usuarios mientras se recalcula
+    """
+    conn = get_connection()
+    if not conn:
+        return False
+    
+    try:
+        cur = conn.cursor()
+        cur.execute("LOCK TABLE reportes, usuarios IN SHARE MODE")
         cur.execute("""
-            SELECT tipo_robo, COUNT(*) as cantidad 
-            FROM reportes 
-            GROUP BY tipo_robo
-            ORDER BY cantidad DESC
+            TRUNCATE estadisticas_totales, estadisticas_por_tipo,
+                     estadisticas_por_dia, estadisticas_por_usuario
         """)
-        por_tipo = cur.fetchall()
-        
-        # Reportes de hoy
         cur.execute("""
-            SELECT COUNT(*) as hoy 
-            FROM reportes 
-            WHERE DATE(fecha_creacion) = CURRENT_DATE
+            INSERT INTO estadisticas_totales (clave, cantidad)
+            SELECT 'reportes', COUNT(*) FROM reportes
+            UNION ALL
+            SELECT 'usuarios', COUNT(*) FROM usuarios
         """)
-        hoy = cur.fetchone()['hoy']
-        
-        # Reportes de esta semana
         cur.execute("""
-            SELECT COUNT(*) as semana
-            FROM reportes 
-            WHERE fecha_creacion >= CURRENT_DATE - INTERVAL '7 days'
+            INSERT INTO estadisticas_por_tipo (tipo_robo, cantidad)
+            SELECT tipo_robo, COUNT(*) FROM reportes GROUP BY tipo_robo
         """)
-        semana = cur.fetchone()['semana']
-        
-        # Usuario con más reportes
         cur.execute("""
-            SELECT 
-                u.nombre,
-                u.email,
-                COUNT(r.id) as total_reportes
-            FROM usuarios u
-            LEFT JOIN reportes r ON u.id = r.usuario_id
-            GROUP BY u.id, u.nombre, u.email
-            ORDER BY total_reportes DESC
-            LIMIT 1
+            INSERT INTO estadisticas_por_dia (dia, cantidad)
+            SELECT fecha_creacion::date, COUNT(*) FROM reportes GROUP BY fecha_creacion::date
         """)
-        usuario_mas_activo = cur.fetchone()
-        
+        cur.execute("""
+            INSERT INTO estadisticas_por_usuario (usuario_id, cantidad)
+            SELECT usuario_id, COUNT(*) FROM reportes
+            WHERE usuario_id IS NOT NULL
+            GROUP BY usuario_id
+        """)
+        conn.commit()
         cur.close()
-        conn.close()
         
-        return {
-            'total_reportes': total,
-            'total_usuarios': total_usuarios,
-            'reportes_hoy': hoy,
-            'reportes_semana': semana,
-            'por_tipo': por_tipo,
-            'usuario_mas_activo': usuario_mas_activo
-        }
+        print(" Estadísticas reconstruidas")
+        return True
     except Exception as e:
-        print(f" Error obteniendo estadísticas: {e}")
-        return {}
+        print(f" Error reconstruyendo estadísticas: {e}")
+        return False
+    finally:
+        liberar_conexion(conn)
 
 # FUNCIONES AUXILIARES
 
 def eliminar_reporte(reporte_id):
-    """Elimina un reporte por su ID"""
+    """
+    Elimina un reporte por su ID
+    El trigger trg_cambios_delete deja una lápida en reportes_cambios
+    para que obtener_cambios_reportes avise a los clientes
+    """
     conn = get_connection()
     if not conn:
         return False
     
     try:
-        cur = conn.cursor()
-        cur.execute("DELETE FROM reportes WHERE id = %s", (reporte_id,))
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        cur.execute("""
+            DELETE FROM reportes WHERE id = %s
+            RETURNING id, usuario_id, tipo_robo, latitud, longitud, fecha_incidente, fecha_creacion
+        """, (reporte_id,))
+        reporte = cur.fetchone()
+        _avisar_cambios(cur, 'eliminado', [reporte] if reporte else [])
         conn.commit()
-        eliminado = cur.rowcount > 0
         cur.close()
-        conn.close()
         
+        eliminado = reporte is not None
         if eliminado:
             print(f" Reporte {reporte_id} eliminado")
+            _notificar_cambio('eliminado', reporte)
         return eliminado
     except Exception as e:
         print(f" Error eliminando reporte: {e}")
         return False
+    finally:
+        liberar_conexion(conn)
 
 def actualizar_usuario(usuario_id, nombre=None, telefono=None):
     """Actualiza la información de un usuario"""
@@ -385,13 +1309,213 @@ def actualizar_usuario(usuario_id, nombre=None, telefono=None):
         usuario_actualizado = cur.fetchone()
         conn.commit()
         cur.close()
-        conn.close()
     
         print(f" Usuario {usuario_id} actualizado")
         return usuario_actualizado
     except Exception as e:
         print(f" Error actualizando usuario: {e}")
         return None
+    finally:
+        liberar_conexion(conn)
+
+# ESQUEMA E ÍNDICES
+
+# Sentencias idempotentes que se aplican sobre las tablas usuarios y reportes
+ESQUEMA = [
+    # Consultas por zona del mapa (bbox)
+    "CREATE INDEX IF NOT EXISTS idx_reportes_ubicacion ON reportes (latitud, longitud)",
+    # Filtros por rango de fechas del incidente
+    "CREATE INDEX IF NOT EXISTS idx_reportes_fecha_incidente ON reportes (fecha_incidente)",
+    "CREATE INDEX IF NOT EXISTS idx_reportes_tipo_fecha ON reportes (tipo_robo, fecha_incidente)",
+    # Paginación keyset de GET /api/reportes
+    "CREATE INDEX IF NOT EXISTS idx_reportes_creacion_id ON reportes (fecha_creacion DESC, id DESC)",
+    
+    # Sincronización incremental (obtener_cambios_reportes): la última transacción
+    # que escribió cada reporte; los eliminados quedan como lápidas (eliminado = TRUE)
+    """
+    CREATE TABLE IF NOT EXISTS reportes_cambios (
+        id INTEGER PRIMARY KEY,
+        version xid8 NOT NULL DEFAULT pg_current_xact_id(),
+        eliminado BOOLEAN NOT NULL DEFAULT FALSE,
+        fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_reportes_cambios_version ON reportes_cambios (version)",
+    "CREATE INDEX IF NOT EXISTS idx_reportes_cambios_fecha ON reportes_cambios (fecha)",
+    """
+    CREATE OR REPLACE FUNCTION cambios_reportes() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            INSERT INTO reportes_cambios (id, eliminado)
+            SELECT id, TRUE FROM viejas
+            ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, eliminado = TRUE, fecha = EXCLUDED.fecha;
+        ELSE
+            INSERT INTO reportes_cambios (id)
+            SELECT id FROM nuevas
+            ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, eliminado = FALSE, fecha = EXCLUDED.fecha;
+        END IF;
+        RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_cambios_insert ON reportes",
+    """
+    CREATE TRIGGER trg_cambios_insert AFTER INSERT ON reportes
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION cambios_reportes()
+    """,
+    "DROP TRIGGER IF EXISTS trg_cambios_update ON reportes",
+    """
+    CREATE TRIGGER trg_cambios_update AFTER UPDATE ON reportes
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION cambios_reportes()
+    """,
+    "DROP TRIGGER IF EXISTS trg_cambios_delete ON reportes",
+    """
+    CREATE TRIGGER trg_cambios_delete AFTER DELETE ON reportes
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION cambios_reportes()
+    """,
+    # Reportes anteriores a los triggers
+    """
+    INSERT INTO reportes_cambios (id, fecha)
+    SELECT id, fecha_creacion FROM reportes
+    ON CONFLICT (id) DO NOTHING
+    """,
+    
+    # Tablas de resumen para obtener_estadisticas (se llenan con refrescar_estadisticas)
+    """
+    CREATE TABLE IF NOT EXISTS estadisticas_totales (
+        clave VARCHAR(30) PRIMARY KEY,
+        cantidad BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estadisticas_por_tipo (
+        tipo_robo VARCHAR(50) PRIMARY KEY,
+        cantidad BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estadisticas_por_dia (
+        dia DATE PRIMARY KEY,
+        cantidad BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estadisticas_por_usuario (
+        usuario_id INTEGER PRIMARY KEY,
+        cantidad BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_estadisticas_por_usuario_cantidad ON estadisticas_por_usuario (cantidad DESC)",
+    
+    # Triggers por sentencia: un INSERT/COPY de muchas filas actualiza el resumen una sola vez
+    """
+    CREATE OR REPLACE FUNCTION estadisticas_reportes() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO estadisticas_totales (clave, cantidad)
+            SELECT 'reportes', COUNT(*) FROM nuevas
+            ON CONFLICT (clave) DO UPDATE SET cantidad = estadisticas_totales.cantidad + EXCLUDED.cantidad;
+            
+            INSERT INTO estadisticas_por_tipo (tipo_robo, cantidad)
+            SELECT tipo_robo, COUNT(*) FROM nuevas GROUP BY tipo_robo
+            ON CONFLICT (tipo_robo) DO UPDATE SET cantidad = estadisticas_por_tipo.cantidad + EXCLUDED.cantidad;
+            
+            INSERT INTO estadisticas_por_dia (dia, cantidad)
+            SELECT fecha_creacion::date, COUNT(*) FROM nuevas GROUP BY fecha_creacion::date
+            ON CONFLICT (dia) DO UPDATE SET cantidad = estadisticas_por_dia.cantidad + EXCLUDED.cantidad;
+            
+            INSERT INTO estadisticas_por_usuario (usuario_id, cantidad)
+            SELECT usuario_id, COUNT(*) FROM nuevas WHERE usuario_id IS NOT NULL GROUP BY usuario_id
+            ON CONFLICT (usuario_id) DO UPDATE SET cantidad = estadisticas_por_usuario.cantidad + EXCLUDED.cantidad;
+        END IF;
+        
+        IF TG_OP IN ('DELETE', 'UPDATE') THEN
+            UPDATE estadisticas_totales t SET cantidad = t.cantidad - v.cantidad
+            FROM (SELECT COUNT(*) AS cantidad FROM viejas) v
+            WHERE t.clave = 'reportes';
+            
+            UPDATE estadisticas_por_tipo t SET cantidad = t.cantidad - v.cantidad
+            FROM (SELECT tipo_robo, COUNT(*) AS cantidad FROM viejas GROUP BY tipo_robo) v
+            WHERE t.tipo_robo = v.tipo_robo;
+            
+            UPDATE estadisticas_por_dia t SET cantidad = t.cantidad - v.cantidad
+            FROM (SELECT fecha_creacion::date AS dia, COUNT(*) AS cantidad FROM viejas GROUP BY 1) v
+            WHERE t.dia = v.dia;
+            
+            UPDATE estadisticas_por_usuario t SET cantidad = t.cantidad - v.cantidad
+            FROM (SELECT usuario_id, COUNT(*) AS cantidad FROM viejas GROUP BY usuario_id) v
+            WHERE t.usuario_id = v.usuario_id;
+            
+            DELETE FROM estadisticas_por_tipo WHERE cantidad <= 0;
+            DELETE FROM estadisticas_por_dia WHERE cantidad <= 0;
+            DELETE FROM estadisticas_por_usuario WHERE cantidad <= 0;
+        END IF;
+        
+        RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_estadisticas_insert ON reportes",
+    """
+    CREATE TRIGGER trg_estadisticas_insert AFTER INSERT ON reportes
+    REFERENCING NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_reportes()
+    """,
+    "DROP TRIGGER IF EXISTS trg_estadisticas_delete ON reportes",
+    """
+    CREATE TRIGGER trg_estadisticas_delete AFTER DELETE ON reportes
+    REFERENCING OLD TABLE AS viejas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_reportes()
+    """,
+    "DROP TRIGGER IF EXISTS trg_estadisticas_update ON reportes",
+    """
+    CREATE TRIGGER trg_estadisticas_update AFTER UPDATE ON reportes
+    REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+    FOR EACH STATEMENT EXECUTE FUNCTION estadisticas_reportes()
+    """,
+    """
+    CREATE OR REPLACE FUNCTION estadisticas_usuarios() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO estadisticas_totales (clave, cantidad)
+        VALUES ('usuarios', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END)
+        ON CONFLICT (clave) DO UPDATE SET cantidad = estadisticas_totales.cantidad + EXCLUDED.cantidad;
+        RETURN NULL;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS trg_estadisticas_usuarios ON usuarios",
+    """
+    CREATE TRIGGER trg_estadisticas_usuarios AFTER INSERT OR DELETE ON usuarios
+    FOR EACH ROW EXECUTE FUNCTION estadisticas_usuarios()
+    """,
+]
+
+def preparar_esquema():
+    """Crea los índices y estructuras auxiliares que necesita la aplicación"""
+    conn = get_connection()
+    if not conn:
+        return False
+    
+    try:
+        cur = conn.cursor()
+        for sentencia in ESQUEMA:
+            cur.execute(sentencia)
+        conn.commit()
+        cur.close()
+        
+        print(f" Esquema preparado ({len(ESQUEMA)} sentencias)")
+        return True
+    except Exception as e:
+        print(f" Error preparando el esquema: {e}")
+        return False
+    finally:
+        liberar_conexion(conn)
 
 # TEST DE CONEXIÓN
 
@@ -401,6 +1525,8 @@ if __name__ == "__main__":
     conn = get_connection()
     if conn:
         print(" Conexión exitosa")
-        conn.close()
+        liberar_conexion(conn)
+        print(f" Pool: {obtener_estadisticas_pool()}")
     else:
-        print(" No se pudo conectar")
\ No newline at end of file
+        print(" No se pudo conectar")
+    cerrar_pool()
\ No newline at end of file
@@ -0,0 +1,526 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+import asyncpg
+from config import Config
+import database as db
+
+# POOL DE CONEXIONES (ASYNCPG)
+#
+# Versión asíncrona de las consultas de database.py para app_async.py.
+# Devuelve dicts con los mismos nombres de columna que RealDictCursor,
+# así las rutas arman exactamente el mismo JSON que en el modo síncrono.
+
+_pool = None
+
+
+async def abrir_pool():
+    """Crea el pool de asyncpg (se llama al arrancar el servidor asíncrono)"""
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            host=Config.DB_HOST,
+            port=int(Config.DB_PORT),
+            database=Config.DB_NAME,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            min_size=Config.DB_POOL_MIN,
+            max_size=Config.DB_POOL_MAX,
+            timeout=Config.DB_POOL_TIMEOUT
+        )
+        print(f" Pool asíncrono creado ({Config.DB_POOL_MIN}-{Config.DB_POOL_MAX} conexiones)")
+    return _pool
+
+
+async def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def obtener_estadisticas_pool():
+    if _pool is None:
+        return {'abierto': False}
+    return {
+        'abierto': True,
+        'minimo': _pool.get_min_size(),
+        'maximo': _pool.get_max_size(),
+        'abiertas': _pool.get_size(),
+        'libres': _pool.get_idle_size()
+    }
+
+
+async def _filas(sql, *params):
+    return [dict(fila) for fila in await _pool.fetch(sql, *params)]
+
+
+async def _fila(sql, *params):
+    fila = await _pool.fetchrow(sql, *params)
+    return dict(fila) if fila else None
+
+# FUNCIONES PARA USUARIOS
+
+async def crear_usuario(nombre, email, telefono, password_hash):
+    """Crea un nuevo usuario en la base de datos"""
+    try:
+        nuevo_usuario = await _fila("""
+            INSERT INTO usuarios (nombre, email, telefono, password_hash)
+            VALUES ($1, $2, $3, $4)
+            RETURNING *
+        """, nombre, email, telefono, password_hash)
+        print(f"Usuario creado: {nuevo_usuario['email']}")
+        return nuevo_usuario
+    except asyncpg.UniqueViolationError:
+        print(f" El email {email} ya está registrado")
+        return None
+    except Exception as e:
+        print(f" Error creando usuario: {e}")
+        return None
+
+
+async def obtener_usuario_por_id(usuario_id):
+    """Obtiene un usuario por su ID"""
+    try:
+        return await _fila("""
+            SELECT id, nombre, email, telefono, fecha_registro, activo
+            FROM usuarios WHERE id = $1
+        """, usuario_id)
+    except Exception as e:
+        print(f" Error obteniendo usuario: {e}")
+        return None
+
+
+async def obtener_todos_usuarios():
+    """Obtiene todos los usuarios de la base de datos"""
+    try:
+        return await _filas("""
+            SELECT id, nombre, email, telefono, fecha_registro, activo
+            FROM usuarios
+            ORDER BY fecha_registro DESC
+        """)
+    except Exception as e:
+        print(f" Error obteniendo usuarios: {e}")
+        return []
+
+
+async def actualizar_usuario(usuario_id, nombre=None, telefono=None):
+    """Actualiza la información de un usuario"""
+    updates = []
+    params = []
+    if nombre:
+        params.append(nombre)
+        updates.append(f"nombre = ${len(params)}")
+    if telefono:
+        params.append(telefono)
+        updates.append(f"telefono = ${len(params)}")
+    if not updates:
+        return None
+
+    try:
+        params.append(usuario_id)
+        usuario_actualizado = await _fila(
+            f"UPDATE usuarios SET {', '.join(updates)} WHERE id = ${len(params)} RETURNING *",
+            *params
+        )
+        print(f" Usuario {usuario_id} actualizado")
+        return usuario_actualizado
+    except Exception as e:
+        print(f" Error actualizando usuario: {e}")
+        return None
+
+# Los suscriptores de database.suscribir_cambios son síncronos (índice, estado
+# analítico, cubo, teselas...): se llaman en un hilo aparte para no bloquear el
+# loop, de a uno y en el orden en que llegan los avisos
+_hilo_avisos = ThreadPoolExecutor(max_workers=1, thread_name_prefix='avisos')
+
+
+def notificar_cambio(evento, reporte):
+    """database._notificar_cambio en el hilo de avisos (devuelve un future de asyncio)"""
+    return asyncio.get_running_loop().run_in_executor(_hilo_avisos, db._notificar_cambio, evento, reporte)
+
+
+def aplicar_aviso(texto):
+    """database.aplicar_aviso en el hilo de avisos; el future da (evento, reporte)"""
+    return asyncio.get_running_loop().run_in_executor(_hilo_avisos, db.aplicar_aviso, texto)
+
+
+async def _avisar_cambios(conn, evento, reportes):
+    """Como database._avisar_cambios, dentro de la transacción de conn"""
+    await conn.execute(
+        "SELECT pg_notify($1, aviso) FROM unnest($2::text[]) AS aviso",
+        db.CANAL_CAMBIOS, db.avisos_cambio(evento, reportes)
+    )
+
+
+async def escuchar_cambios(funcion):
+    """
+    Recibe los avisos de todos los procesos con una conexión aparte hasta que
+    se cancele; funcion(texto) se llama en el loop por cada NOTIFY.
+    Si la conexión se pierde se vuelve a abrir (como database._escuchar_cambios).
+    """
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(
+                host=Config.DB_HOST,
+                port=int(Config.DB_PORT),
+                database=Config.DB_NAME,
+                user=Config.DB_USER,
+                password=Config.DB_PASSWORD
+            )
+            cerrada = asyncio.Event()
+            conn.add_termination_listener(lambda _conn: cerrada.set())
+            await conn.add_listener(db.CANAL_CAMBIOS, lambda _conn, _pid, _canal, texto: funcion(texto))
+            await cerrada.wait()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f" Error escuchando cambios: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(5)
+
+# FUNCIONES PARA REPORTES
+
+async def crear_reporte(usuario_id, tipo_robo, descripcion, latitud, longitud, fecha_incidente, barrio=None):
+    """Crea un nuevo reporte en la base de datos"""
+    try:
+        # fecha_incidente llega como texto ISO: se deja que PostgreSQL la convierta como en psycopg2
+        async with _pool.acquire() as conn:
+            async with conn.transaction():
+                nuevo_reporte = dict(await conn.fetchrow("""
+                    INSERT INTO reportes
+                    (usuario_id, tipo_robo, descripcion, latitud, longitud, fecha_incidente, barrio)
+                    VALUES ($1, $2, $3, $4, $5, CAST($6::text AS timestamp), $7)
+                    RETURNING *
+                """, usuario_id, tipo_robo, descripcion, latitud, longitud, str(fecha_incidente), barrio))
+                await _avisar_cambios(conn, 'creado', [nuevo_reporte])
+        print(f" Reporte creado: ID {nuevo_reporte['id']} por usuario {usuario_id}")
+        await notificar_cambio('creado', nuevo_reporte)
+        return nuevo_reporte
+    except Exception as e:
+        print(f" Error creando reporte: {e}")
+        return None
+
+
+async def eliminar_reporte(reporte_id):
+    """Elimina un reporte por su ID"""
+    try:
+        async with _pool.acquire() as conn:
+            async with conn.transaction():
+                reporte = await conn.fetchrow("""
+                    DELETE FROM reportes WHERE id = $1
+                    RETURNING id, usuario_id, tipo_robo, latitud, longitud, fecha_incidente, fecha_creacion
+                """, reporte_id)
+                if reporte is not None:
+                    reporte = dict(reporte)
+                    await _avisar_cambios(conn, 'eliminado', [reporte])
+        if reporte is None:
+            return False
+        print(f" Reporte {reporte_id} eliminado")
+        await notificar_cambio('eliminado', reporte)
+        return True
+    except Exception as e:
+        print(f" Error eliminando reporte: {e}")
+        return False
+
+
+async def obtener_reportes_pagina(limite, cursor=None, filtros=None, con_usuarios=False, compacto=False):
+    """Igual que database.obtener_reportes_pagina"""
+    condiciones, params = _condiciones_filtros(filtros)
+    if cursor:
+        params.extend(cursor)
+        condiciones.append(f"(r.fecha_creacion, r.id) < (${len(params) - 1}, ${len(params)})")
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+    columnas = """
+                r.id,
+                r.usuario_id,
+                r.tipo_robo,
+                r.descripcion,
+                r.latitud,
+                r.longitud,
+                r.fecha_incidente,
+                r.fecha_creacion,
+                r.barrio"""
+    join_usuario = ""
+    if compacto:
+        columnas = "r.id, r.tipo_robo, r.latitud, r.longitud, r.fecha_incidente, r.fecha_creacion"
+    elif con_usuarios:
+        columnas += ", u.nombre AS usuario_nombre"
+        join_usuario = "INNER JOIN usuarios u ON r.usuario_id = u.id"
+
+    params.append(limite + 1)
+    try:
+        reportes = await _filas(f"""
+            SELECT {columnas}
+            FROM reportes r
+            {join_usuario}
+            {where}
+            ORDER BY r.fecha_creacion DESC, r.id DESC
+            LIMIT ${len(params)}
+        """, *params)
+    except Exception as e:
+        print(f" Error obteniendo página de reportes: {e}")
+        return [], None
+
+    siguiente = None
+    if len(reportes) > limite:
+        reportes = reportes[:limite]
+        siguiente = (reportes[-1]['fecha_creacion'], reportes[-1]['id'])
+    return reportes, siguiente
+
+
+async def obtener_cambios_reportes(version=None, fecha=None, limite=None):
+    """Igual que database.obtener_cambios_reportes"""
+    if limite is None:
+        limite = Config.MAX_CAMBIOS_SINCRONIZACION
+    try:
+        corte = await _pool.fetchval("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+        cambios = {
+            'version': int(corte),
+            'creados': [],
+            'eliminados': [],
+            'recargar': version is None and fecha is None
+        }
+        if cambios['recargar']:
+            return cambios
+
+        if version is not None:
+            condicion, desde = "c.version >= $1::text::xid8", str(version)
+        else:
+            condicion, desde = "c.fecha >= $1", fecha
+
+        filas = await _filas(f"""
+            SELECT
+                c.id,
+                c.eliminado,
+                r.usuario_id,
+                r.tipo_robo,
+                r.descripcion,
+                r.latitud,
+                r.longitud,
+                r.fecha_incidente,
+                r.fecha_creacion,
+                r.barrio,
+                u.nombre AS usuario_nombre
+            FROM reportes_cambios c
+            LEFT JOIN reportes r ON r.id = c.id
+            LEFT JOIN usuarios u ON u.id = r.usuario_id
+            WHERE {condicion}
+            ORDER BY c.version, c.id
+            LIMIT $2
+        """, desde, limite + 1)
+    except Exception as e:
+        print(f" Error obteniendo cambios de reportes: {e}")
+        return None
+
+    if len(filas) > limite:
+        cambios['recargar'] = True
+        return cambios
+    for fila in filas:
+        if fila.pop('eliminado') or fila['tipo_robo'] is None:
+            cambios['eliminados'].append(fila['id'])
+        else:
+            cambios['creados'].append(fila)
+    return cambios
+
+
+def _condiciones_filtros(filtros):
+    """Como database._condiciones_filtros pero con parámetros $n de asyncpg"""
+    condiciones = []
+    params = []
+    if not filtros:
+        return condiciones, params
+
+    if filtros.get('bbox'):
+        oeste, sur, este, norte = filtros['bbox']
+        params.extend([sur, norte, oeste, este])
+        n = len(params)
+        condiciones.append(f"r.latitud BETWEEN ${n - 3} AND ${n - 2} AND r.longitud BETWEEN ${n - 1} AND ${n}")
+    if filtros.get('desde'):
+        params.append(filtros['desde'])
+        condiciones.append(f"r.fecha_incidente >= ${len(params)}")
+    if filtros.get('hasta'):
+        params.append(filtros['hasta'])
+        condiciones.append(f"r.fecha_incidente <= ${len(params)}")
+    if filtros.get('antes_de'):
+        params.append(filtros['antes_de'])
+        condiciones.append(f"r.fecha_incidente < ${len(params)}")
+    if filtros.get('tipo_robo'):
+        params.append(filtros['tipo_robo'])
+        condiciones.append(f"r.tipo_robo = ${len(params)}")
+
+    return condiciones, params
+
+
+async def iterar_reportes(tamano_lote=1000):
+    """Recorre todos los reportes con un cursor del lado del servidor"""
+    async with _pool.acquire() as conn:
+        async with conn.transaction():
+            async for reporte in conn.cursor("""
+                SELECT
+                    id,
+                    usuario_id,
+                    tipo_robo,
+                    descripcion,
+                    latitud,
+                    longitud,
+                    fecha_incidente,
+                    fecha_creacion,
+                    barrio
+                FROM reportes
+                ORDER BY fecha_creacion DESC, id DESC
+            """, prefetch=tamano_lote):
+                yield dict(reporte)
+
+
+async def obtener_reportes_con_usuarios():
+    """Obtiene todos los reportes con información del usuario que los creó"""
+    try:
+        return await _filas("""
+            SELECT
+                r.id,
+                r.usuario_id,
+                r.tipo_robo,
+                r.descripcion,
+                r.latitud,
+                r.longitud,
+                r.fecha_incidente,
+                r.fecha_creacion,
+                r.barrio,
+                u.nombre AS usuario_nombre,
+                u.email AS usuario_email,
+                u.telefono AS usuario_telefono
+            FROM reportes r
+            INNER JOIN usuarios u ON r.usuario_id = u.id
+            ORDER BY r.fecha_creacion DESC
+        """)
+    except Exception as e:
+        print(f" Error obteniendo reportes con usuarios: {e}")
+        return []
+
+
+async def obtener_reportes_por_usuario(usuario_id):
+    """Obtiene todos los reportes de un usuario específico"""
+    try:
+        return await _filas("""
+            SELECT *
+            FROM reportes
+            WHERE usuario_id = $1
+            ORDER BY fecha_creacion DESC
+        """, usuario_id)
+    except Exception as e:
+        print(f" Error obteniendo reportes del usuario: {e}")
+        return []
+
+
+async def obtener_reporte_por_id(reporte_id):
+    """Obtiene un reporte específico por su ID"""
+    try:
+        return await _fila("""
+            SELECT
+                r.*,
+                u.nombre AS usuario_nombre,
+                u.email AS usuario_email
+            FROM reportes r
+            INNER JOIN usuarios u ON r.usuario_id = u.id
+            WHERE r.id = $1
+        """, reporte_id)
+    except Exception as e:
+        print(f" Error obteniendo reporte: {e}")
+        return None
+
+# FUNCIONES PARA ESTADÍSTICAS
+
+async def obtener_estadisticas():
+    """
+    Obtiene estadísticas generales de los reportes
+    Con las tablas de resumen es una sola consulta; sin ellas las seis consultas
+    independientes se hacen a la vez, cada una con su propia conexión del pool.
+    Devuelve None si la consulta falla
+    """
+    try:
+        try:
+            stats = await _fila("""
+                SELECT
+                    COALESCE((SELECT cantidad FROM estadisticas_totales WHERE clave = 'reportes'), 0) AS total_reportes,
+                    COALESCE((SELECT cantidad FROM estadisticas_totales WHERE clave = 'usuarios'), 0) AS total_usuarios,
+                    COALESCE((SELECT cantidad FROM estadisticas_por_dia WHERE dia = CURRENT_DATE), 0) AS reportes_hoy,
+                    COALESCE((
+                        SELECT SUM(cantidad)::bigint FROM estadisticas_por_dia
+                        WHERE dia >= CURRENT_DATE - 7
+                    ), 0) AS reportes_semana,
+                    COALESCE((
+                        SELECT json_agg(json_build_object('tipo_robo', tipo_robo, 'cantidad', cantidad)
+                                        ORDER BY cantidad DESC)
+                        FROM estadisticas_por_tipo
+                    ), '[]'::json)::text AS por_tipo,
+                    COALESCE((
+                        SELECT json_build_object('nombre', u.nombre, 'email', u.email, 'total_reportes', e.cantidad)
+                        FROM estadisticas_por_usuario e
+                        INNER JOIN usuarios u ON u.id = e.usuario_id
+                        ORDER BY e.cantidad DESC
+                        LIMIT 1
+                    ), (
+                        SELECT json_build_object('nombre', nombre, 'email', email, 'total_reportes', 0)
+                        FROM usuarios
+                        LIMIT 1
+                    ))::text AS usuario_mas_activo
+            """)
+        except asyncpg.UndefinedTableError:
+            print(" Tablas de estadísticas no encontradas, calculando directamente")
+            return await _calcular_estadisticas()
+
+        stats['por_tipo'] = json.loads(stats['por_tipo'])
+        if stats['usuario_mas_activo']:
+            stats['usuario_mas_activo'] = json.loads(stats['usuario_mas_activo'])
+        return stats
+    except Exception as e:
+        print(f" Error obteniendo estadísticas: {e}")
+        return None
+
+
+async def _calcular_estadisticas():
+    total, total_usuarios, por_tipo, hoy, semana, usuario_mas_activo = await asyncio.gather(
+        _pool.fetchval("SELECT COUNT(*) FROM reportes"),
+        _pool.fetchval("SELECT COUNT(*) FROM usuarios"),
+        _filas("""
+            SELECT tipo_robo, COUNT(*) as cantidad
+            FROM reportes
+            GROUP BY tipo_robo
+            ORDER BY cantidad DESC
+        """),
+        _pool.fetchval("""
+            SELECT COUNT(*)
+            FROM reportes
+            WHERE fecha_creacion >= CURRENT_DATE AND fecha_creacion < CURRENT_DATE + 1
+        """),
+        _pool.fetchval("""
+            SELECT COUNT(*)
+            FROM reportes
+            WHERE fecha_creacion >= CURRENT_DATE - INTERVAL '7 days'
+        """),
+        _fila("""
+            SELECT
+                u.nombre,
+                u.email,
+                COUNT(r.id) as total_reportes
+            FROM usuarios u
+            LEFT JOIN reportes r ON u.id = r.usuario_id
+            GROUP BY u.id, u.nombre, u.email
+            ORDER BY total_reportes DESC
+            LIMIT 1
+        """)
+    )
+
+    return {
+        'total_reportes': total,
+        'total_usuarios': total_usuarios,
+        'reportes_hoy': hoy,
+        'reportes_semana': semana,
+        'por_tipo': por_tipo,
+        'usuario_mas_activo': usuario_mas_activo
+    }
@@ -0,0 +1,236 @@
+import math
+import threading
+from datetime import datetime
+from config import Config
+import database as db
+from columnas import a_epoca_us
+from cubo import CuboRiesgo, celda_grilla, bloque_grilla
+
+try:
+    import numpy as np
+except ImportError:  # sin NumPy no hay riesgo con decaimiento
+    np = None
+
+# RIESGO CON DECAIMIENTO EXPONENCIAL
+#
+# Un robo de hace tres años no debería pesar lo mismo que uno de ayer: cada
+# reporte aporta 2^(-edad / vida_media) según su fecha_incidente. Por cada celda
+# de la grilla del cubo de riesgo (Config.CUBO_LIMITES / CUBO_TAM_CELDA) y cada
+# vida media de Config.RIESGO_VIDAS_MEDIAS_DIAS se guarda la suma de los aportes
+# vista desde la fecha de referencia de la celda (su incidente más reciente):
+#   sumar un reporte  O(1): si es más nuevo que la referencia, la suma se decae
+#                     hasta él y pasa a ser la referencia; si no, se suma su aporte
+#   eliminar          resta el mismo aporte
+#   leer              suma * 2^(-(ahora - referencia) / vida_media), al consultar
+# Así nunca hay que volver a recorrer la tabla para una ventana de tiempo. Solo
+# se pueden consultar las vidas medias configuradas.
+
+SEGUNDOS_POR_DIA = 86400.0
+
+# Exponente mínimo de los aportes (PostgreSQL da error de underflow en power)
+_EXPONENTE_MIN = -1000.0
+
+
+def _segundos(fecha):
+    return a_epoca_us(fecha) / 1e6
+
+
+class RiesgoDecaido:
+
+    def __init__(self, limites, tam_celda, vidas_medias_dias):
+        self.limites = tuple(limites)
+        self.tam_celda = tam_celda
+        self.vidas_medias = tuple(vidas_medias_dias)
+        self.forma = CuboRiesgo.forma(limites, tam_celda, ())[:2]
+        self.sumas = np.zeros(self.forma + (len(self.vidas_medias),), dtype=np.float64)
+        self.referencia = np.full(self.forma, np.nan)  # segundos desde 1970; NaN = celda vacía
+        self._segundos_vida = np.array([d * SEGUNDOS_POR_DIA for d in self.vidas_medias])
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_reportes(cls, reportes):
+        """Acumuladores sumando reporte a reporte (lo usa verificar_riesgo_decaido)"""
+        riesgo = cls(Config.CUBO_LIMITES, Config.CUBO_TAM_CELDA, Config.RIESGO_VIDAS_MEDIAS_DIAS)
+        for reporte in reportes:
+            riesgo.sumar(reporte, 1)
+        return riesgo
+
+    def _aporte(self, diferencia):
+        """2^(diferencia / vida_media) para cada vida media (diferencia <= 0, en segundos)"""
+        return np.exp2(np.maximum(diferencia / self._segundos_vida, _EXPONENTE_MIN))
+
+    def sumar(self, reporte, signo):
+        """Suma (signo=1) o resta (signo=-1) un reporte"""
+        celda = celda_grilla(
+            float(reporte['latitud']), float(reporte['longitud']), self.limites, self.tam_celda, self.forma
+        )
+        if celda is None:
+            return
+        momento = _segundos(reporte['fecha_incidente'])
+        with self._lock:
+            referencia = self.referencia[celda]
+            if signo > 0:
+                if math.isnan(referencia):
+                    self.sumas[celda] = 1.0
+                    self.referencia[celda] = momento
+                elif momento > referencia:
+                    self.sumas[celda] = self.sumas[celda] * self._aporte(referencia - momento) + 1.0
+                    self.referencia[celda] = momento
+                else:
+                    self.sumas[celda] += self._aporte(momento - referencia)
+            elif not math.isnan(referencia):
+                self.sumas[celda] = np.maximum(self.sumas[celda] - self._aporte(momento - referencia), 0.0)
+
+    def indice_vida_media(self, vida_media_dias):
+        for i, dias in enumerate(self.vidas_medias):
+            if dias == vida_media_dias:
+                return i
+        disponibles = ', '.join(str(d) for d in self.vidas_medias)
+        raise ValueError(f'vida_media_dias debe ser una de: {disponibles}')
+
+    def valor(self, latitud, longitud, radio, vida_media_dias, ahora=None):
+        """
+        Reportes "efectivos" en las celdas alrededor del punto: cada uno pesa
+        2^(-edad / vida_media) a la fecha `ahora`
+        """
+        i = self.indice_vida_media(vida_media_dias)
+        rango = bloque_grilla(latitud, longitud, radio, self.limites, self.tam_celda, self.forma)
+        if rango is None:
+            return 0.0
+        if ahora is None:
+            ahora = datetime.now()
+        with self._lock:
+            referencias = self.referencia[rango]
+            sumas = self.sumas[rango + (i,)]
+            ocupadas = ~np.isnan(referencias)
+            # Un incidente con fecha futura no pesa más que uno de hoy
+            edad = np.maximum(_segundos(ahora) - referencias[ocupadas], 0.0)
+            return float((sumas[ocupadas] * np.exp2(-edad / self._segundos_vida[i])).sum())
+
+    def decaido(self, ahora=None):
+        """Arreglo (filas, cols, vidas medias) con todas las sumas llevadas a `ahora`"""
+        if ahora is None:
+            ahora = datetime.now()
+        with self._lock:
+            edad = np.maximum(_segundos(ahora) - np.nan_to_num(self.referencia), 0.0)
+            return self.sumas * np.exp2(-edad[..., None] / self._segundos_vida)
+
+# CONSTRUCCIÓN
+
+_SQL_SUMAS = """
+    WITH puntos AS (
+        SELECT
+            LEAST(floor((latitud::float8 - %(sur)s) / %(tam)s)::int, %(filas)s - 1) AS fila,
+            LEAST(floor((longitud::float8 - %(oeste)s) / %(tam)s)::int, %(cols)s - 1) AS col,
+            EXTRACT(EPOCH FROM fecha_incidente)::float8 AS segundos
+        FROM reportes
+        WHERE latitud::float8 >= %(sur)s AND latitud::float8 < %(norte)s
+          AND longitud::float8 >= %(oeste)s AND longitud::float8 < %(este)s
+    ), celdas AS (
+        SELECT fila, col, MAX(segundos) AS referencia
+        FROM puntos
+        GROUP BY fila, col
+    )
+    SELECT p.fila, p.col, c.referencia, v.i::int - 1 AS vida,
+        SUM(power(2::float8, GREATEST((p.segundos - c.referencia) / v.segundos_vida, %(exponente_min)s)))
+    FROM puntos p
+    JOIN celdas c USING (fila, col)
+    CROSS JOIN unnest(%(vidas)s::float8[]) WITH ORDINALITY AS v(segundos_vida, i)
+    GROUP BY p.fila, p.col, c.referencia, v.i
+"""
+
+
+def construir_riesgo_decaido():
+    """
+    Acumuladores de todas las celdas con una consulta agregada en PostgreSQL
+    Devuelve (RiesgoDecaido, firma de la tabla en la misma instantánea)
+    """
+    return db.en_instantanea(_construir_riesgo, 'construyendo el riesgo con decaimiento') or (None, None)
+
+
+def _construir_riesgo(cur):
+    riesgo = RiesgoDecaido(Config.CUBO_LIMITES, Config.CUBO_TAM_CELDA, Config.RIESGO_VIDAS_MEDIAS_DIAS)
+    sur, oeste, norte, este = riesgo.limites
+
+    firma = db.leer_firma_reportes(cur)
+    cur.execute(_SQL_SUMAS, {
+        'sur': sur, 'oeste': oeste, 'norte': norte, 'este': este,
+        'tam': riesgo.tam_celda, 'filas': riesgo.forma[0], 'cols': riesgo.forma[1],
+        'vidas': riesgo._segundos_vida.tolist(), 'exponente_min': _EXPONENTE_MIN
+    })
+    filas = cur.fetchall()
+
+    if filas:
+        fila, col, referencia, vida, suma = (np.array(columna) for columna in zip(*filas))
+        riesgo.referencia[fila, col] = referencia
+        riesgo.sumas[fila, col, vida] = suma
+    return riesgo, firma
+
+# ACUMULADORES DEL PROCESO
+
+_riesgo = None
+_riesgo_al_dia = False
+_riesgo_lock = threading.RLock()        # una construcción a la vez
+_riesgo_avisos = threading.Lock()       # publicación de los acumuladores y avisos pendientes
+_riesgo_pendientes = None               # avisos recibidos durante la construcción
+
+
+def obtener_riesgo_decaido():
+    """Los acumuladores de este proceso (None si NumPy no está instalado)"""
+    if np is None:
+        return None
+    with _riesgo_lock:
+        if _riesgo is None or not _riesgo_al_dia:
+            _cargar_riesgo()
+        return _riesgo
+
+
+def _cargar_riesgo():
+    """
+    Construye y publica los acumuladores; como en cubo._cargar_cubo, los avisos
+    que llegan mientras tanto se concilian por id contra la instantánea de la
+    construcción y solo se suman los que no estaban en ella
+    """
+    global _riesgo_pendientes
+    with _riesgo_avisos:
+        _riesgo_pendientes = []
+    try:
+        db.en_instantanea(_publicar_riesgo, 'construyendo el riesgo con decaimiento')
+    finally:
+        with _riesgo_avisos:
+            _riesgo_pendientes = None
+
+
+def _publicar_riesgo(cur):
+    global _riesgo, _riesgo_al_dia
+    nuevo, _ = _construir_riesgo(cur)
+
+    with _riesgo_avisos:
+        al_dia = not any(evento == 'recargar' for evento, _ in _riesgo_pendientes)
+        if al_dia:
+            for reporte, signo in db.conciliar_avisos(cur, _riesgo_pendientes):
+                nuevo.sumar(reporte, signo)
+        _riesgo = nuevo
+        _riesgo_al_dia = al_dia
+
+
+def _actualizar_riesgo(evento, reporte):
+    """Mantiene los acumuladores al día con los avisos de database.py"""
+    global _riesgo_al_dia
+    with _riesgo_avisos:
+        if _riesgo_pendientes is not None:
+            _riesgo_pendientes.append((evento, reporte))  # se aplica al publicar los nuevos
+            return
+        if evento == 'recargar':
+            _riesgo_al_dia = False  # se vuelven a construir en el próximo uso
+            return
+        riesgo = _riesgo
+    if riesgo is None:
+        return  # se construirán completos al primer uso
+    if evento == 'creado':
+        riesgo.sumar(reporte, 1)
+    elif evento == 'eliminado':
+        riesgo.sumar(reporte, -1)
+
+
+db.suscribir_cambios(_actualizar_riesgo)
@@ -0,0 +1,235 @@
+import math
+from config import Config
+import database as db
+
+# MOTOR ESPACIAL EN LA BASE DE DATOS
+#
+# Config.MOTOR_ESPACIAL elige dónde se resuelven las consultas por radio:
+#   'python'   índice de grilla en memoria (predicciones.py), distancia euclidiana en grados
+#   'sql'      Haversine en PostgreSQL, con prefiltro por bbox sobre un índice GiST de point
+#   'postgis'  ST_DWithin / <-> sobre un índice GiST de geography (ver ESQUEMA_POSTGIS)
+# Con 'sql' o 'postgis' solo salen de PostgreSQL los conteos o los reportes cercanos.
+# Si PostGIS no está instalado se usa 'sql'; si la consulta falla, predicciones.py
+# vuelve al índice en memoria.
+
+RADIO_TIERRA = 6371008.8
+
+# La misma equivalencia que radio_metros en las respuestas (0.01 grados ≈ 1.1 km)
+METROS_POR_GRADO = 111000
+
+# Punto de cada reporte como geography; el índice GiST es sobre esta misma expresión
+# para no agregar una columna a la tabla reportes
+PUNTO_REPORTE = "(ST_SetSRID(ST_MakePoint(longitud::float8, latitud::float8), 4326)::geography)"
+
+# Punto plano (grados) de cada reporte para el índice GiST del motor 'sql', que
+# no necesita extensiones: `<@ box` filtra por bbox en las dos coordenadas a la vez
+PUNTO_PLANO = "point(longitud::float8, latitud::float8)"
+
+ESQUEMA_SQL = [
+    f"CREATE INDEX IF NOT EXISTS idx_reportes_punto ON reportes USING gist ({PUNTO_PLANO})",
+]
+
+ESQUEMA_POSTGIS = [
+    "CREATE EXTENSION IF NOT EXISTS postgis",
+    f"CREATE INDEX IF NOT EXISTS idx_reportes_geografia ON reportes USING gist ({PUNTO_REPORTE})",
+]
+
+# Distancia Haversine en metros entre (lat, lng) de la consulta y el reporte
+_HAVERSINE = f"""
+    2 * {RADIO_TIERRA} * asin(sqrt(
+        power(sin(radians(latitud::float8 - p.lat) / 2), 2)
+        + cos(radians(p.lat)) * cos(radians(latitud::float8))
+        * power(sin(radians(longitud::float8 - p.lng) / 2), 2)
+    ))
+"""
+
+# Medio lado (en grados) del bbox que contiene el círculo; es lo que filtra el índice
+_BBOX = f"""
+    CROSS JOIN LATERAL (
+        SELECT
+            degrees(%(metros)s / {RADIO_TIERRA}) AS dlat,
+            LEAST(180, degrees(%(metros)s / ({RADIO_TIERRA} * GREATEST(cos(radians(p.lat)), 1e-9)))) AS dlng
+    ) b
+"""
+
+_EN_BBOX = f"""
+    {PUNTO_PLANO} <@ box(point(p.lng - b.dlng, p.lat - b.dlat), point(p.lng + b.dlng, p.lat + b.dlat))
+"""
+
+_motor = None
+
+
+def motor():
+    """Motor en uso ('python', 'sql' o 'postgis'); se detecta una vez por proceso"""
+    global _motor
+    if _motor is None:
+        _motor = detectar_motor(Config.MOTOR_ESPACIAL)
+    return _motor
+
+
+def detectar_motor(pedido):
+    if pedido == 'python':
+        return 'python'
+    if pedido != 'postgis':
+        return 'sql'
+    conn = db.get_connection()
+    if not conn:
+        return 'sql'
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'postgis'")
+        instalado = cur.fetchone() is not None
+        cur.close()
+        if not instalado:
+            print(" PostGIS no está instalado: se usa Haversine en SQL")
+        return 'postgis' if instalado else 'sql'
+    except Exception as e:
+        print(f" Error detectando PostGIS: {e}")
+        return 'sql'
+    finally:
+        db.liberar_conexion(conn)
+
+
+def preparar_esquema(pedido=None):
+    """
+    Crea el índice del motor configurado ('postgis' también instala la extensión
+    si el servidor la tiene; si no, queda el índice del motor 'sql')
+    """
+    pedido = pedido or Config.MOTOR_ESPACIAL
+    if pedido == 'python':
+        return True
+    conn = db.get_connection()
+    if not conn:
+        return False
+    try:
+        cur = conn.cursor()
+        for sentencia in ESQUEMA_SQL:
+            cur.execute(sentencia)
+        conn.commit()
+        if pedido == 'postgis':
+            for sentencia in ESQUEMA_POSTGIS:
+                cur.execute(sentencia)
+            conn.commit()
+        cur.close()
+        print(f" Índice espacial preparado ({pedido})")
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f" No se pudo preparar el índice espacial ({pedido}): {e}")
+        return False
+    finally:
+        db.liberar_conexion(conn)
+
+# CONSULTAS POR RADIO Y VECINOS MÁS CERCANOS
+
+def sql_contar_cercanos(motor_sql, tabla='reportes'):
+    """
+    Una fila (cantidad) por punto de %(lat)s / %(lng)s (arreglos), en el mismo orden
+    tabla: otra tabla con latitud/longitud (la usa comandos.py benchmark-espacial)
+    """
+    if motor_sql == 'postgis':
+        condicion = f"ST_DWithin({PUNTO_REPORTE}, ST_MakePoint(p.lng, p.lat)::geography, %(metros)s)"
+        bbox = ""
+    else:
+        condicion = f"{_EN_BBOX} AND {_HAVERSINE} <= %(metros)s"
+        bbox = _BBOX
+    return f"""
+        SELECT (SELECT COUNT(*) FROM {tabla} WHERE {condicion}) AS cantidad
+        FROM unnest(%(lat)s::float8[], %(lng)s::float8[]) WITH ORDINALITY AS p(lat, lng, n)
+        {bbox}
+        ORDER BY p.n
+    """
+
+
+def contar_cercanos(puntos, metros):
+    """
+    Reportes a menos de `metros` (distancia sobre la esfera) de cada punto
+    puntos: lista de (latitud, longitud). Devuelve una lista de conteos, o None
+    si el motor es 'python' o la consulta falla (quien llama usa el índice en memoria)
+    """
+    motor_sql = motor()
+    if motor_sql == 'python':
+        return None
+    conn = db.get_connection()
+    if not conn:
+        return None
+    try:
+        cur = conn.cursor()
+        cur.execute(sql_contar_cercanos(motor_sql), {
+            'lat': [float(lat) for lat, _ in puntos],
+            'lng': [float(lng) for _, lng in puntos],
+            'metros': float(metros)
+        })
+        conteos = [fila[0] for fila in cur.fetchall()]
+        cur.close()
+        return conteos
+    except Exception as e:
+        conn.rollback()
+        print(f" Error en la consulta espacial ({motor_sql}): {e}")
+        return None
+    finally:
+        db.liberar_conexion(conn)
+
+
+def reportes_mas_cercanos(latitud, longitud, cantidad, metros_max=None):
+    """
+    Los `cantidad` reportes más cercanos al punto, con distancia_metros
+    Con PostGIS usa el operador <-> del índice GiST; sin PostGIS busca en bbox
+    cada vez más grandes (siempre sobre el índice) hasta juntar `cantidad`.
+    """
+    if metros_max is None:
+        metros_max = Config.VECINOS_METROS_MAX
+    conn = db.get_connection()
+    if not conn:
+        return None
+    try:
+        cur = conn.cursor(cursor_factory=db.RealDictCursor)
+        params = {'lat': float(latitud), 'lng': float(longitud), 'cantidad': cantidad, 'metros': metros_max}
+        columnas = "id, usuario_id, tipo_robo, latitud, longitud, fecha_incidente, fecha_creacion, barrio"
+
+        if motor() == 'postgis':
+            cur.execute(f"""
+                SELECT {columnas},
+                    ST_Distance({PUNTO_REPORTE}, ST_MakePoint(%(lng)s, %(lat)s)::geography) AS distancia_metros
+                FROM reportes
+                WHERE ST_DWithin({PUNTO_REPORTE}, ST_MakePoint(%(lng)s, %(lat)s)::geography, %(metros)s)
+                ORDER BY {PUNTO_REPORTE} <-> ST_MakePoint(%(lng)s, %(lat)s)::geography
+                LIMIT %(cantidad)s
+            """, params)
+            cercanos = cur.fetchall()
+        else:
+            # El radio crece de a 4x desde ~500 m: pocas vueltas incluso en zonas vacías
+            metros = min(500.0, metros_max)
+            while True:
+                params['metros'] = metros
+                cur.execute(f"""
+                    SELECT * FROM (
+                        SELECT {columnas}, {_HAVERSINE} AS distancia_metros
+                        FROM reportes, (SELECT %(lat)s::float8 AS lat, %(lng)s::float8 AS lng) p
+                        {_BBOX}
+                        WHERE {_EN_BBOX}
+                    ) r
+                    WHERE distancia_metros <= %(metros)s
+                    ORDER BY distancia_metros
+                    LIMIT %(cantidad)s
+                """, params)
+                cercanos = cur.fetchall()
+                if len(cercanos) >= cantidad or metros >= metros_max:
+                    break
+                metros = min(metros * 4, metros_max)
+        cur.close()
+        return cercanos
+    except Exception as e:
+        conn.rollback()
+        print(f" Error buscando reportes cercanos: {e}")
+        return None
+    finally:
+        db.liberar_conexion(conn)
+
+
+def distancia_metros(lat1, lng1, lat2, lng2):
+    """Haversine en Python (la misma fórmula que las consultas 'sql')"""
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    return 2 * RADIO_TIERRA * math.asin(math.sqrt(a))
@@ -0,0 +1,109 @@
+import asyncio
+from config import Config
+import predicciones as pred
+import serializacion
+
+# EVENTOS EN TIEMPO REAL (SERVER-SENT EVENTS)
+#
+# app_async.py recibe los avisos de PostgreSQL (LISTEN) y los reparte a los
+# mapas conectados a GET /api/eventos. Cada cliente es solo una cola en el
+# loop de asyncio: no hay un hilo por cliente y cada mensaje se arma una vez
+# para todos. Los cambios se juntan durante Config.EVENTOS_INTERVALO:
+#   event: reportes  {"creados": [...], "eliminados": [ids]}
+#   event: recargar  {} (el lote fue demasiado grande o hubo una importación)
+#   event: zonas     {"data": [zonas de riesgo], "total": n}
+
+
+def mensaje_sse(evento, datos):
+    """Un mensaje text/event-stream ya codificado"""
+    return b'event: ' + evento.encode() + b'\ndata: ' + serializacion.dumps(datos) + b'\n\n'
+
+
+def resumen_zonas():
+    """Las zonas de riesgo con más robos (del estado analítico, sin leer la base de datos)"""
+    zonas = sorted(pred.calcular_zonas_riesgo(), key=lambda z: z['cantidad_robos'], reverse=True)
+    return {'data': zonas[:Config.EVENTOS_MAX_ZONAS], 'total': len(zonas)}
+
+
+class CanalEventos:
+    """Clientes SSE conectados y lote de cambios pendiente de enviar"""
+
+    def __init__(self):
+        self._clientes = set()
+        self._creados = []
+        self._eliminados = []
+        self._recargar = False
+        self._envio = None
+        self._ultimas_zonas = None
+
+    def conectar(self):
+        """Cola del nuevo cliente; recibe bytes o None cuando debe desconectarse"""
+        cola = asyncio.Queue(maxsize=Config.EVENTOS_MAX_COLA)
+        if self._ultimas_zonas is not None:
+            cola.put_nowait(self._ultimas_zonas)
+        self._clientes.add(cola)
+        return cola
+
+    def desconectar(self, cola):
+        self._clientes.discard(cola)
+
+    @property
+    def conectados(self):
+        return len(self._clientes)
+
+    def publicar(self, mensaje):
+        for cola in list(self._clientes):
+            try:
+                cola.put_nowait(mensaje)
+            except asyncio.QueueFull:
+                # Cliente lento: se desconecta; EventSource reconecta y se pone
+                # al día con GET /api/reportes/cambios
+                self._clientes.discard(cola)
+                while not cola.empty():
+                    cola.get_nowait()
+                cola.put_nowait(None)
+
+    def agregar(self, evento, reporte):
+        """Suma un aviso de database.aplicar_aviso al lote (llamar desde el loop)"""
+        if evento == 'creado':
+            self._creados.append(reporte)
+        elif evento == 'eliminado':
+            self._eliminados.append(reporte['id'])
+        elif evento == 'recargar':
+            self._recargar = True  # inserción por lotes: el aviso no trae los reportes
+        if self._envio is None:
+            self._envio = asyncio.create_task(self._enviar_lote())
+
+    async def _enviar_lote(self):
+        try:
+            await asyncio.sleep(Config.EVENTOS_INTERVALO)
+            creados, eliminados = self._creados, self._eliminados
+            recargar = self._recargar
+            self._creados, self._eliminados = [], []
+            self._recargar = False
+            self._envio = None
+            # Un reporte creado y eliminado en el mismo lote solo va como eliminado
+            if eliminados:
+                quitar = set(eliminados)
+                creados = [r for r in creados if r['id'] not in quitar]
+
+            if recargar or len(creados) + len(eliminados) > Config.EVENTOS_MAX_LOTE:
+                self.publicar(mensaje_sse('recargar', {}))
+            else:
+                self.publicar(mensaje_sse('reportes', {'creados': creados, 'eliminados': eliminados}))
+
+            # Las zonas se recalculan una vez por lote, en un hilo
+            self._ultimas_zonas = mensaje_sse('zonas', await asyncio.to_thread(resumen_zonas))
+            self.publicar(self._ultimas_zonas)
+        except Exception as e:
+            print(f" Error enviando eventos: {e}")
+
+    def cerrar(self):
+        """Desconecta a todos los clientes (al apagar el servidor)"""
+        if self._envio is not None:
+            self._envio.cancel()
+        for cola in list(self._clientes):
+            self._clientes.discard(cola)
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait(None)
@@ -0,0 +1,103 @@
+import json
+import struct
+import sys
+from array import array
+from datetime import datetime
+import serializacion
+
+try:
+    import msgpack
+except ImportError:  # sin msgpack solo se ofrecen JSON por columnas y binario
+    msgpack = None
+
+# FORMATOS COMPACTOS PARA EL MAPA
+#
+# El mapa solo necesita id, posición, tipo y fecha de cada reporte. Con el
+# encabezado Accept, GET /api/reportes puede responder:
+#   application/vnd.reportes.columnas+json   JSON con un arreglo por columna
+#   application/x-msgpack                    lo mismo en MessagePack
+#   application/vnd.reportes.binario         arreglos binarios (Float32/Uint32/Uint8)
+# Los tipos de robo van como índice en un diccionario `tipos`.
+
+MIME_JSON = 'application/json'
+MIME_COLUMNAS = 'application/vnd.reportes.columnas+json'
+MIME_MSGPACK = 'application/x-msgpack'
+MIME_BINARIO = 'application/vnd.reportes.binario'
+
+FORMATOS_COMPACTOS = [MIME_COLUMNAS, MIME_BINARIO] + ([MIME_MSGPACK] if msgpack else [])
+
+_EPOCA = datetime(1970, 1, 1)
+
+
+def elegir_formato(accept):
+    """Formato pedido en el encabezado Accept (werkzeug MIMEAccept); JSON normal por defecto"""
+    return accept.best_match([MIME_JSON] + FORMATOS_COMPACTOS, default=MIME_JSON)
+
+
+def _segundos(fecha):
+    """Segundos desde 1970 de la fecha tal como está guardada (sin zona horaria)"""
+    return int((fecha.replace(tzinfo=None) - _EPOCA).total_seconds())
+
+
+def columnas_reportes(reportes):
+    """Reportes (id, latitud, longitud, tipo_robo, fecha_incidente) como arreglos paralelos"""
+    tipos = {}
+    columnas = {'id': [], 'latitud': [], 'longitud': [], 'tipo': [], 'fecha': []}
+    for r in reportes:
+        columnas['id'].append(r['id'])
+        columnas['latitud'].append(float(r['latitud']))
+        columnas['longitud'].append(float(r['longitud']))
+        columnas['tipo'].append(tipos.setdefault(r['tipo_robo'], len(tipos)))
+        columnas['fecha'].append(_segundos(r['fecha_incidente']))
+    return list(tipos), columnas
+
+
+def codificar(formato, reportes, siguiente_cursor):
+    """Devuelve el cuerpo de la respuesta (bytes) en el formato compacto pedido"""
+    tipos, columnas = columnas_reportes(reportes)
+    cuerpo = {
+        'success': True,
+        'total': len(reportes),
+        'siguiente_cursor': siguiente_cursor,
+        'tipos': tipos
+    }
+
+    if formato == MIME_BINARIO:
+        return _codificar_binario(cuerpo, columnas)
+
+    cuerpo['columnas'] = columnas
+    if formato == MIME_MSGPACK:
+        return msgpack.packb(cuerpo)
+    return serializacion.dumps(cuerpo)
+
+
+# Orden y tipo de las columnas en el formato binario (todas little-endian)
+COLUMNAS_BINARIO = [
+    ('id', 'I', 'uint32'),
+    ('fecha', 'I', 'uint32'),
+    ('latitud', 'f', 'float32'),
+    ('longitud', 'f', 'float32'),
+    ('tipo', 'B', 'uint8'),
+]
+
+
+def _codificar_binario(cabecera, columnas):
+    """
+    [uint32 largo de la cabecera][cabecera JSON, rellenada a múltiplo de 4][columnas]
+    Cada columna son `total` valores seguidos, en el orden de COLUMNAS_BINARIO, así
+    el cliente las lee con Uint32Array / Float32Array sin copiar
+    """
+    if len(cabecera['tipos']) > 255:
+        raise ValueError('El formato binario admite hasta 255 tipos de robo')
+
+    cabecera['columnas'] = [[nombre, tipo] for nombre, _, tipo in COLUMNAS_BINARIO]
+    texto = json.dumps(cabecera, ensure_ascii=False).encode()
+    texto += b' ' * (-len(texto) % 4)
+
+    partes = [struct.pack('<I', len(texto)), texto]
+    for nombre, codigo, _ in COLUMNAS_BINARIO:
+        valores = array(codigo, columnas[nombre])
+        if sys.byteorder == 'big':
+            valores.byteswap()
+        partes.append(valores.tobytes())
+    return b''.join(partes)
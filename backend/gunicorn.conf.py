@@ -0,0 +1,18 @@
+from config import Config, mostrar_configuracion
+
+# CONFIGURACIÓN DE GUNICORN
+#
+# Uso: gunicorn -c gunicorn.conf.py wsgi:app
+
+bind = f"{Config.SERVIDOR_HOST}:{Config.SERVIDOR_PUERTO}"
+workers = Config.SERVIDOR_WORKERS
+threads = Config.SERVIDOR_HILOS
+worker_class = 'gthread'
+
+# Sin preload cada worker importa wsgi.py por su cuenta: crea su propio pool
+# de conexiones y precalienta sus índices y cachés antes de aceptar peticiones
+preload_app = False
+
+
+def on_starting(server):
+    mostrar_configuracion()
@@ -0,0 +1,136 @@
+import csv
+import json
+import time
+from datetime import datetime
+from config import Config
+import database as db
+
+CAMPOS_REQUERIDOS = ['usuario_id', 'tipo_robo', 'descripcion', 'latitud', 'longitud', 'fecha_incidente']
+
+# LECTURA DE ARCHIVOS (CSV / NDJSON)
+
+def leer_filas(archivo, formato):
+    """
+    Recorre un archivo de texto abierto sin cargarlo completo en memoria
+    Devuelve (linea, datos, error): datos es un dict o None si la línea no se pudo leer.
+    """
+    if formato == 'csv':
+        lector = csv.DictReader(archivo)
+        for datos in lector:
+            yield lector.line_num, datos, None
+    elif formato == 'ndjson':
+        for linea, texto in enumerate(archivo, start=1):
+            if not texto.strip():
+                continue
+            try:
+                datos = json.loads(texto)
+            except ValueError as e:
+                yield linea, None, f'JSON inválido: {e}'
+                continue
+            if not isinstance(datos, dict):
+                yield linea, None, 'Se esperaba un objeto JSON'
+                continue
+            yield linea, datos, None
+    else:
+        raise ValueError(f'Formato no soportado: {formato} (use csv o ndjson)')
+
+# VALIDACIÓN
+
+def validar_fila(datos):
+    """
+    Convierte una fila a la tupla que recibe db.insertar_reportes_lote
+    Lanza ValueError con el motivo si la fila no es válida
+    """
+    for campo in CAMPOS_REQUERIDOS:
+        if datos.get(campo) in (None, ''):
+            raise ValueError(f'Falta el campo requerido: {campo}')
+
+    try:
+        usuario_id = int(datos['usuario_id'])
+    except (TypeError, ValueError):
+        raise ValueError(f"usuario_id inválido: {datos['usuario_id']!r}")
+
+    try:
+        latitud = float(datos['latitud'])
+        longitud = float(datos['longitud'])
+    except (TypeError, ValueError):
+        raise ValueError('latitud y longitud deben ser números')
+    if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+        raise ValueError(f'Coordenadas fuera de rango: {latitud}, {longitud}')
+
+    try:
+        fecha_incidente = datetime.fromisoformat(str(datos['fecha_incidente']))
+    except ValueError:
+        raise ValueError(f"fecha_incidente inválida: {datos['fecha_incidente']!r}")
+
+    tipo_robo = str(datos['tipo_robo']).strip()
+    if len(tipo_robo) > 50:
+        raise ValueError('tipo_robo supera los 50 caracteres')
+
+    barrio = datos.get('barrio') or None
+    if barrio is not None and len(str(barrio)) > 100:
+        raise ValueError('barrio supera los 100 caracteres')
+
+    return (usuario_id, tipo_robo, str(datos['descripcion']), latitud, longitud, fecha_incidente, barrio)
+
+# IMPORTACIÓN
+
+def importar_reportes(archivo, formato, tamano_lote=None, progreso=None):
+    """
+    Valida e inserta los reportes de un archivo CSV / NDJSON por lotes
+    Cada lote se inserta en una sola transacción (db.insertar_reportes_lote).
+    progreso: función opcional que recibe el resumen parcial después de cada lote
+    Devuelve el resumen: filas leídas, insertadas, errores por fila y filas por segundo
+    """
+    tamano_lote = tamano_lote or Config.IMPORTACION_LOTE
+    inicio = time.perf_counter()
+    resumen = {
+        'filas': 0,
+        'insertados': 0,
+        'con_errores': 0,
+        'errores': [],
+        'segundos': 0.0,
+        'filas_por_segundo': 0.0
+    }
+
+    def registrar_error(linea, mensaje):
+        resumen['con_errores'] += 1
+        if len(resumen['errores']) < Config.IMPORTACION_MAX_ERRORES:
+            resumen['errores'].append({'linea': linea, 'error': mensaje})
+
+    def actualizar_tiempo():
+        resumen['segundos'] = round(time.perf_counter() - inicio, 3)
+        if resumen['segundos'] > 0:
+            resumen['filas_por_segundo'] = round(resumen['filas'] / resumen['segundos'], 1)
+
+    def insertar(lote, lineas):
+        insertados, errores = db.insertar_reportes_lote(lote)
+        resumen['insertados'] += insertados
+        for posicion, mensaje in errores:
+            registrar_error(lineas[posicion], mensaje)
+        actualizar_tiempo()
+        if progreso:
+            progreso(resumen)
+
+    lote = []
+    lineas = []
+    for linea, datos, error in leer_filas(archivo, formato):
+        resumen['filas'] += 1
+        if error is None:
+            try:
+                lote.append(validar_fila(datos))
+                lineas.append(linea)
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            registrar_error(linea, error)
+
+        if len(lote) >= tamano_lote:
+            insertar(lote, lineas)
+            lote, lineas = [], []
+
+    if lote:
+        insertar(lote, lineas)
+    actualizar_tiempo()
+
+    return resumen
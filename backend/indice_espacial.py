@@ -0,0 +1,141 @@
+import math
+
+# ÍNDICE ESPACIAL DE GRILLA UNIFORME
+
+class GrillaEspacial:
+    """
+    Índice espacial de grilla uniforme sobre coordenadas en grados
+    Cada punto se guarda en la celda (fila, columna) de tamaño `tam_celda`,
+    así una búsqueda por radio solo revisa las celdas vecinas en vez de todos los puntos.
+    """
+
+    def __init__(self, tam_celda):
+        if tam_celda <= 0:
+            raise ValueError("tam_celda debe ser mayor que 0")
+        self.tam_celda = tam_celda
+        self._celdas = {}      # (fila, col) -> {clave: (lat, lng)}
+        self._posicion = {}    # clave -> (fila, col)
+
+    @classmethod
+    def desde_puntos(cls, tam_celda, latitudes, longitudes):
+        """Construye la grilla usando como clave la posición de cada punto"""
+        grilla = cls(tam_celda)
+        for i, (lat, lng) in enumerate(zip(latitudes, longitudes)):
+            grilla.agregar(i, lat, lng)
+        return grilla
+
+    def __len__(self):
+        return len(self._posicion)
+
+    def __contains__(self, clave):
+        return clave in self._posicion
+
+    def celda(self, lat, lng):
+        """Celda (fila, columna) que contiene el punto"""
+        return (math.floor(lat / self.tam_celda), math.floor(lng / self.tam_celda))
+
+    def agregar(self, clave, lat, lng):
+        """Agrega (o mueve) un punto; agregar dos veces la misma clave no lo duplica"""
+        if clave in self._posicion:
+            self.eliminar(clave)
+        celda = self.celda(lat, lng)
+        self._celdas.setdefault(celda, {})[clave] = (lat, lng)
+        self._posicion[clave] = celda
+
+    def eliminar(self, clave):
+        """Quita un punto del índice; devuelve False si no estaba"""
+        celda = self._posicion.pop(clave, None)
+        if celda is None:
+            return False
+        puntos = self._celdas[celda]
+        del puntos[clave]
+        if not puntos:
+            del self._celdas[celda]
+        return True
+
+    def vecinos(self, lat, lng, radio):
+        """
+        Devuelve las claves de los puntos a distancia euclidiana < radio
+        Usa la misma fórmula que el cálculo original para dar exactamente el mismo resultado
+        """
+        anillos = max(1, math.ceil(radio / self.tam_celda))
+        fila, col = self.celda(lat, lng)
+        encontrados = []
+
+        for df in range(-anillos, anillos + 1):
+            for dc in range(-anillos, anillos + 1):
+                puntos = self._celdas.get((fila + df, col + dc))
+                if not puntos:
+                    continue
+                for clave, (lat2, lng2) in puntos.items():
+                    distancia = ((lat - lat2)**2 + (lng - lng2)**2)**0.5
+                    if distancia < radio:
+                        encontrados.append(clave)
+
+        return encontrados
+
+    def contar_cercanos(self, lat, lng, radio):
+        """Cantidad de puntos a distancia < radio"""
+        return len(self.vecinos(lat, lng, radio))
+
+# RUTAS (POLILÍNEAS)
+
+def decodificar_polilinea(texto, precision=5):
+    """Decodifica una polilínea codificada (formato de Google / OSRM) a [(lat, lng), ...]"""
+    puntos = []
+    indice = lat = lng = 0
+    factor = 10 ** precision
+
+    while indice < len(texto):
+        valores = []
+        for _ in range(2):
+            resultado = desplazamiento = 0
+            while True:
+                b = ord(texto[indice]) - 63
+                indice += 1
+                resultado |= (b & 0x1f) << desplazamiento
+                desplazamiento += 5
+                if b < 0x20:
+                    break
+            valores.append(~(resultado >> 1) if resultado & 1 else resultado >> 1)
+        lat += valores[0]
+        lng += valores[1]
+        puntos.append((lat / factor, lng / factor))
+
+    return puntos
+
+
+def contar_muestras_polilinea(vertices, paso):
+    """Cantidad de puntos que devolvería muestrear_polilinea, sin generarlos"""
+    if paso <= 0:
+        raise ValueError('paso debe ser mayor que 0')
+    if not vertices:
+        return 0
+
+    total = 1
+    for (lat1, lng1), (lat2, lng2) in zip(vertices, vertices[1:]):
+        largo = ((lat2 - lat1)**2 + (lng2 - lng1)**2)**0.5
+        total += max(1, math.ceil(largo / paso))
+    return total
+
+
+def muestrear_polilinea(vertices, paso):
+    """
+    Devuelve puntos a lo largo de la ruta separados como máximo `paso` grados,
+    incluyendo todos los vértices
+    """
+    if paso <= 0:
+        raise ValueError('paso debe ser mayor que 0')
+    if not vertices:
+        return []
+
+    puntos = []
+    for (lat1, lng1), (lat2, lng2) in zip(vertices, vertices[1:]):
+        largo = ((lat2 - lat1)**2 + (lng2 - lng1)**2)**0.5
+        partes = max(1, math.ceil(largo / paso))
+        for k in range(partes):
+            t = k / partes
+            puntos.append((lat1 + (lat2 - lat1) * t, lng1 + (lng2 - lng1) * t))
+    puntos.append(tuple(vertices[-1]))
+
+    return puntos
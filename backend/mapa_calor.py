@@ -0,0 +1,246 @@
+import math
+import os
+import shutil
+import struct
+import threading
+import zlib
+from config import Config
+import database as db
+from teselas import CacheTeselas, lat_lng_a_pixel, pixel_a_lat_lng
+
+try:
+    import numpy as np
+except ImportError:  # sin NumPy se usa la versión en Python puro
+    np = None
+
+TAM_TESELA = 256
+
+# PALETA DE COLORES (transparente -> verde -> amarillo -> rojo)
+
+def _crear_paleta():
+    paleta = []
+    for i in range(256):
+        t = i / 255
+        if t < 0.5:
+            r, g = int(510 * t), 200
+        else:
+            r, g = 255, int(200 * (2 - 2 * t))
+        alfa = 0 if i == 0 else int(60 + 160 * t)
+        paleta.append((r, g, 40, alfa))
+    return paleta
+
+_PALETA = _crear_paleta()
+
+# CODIFICACIÓN PNG
+
+def _codificar_png(ancho, alto, datos_filas):
+    """PNG RGBA de 8 bits; datos_filas ya trae el byte de filtro (0) al inicio de cada fila"""
+    def bloque(tipo, datos):
+        contenido = tipo + datos
+        return struct.pack('>I', len(datos)) + contenido + struct.pack('>I', zlib.crc32(contenido) & 0xffffffff)
+
+    encabezado = struct.pack('>IIBBBBB', ancho, alto, 8, 6, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + bloque(b'IHDR', encabezado)
+        + bloque(b'IDAT', zlib.compress(datos_filas, 6))
+        + bloque(b'IEND', b'')
+    )
+
+TESELA_VACIA = _codificar_png(TAM_TESELA, TAM_TESELA, bytes((1 + 4 * TAM_TESELA) * TAM_TESELA))
+
+# DENSIDAD POR KERNEL
+
+def _kernel(radio):
+    """Kernel gaussiano 1-D (separable) de 2*radio+1 valores, con máximo 1"""
+    sigma = radio / 2
+    return [math.exp(-(d * d) / (2 * sigma * sigma)) for d in range(-radio, radio + 1)]
+
+
+def _densidad_numpy(pixeles, radio):
+    lado = TAM_TESELA + 2 * radio
+    xs = np.fromiter((p[0] for p in pixeles), dtype=np.int64, count=len(pixeles)) + radio
+    ys = np.fromiter((p[1] for p in pixeles), dtype=np.int64, count=len(pixeles)) + radio
+    dentro = (xs >= 0) & (xs < lado) & (ys >= 0) & (ys < lado)
+    conteo = np.zeros((lado, lado))
+    np.add.at(conteo, (ys[dentro], xs[dentro]), 1.0)
+
+    # Convolución separable: K_filas @ conteo @ K_columnas, recortada a la tesela
+    k = np.array(_kernel(radio))
+    banda = np.zeros((TAM_TESELA, lado))
+    for i in range(TAM_TESELA):
+        banda[i, i:i + 2 * radio + 1] = k
+    return banda @ conteo @ banda.T
+
+
+def _densidad_python(pixeles, radio):
+    k = _kernel(radio)
+    densidad = [[0.0] * TAM_TESELA for _ in range(TAM_TESELA)]
+    conteo = {}
+    for p in pixeles:
+        conteo[p] = conteo.get(p, 0) + 1
+
+    for (px, py), cantidad in conteo.items():
+        for dy in range(-radio, radio + 1):
+            fila_y = py + dy
+            if not 0 <= fila_y < TAM_TESELA:
+                continue
+            fila = densidad[fila_y]
+            peso_y = cantidad * k[dy + radio]
+            for dx in range(max(-radio, -px), min(radio, TAM_TESELA - 1 - px) + 1):
+                fila[px + dx] += peso_y * k[dx + radio]
+    return densidad
+
+
+def _colorear(densidad, saturacion):
+    """Convierte la densidad a filas PNG RGBA con la paleta"""
+    if np is not None and not isinstance(densidad, list):
+        indices = np.clip(densidad / saturacion * 255, 0, 255).astype(np.uint8)
+        rgba = np.array(_PALETA, dtype=np.uint8)[indices].reshape(TAM_TESELA, TAM_TESELA * 4)
+        filas = np.hstack([np.zeros((TAM_TESELA, 1), dtype=np.uint8), rgba])
+        return filas.tobytes()
+
+    paleta = [bytes(c) for c in _PALETA]
+    partes = []
+    for fila in densidad:
+        partes.append(b'\x00')
+        partes.append(b''.join(paleta[min(255, int(v / saturacion * 255))] for v in fila))
+    return b''.join(partes)
+
+
+def generar_tesela(zoom, x, y):
+    """
+    Genera el PNG de densidad (kernel gaussiano) de una tesela
+    Se incluyen los reportes hasta HEATMAP_RADIO_PX píxeles fuera de la tesela
+    para que no se noten los bordes entre teselas vecinas.
+    Devuelve None si no se pudo leer la base de datos.
+    """
+    radio = Config.HEATMAP_RADIO_PX
+    x0 = x * TAM_TESELA
+    y0 = y * TAM_TESELA
+    norte, oeste = pixel_a_lat_lng(x0 - radio, y0 - radio, zoom)
+    sur, este = pixel_a_lat_lng(x0 + TAM_TESELA + radio, y0 + TAM_TESELA + radio, zoom)
+
+    coordenadas = db.obtener_coordenadas_bbox((oeste, sur, este, norte))
+    if coordenadas is None:
+        return None
+    if not coordenadas:
+        return TESELA_VACIA
+
+    pixeles = []
+    for lat, lng in coordenadas:
+        px, py = lat_lng_a_pixel(lat, lng, zoom)
+        pixeles.append((int(px) - x0, int(py) - y0))
+
+    if np is not None:
+        densidad = _densidad_numpy(pixeles, radio)
+    else:
+        densidad = _densidad_python(pixeles, radio)
+
+    return _codificar_png(TAM_TESELA, TAM_TESELA, _colorear(densidad, Config.HEATMAP_SATURACION))
+
+# CACHÉ (MEMORIA Y DISCO)
+
+_cache = CacheTeselas(Config.HEATMAP_CACHE_MAX)
+
+# Teselas que se están generando: clave -> [invalidaciones, generaciones en curso]
+# Igual que CacheTeselas con la memoria: si la tesela se invalidó mientras se
+# generaba, el PNG puede estar viejo y no se escribe en disco
+_generando = {}
+_disco_lock = threading.Lock()
+
+
+def _ruta_disco(zoom, x, y):
+    return os.path.join(Config.HEATMAP_DIR, str(zoom), str(x), f"{y}.png")
+
+
+def obtener_tesela(zoom, x, y):
+    """
+    PNG de la tesela desde la caché en memoria, la de disco o generándolo
+    Devuelve None si la base de datos falló (no se guarda en ninguna de las cachés)
+    """
+    clave = (zoom, x, y)
+
+    def calcular():
+        if Config.HEATMAP_DIR:
+            ruta = _ruta_disco(zoom, x, y)
+            if os.path.exists(ruta):
+                with open(ruta, 'rb') as archivo:
+                    return archivo.read()
+
+        with _disco_lock:
+            estado = _generando.setdefault(clave, [0, 0])
+            estado[1] += 1
+            version = estado[0]
+        try:
+            png = generar_tesela(zoom, x, y)
+            if png is not None and Config.HEATMAP_DIR:
+                _guardar_en_disco(clave, ruta, png, version)
+        finally:
+            with _disco_lock:
+                estado = _generando[clave]
+                estado[1] -= 1
+                if not estado[1]:
+                    del _generando[clave]
+        return png
+
+    return _cache.obtener(clave, calcular)
+
+
+def _guardar_en_disco(clave, ruta, png, version):
+    """Escribe el PNG salvo que la tesela se haya invalidado después de `version`"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, 'wb') as archivo:
+        archivo.write(png)
+    with _disco_lock:
+        # Con el lock, _invalidar_teselas no puede borrar entre la comprobación y el reemplazo
+        vigente = _generando[clave][0] == version
+        if vigente:
+            os.replace(temporal, ruta)
+    if not vigente:
+        os.remove(temporal)
+
+
+def teselas_afectadas(lat, lng):
+    """Teselas (en todos los zooms) cuyo mapa de calor cambia si se agrega o quita este punto"""
+    radio = Config.HEATMAP_RADIO_PX
+    afectadas = []
+    for zoom in range(Config.ZOOM_MAX + 1):
+        px, py = lat_lng_a_pixel(lat, lng, zoom)
+        maximo = 2 ** zoom - 1
+        for tx in range(max(0, int(px - radio) // TAM_TESELA), min(maximo, int(px + radio) // TAM_TESELA) + 1):
+            for ty in range(max(0, int(py - radio) // TAM_TESELA), min(maximo, int(py + radio) // TAM_TESELA) + 1):
+                afectadas.append((zoom, tx, ty))
+    return afectadas
+
+
+def _invalidar_teselas(evento, reporte):
+    if evento == 'recargar':
+        _invalidar_todas()
+        return
+    afectadas = teselas_afectadas(float(reporte['latitud']), float(reporte['longitud']))
+    _cache.invalidar(afectadas)
+    with _disco_lock:
+        for clave in afectadas:
+            if clave in _generando:
+                _generando[clave][0] += 1
+        if Config.HEATMAP_DIR:
+            for clave in afectadas:
+                try:
+                    os.remove(_ruta_disco(*clave))
+                except FileNotFoundError:
+                    pass
+
+
+def _invalidar_todas():
+    """Después de un lote: se descartan todas las teselas en memoria y en disco"""
+    _cache.limpiar()
+    with _disco_lock:
+        for estado in _generando.values():
+            estado[0] += 1
+        if Config.HEATMAP_DIR:
+            shutil.rmtree(Config.HEATMAP_DIR, ignore_errors=True)
+
+
+db.suscribir_cambios(_invalidar_teselas)
@@ -1,19 +1,223 @@
+import random
+import tempfile
+import threading
 from datetime import datetime, timedelta
 from collections import Counter
 import database as db
+from config import Config
+from indice_espacial import GrillaEspacial
+import espacial
+import agrupamiento
+import cubo
+import decaimiento
+import columnas_disco
+from analitica import EstadoAnalitico
+from columnas import (
+    NUMPY_DISPONIBLE, SnapshotColumnar, resumir_columnas,
+    agrupar_zonas_columnas, contar_cercanos_columnas
+)
+
+DIAS_NOMBRE = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+# SNAPSHOT DE REPORTES
+
+def obtener_snapshot(columnar=None):
+    """
+    Carga de una sola vez los reportes sobre los que se calculan las predicciones
+    Todas las funciones calcular_* aceptan este snapshot para no volver a leer la tabla
+    columnar: True devuelve un SnapshotColumnar (NumPy), False la lista de filas.
+    Por defecto se usa NumPy si está instalado y Config.USAR_NUMPY está activo.
+    Con Config.SNAPSHOT_DIR el SnapshotColumnar son las columnas .npy exportadas,
+    abiertas con mmap (columnas_disco.py) en vez de leer las filas con psycopg2.
+    Lanza ConnectionError si no se pudieron leer los reportes.
+    """
+    if columnar is None:
+        columnar = Config.USAR_NUMPY and NUMPY_DISPONIBLE
+    if columnar and Config.SNAPSHOT_DIR:
+        snapshot = columnas_disco.obtener_snapshot_disco()
+        if snapshot is not None:
+            return snapshot
+    
+    reportes = _leer_reportes()
+    if columnar:
+        return SnapshotColumnar.desde_reportes(reportes)
+    return reportes
+
+
+def _leer_reportes():
+    """
+    db.obtener_todos_reportes, pero una lectura fallida lanza una excepción: una
+    lista vacía se tomaría por una tabla vacía y se guardaría en cachés e índices
+    """
+    reportes = db.obtener_todos_reportes()
+    if reportes is None:
+        raise ConnectionError('No se pudieron leer los reportes de la base de datos')
+    return reportes
+
+
+def resumir_snapshot(reportes, ahora=None):
+    """
+    Recorre el snapshot una sola vez y acumula los conteos que usan
+    las predicciones temporales (horas, días, tipos y tendencia)
+    """
+    if isinstance(reportes, SnapshotColumnar):
+        return resumir_columnas(reportes, ahora)
+    
+    if ahora is None:
+        ahora = datetime.now()
+    hace_7_dias = ahora - timedelta(days=7)
+    hace_14_dias = ahora - timedelta(days=14)
+    
+    horas = {}
+    dias = {}
+    tipos = Counter()
+    semana_actual = 0
+    semana_anterior = 0
+    
+    for r in reportes:
+        fecha = r['fecha_incidente']
+        horas[fecha.hour] = horas.get(fecha.hour, 0) + 1
+        dia = fecha.weekday()  # 0=Lunes, 6=Domingo
+        dias[dia] = dias.get(dia, 0) + 1
+        tipos[r['tipo_robo']] += 1
+        
+        creacion = r['fecha_creacion']
+        if creacion >= hace_7_dias:
+            semana_actual += 1
+        elif creacion >= hace_14_dias:
+            semana_anterior += 1
+    
+    return {
+        'horas': horas,
+        'dias': dias,
+        'tipos': tipos,
+        'semana_actual': semana_actual,
+        'semana_anterior': semana_anterior,
+        'total': len(reportes)
+    }
 
 # CALCULAR ZONAS DE RIESGO
 
-def calcular_zonas_riesgo(radio=0.01):
+def calcular_zonas_riesgo(radio=0.01, reportes=None, algoritmo=None):
     """
     Identifica zonas con alta concentración de robos
     radio: distancia en grados (0.01 ≈ 1km)
+    reportes: snapshot ya cargado (si no se pasa, se usa el estado analítico
+              para el radio por defecto o se lee de la base de datos)
+    algoritmo: 'voraz' o 'dbscan' (por defecto Config.ALGORITMO_ZONAS); con
+               'dbscan' (y NumPy) las zonas son clusters DBSCAN
     """
-    reportes = db.obtener_todos_reportes()
+    if algoritmo is None:
+        algoritmo = Config.ALGORITMO_ZONAS
+    dbscan = algoritmo == 'dbscan' and NUMPY_DISPONIBLE
+    
+    if reportes is None:
+        if dbscan:
+            reportes = obtener_snapshot(columnar=True)
+        else:
+            estado = obtener_estado_analitico()
+            if radio == estado.radio:
+                return _zonas_riesgo_estado(estado)
+            reportes = obtener_snapshot()
     
     if not reportes or len(reportes) < 2:
         return []
     
+    if dbscan:
+        if not isinstance(reportes, SnapshotColumnar):
+            reportes = SnapshotColumnar.desde_reportes(reportes)
+        return _zonas_riesgo_dbscan(reportes, radio)
+    
+    if isinstance(reportes, SnapshotColumnar):
+        return _zonas_riesgo_columnas(reportes, radio)
+    
+    # Convertir las coordenadas una sola vez (Decimal -> float)
+    latitudes = [float(r['latitud']) for r in reportes]
+    longitudes = [float(r['longitud']) for r in reportes]
+    tipos = [r['tipo_robo'] for r in reportes]
+    
+    # Índice de grilla con celdas del tamaño del radio: solo se comparan celdas vecinas
+    grilla = GrillaEspacial.desde_puntos(radio, latitudes, longitudes)
+    
+    zonas = []
+    
+    for i in range(len(reportes)):
+        # Los reportes ya agrupados salen del índice
+        if not grilla.eliminar(i):
+            continue
+        
+        # Mismo criterio que el clustering voraz original: los cercanos
+        # aún libres se agregan en el orden del snapshot
+        cercanos = sorted(grilla.vecinos(latitudes[i], longitudes[i], radio))
+        for j in cercanos:
+            grilla.eliminar(j)
+        
+        # Si hay 2+ robos cercanos = zona de riesgo
+        if cercanos:
+            zonas.append(_crear_zona([i] + cercanos, latitudes, longitudes, tipos, radio))
+    
+    return sorted(zonas, key=lambda x: x['cantidad_robos'], reverse=True)[:10]
+
+
+def _zonas_riesgo_columnas(snapshot, radio):
+    """Mismo clustering sobre el snapshot columnar (NumPy)"""
+    clusters = agrupar_zonas_columnas(snapshot, radio)
+    
+    latitudes = snapshot.latitud.tolist()
+    longitudes = snapshot.longitud.tolist()
+    tipos = [snapshot.tipos[c] for c in snapshot.tipo.tolist()]
+    
+    zonas = [
+        _crear_zona(cluster.tolist(), latitudes, longitudes, tipos, radio)
+        for cluster in clusters
+    ]
+    return sorted(zonas, key=lambda x: x['cantidad_robos'], reverse=True)[:10]
+
+
+def _zonas_riesgo_dbscan(snapshot, radio):
+    """
+    Zonas = los 10 clusters DBSCAN más grandes (eps = radio)
+    Un cluster puede ser más largo que el radio: radio_metros va del centro
+    al reporte más lejano
+    """
+    etiquetas = agrupamiento.dbscan(snapshot.latitud, snapshot.longitud, radio, Config.DBSCAN_MIN_PUNTOS)
+    
+    zonas = []
+    for cluster in agrupamiento.clusters_dbscan(etiquetas)[:10]:
+        latitudes = snapshot.latitud[cluster]
+        longitudes = snapshot.longitud[cluster]
+        extension = ((latitudes - latitudes.mean())**2 + (longitudes - longitudes.mean())**2).max() ** 0.5
+        tipos = [snapshot.tipos[c] for c in snapshot.tipo[cluster].tolist()]
+        zonas.append(_crear_zona(
+            range(len(cluster)), latitudes.tolist(), longitudes.tolist(), tipos, max(radio, float(extension))
+        ))
+    return zonas
+
+
+def _crear_zona(cluster, latitudes, longitudes, tipos, radio):
+    lat_centro = sum(latitudes[k] for k in cluster) / len(cluster)
+    lng_centro = sum(longitudes[k] for k in cluster) / len(cluster)
+    
+    tipo_comun = Counter(tipos[k] for k in cluster).most_common(1)[0][0]
+    
+    return {
+        'latitud': lat_centro,
+        'longitud': lng_centro,
+        'cantidad_robos': len(cluster),
+        'nivel_riesgo': calcular_nivel_riesgo(len(cluster)),
+        'tipo_mas_comun': tipo_comun,
+        'radio_metros': int(radio * 111000)
+    }
+
+
+def _zonas_riesgo_referencia(reportes, radio=0.01):
+    """
+    Implementación original O(n²) del clustering voraz
+    Solo se usa para verificar que calcular_zonas_riesgo da los mismos resultados
+    """
+    if not reportes or len(reportes) < 2:
+        return []
+    
     zonas = []
     procesados = set()
     
@@ -24,7 +228,6 @@ def calcular_zonas_riesgo(radio=0.01):
         lat1 = float(reporte['latitud'])
         lng1 = float(reporte['longitud'])
         
-        # Buscar reportes cercanos (clustering simple)
         cluster = [reporte]
         procesados.add(i)
         
@@ -35,14 +238,12 @@ def calcular_zonas_riesgo(radio=0.01):
             lat2 = float(otro['latitud'])
             lng2 = float(otro['longitud'])
             
-            # Distancia euclidiana aproximada
             distancia = ((lat1 - lat2)**2 + (lng1 - lng2)**2)**0.5
             
             if distancia < radio:
                 cluster.append(otro)
                 procesados.add(j)
         
-        # Si hay 2+ robos cercanos = zona de riesgo
         if len(cluster) >= 2:
             lat_centro = sum(float(r['latitud']) for r in cluster) / len(cluster)
             lng_centro = sum(float(r['longitud']) for r in cluster) / len(cluster)
@@ -62,6 +263,60 @@ def calcular_zonas_riesgo(radio=0.01):
     return sorted(zonas, key=lambda x: x['cantidad_robos'], reverse=True)[:10]
 
 
+def verificar_zonas_riesgo(reportes=None, radios=(0.001, 0.005, 0.01, 0.02)):
+    """
+    Compara el clustering voraz de calcular_zonas_riesgo (con índice espacial y, si
+    hay NumPy, sobre columnas) contra la implementación original sobre el mismo
+    snapshot, sin importar Config.ALGORITMO_ZONAS. Con `reportes` (por ejemplo
+    reportes_sinteticos()) no usa la base de datos.
+    Devuelve la lista de radios que no coinciden.
+    """
+    if reportes is None:
+        reportes = obtener_snapshot(columnar=False)
+    columnar = SnapshotColumnar.desde_reportes(reportes) if NUMPY_DISPONIBLE else None
+    
+    diferencias = []
+    for radio in radios:
+        esperado = _zonas_riesgo_referencia(reportes, radio)
+        if calcular_zonas_riesgo(radio, reportes=reportes, algoritmo='voraz') != esperado:
+            diferencias.append(radio)
+        elif columnar is not None and calcular_zonas_riesgo(radio, reportes=columnar, algoritmo='voraz') != esperado:
+            diferencias.append(radio)
+    return diferencias
+
+
+def reportes_sinteticos(cantidad=2000, semilla=0):
+    """
+    Filas con la forma de obtener_todos_reportes (más recientes primero) y
+    puntos al azar alrededor de Bogotá, para las verificaciones sin base de datos
+    """
+    azar = random.Random(semilla)
+    tipos = list(Config.CUBO_TIPOS) + ['Otro']
+    base = datetime(2024, 1, 1)
+    reportes = []
+    for i in range(1, cantidad + 1):
+        # La mitad agrupados alrededor de unos pocos focos, para que haya zonas
+        if i % 2:
+            lat, lng = azar.uniform(4.45, 4.85), azar.uniform(-74.25, -73.95)
+        else:
+            foco = azar.randrange(20)
+            lat = 4.5 + foco * 0.015 + azar.gauss(0, 0.004)
+            lng = -74.2 + foco * 0.01 + azar.gauss(0, 0.004)
+        creacion = base + timedelta(minutes=i * 37)
+        reportes.append({
+            'id': i,
+            'usuario_id': 1,
+            'tipo_robo': azar.choice(tipos),
+            'descripcion': None,
+            'latitud': round(lat, 6),
+            'longitud': round(lng, 6),
+            'fecha_incidente': creacion - timedelta(hours=azar.randrange(72)),
+            'fecha_creacion': creacion,
+            'barrio': None
+        })
+    return sorted(reportes, key=lambda r: (r['fecha_creacion'], r['id']), reverse=True)
+
+
 def calcular_nivel_riesgo(cantidad):
     if cantidad >= 5:
         return 'ALTO'
@@ -72,18 +327,17 @@ def calcular_nivel_riesgo(cantidad):
 
 # CALCULAR HORAS PELIGROSAS
 
-def calcular_horas_peligrosas():
-    reportes = db.obtener_todos_reportes()
+def calcular_horas_peligrosas(reportes=None):
+    if reportes is None:
+        reportes = obtener_snapshot()
     
     if not reportes:
         return []
     
-    horas = {}
-    for r in reportes:
-        fecha = r['fecha_incidente']
-        hora = fecha.hour
-        horas[hora] = horas.get(hora, 0) + 1
-    
+    return _formatear_horas(resumir_snapshot(reportes)['horas'])
+
+
+def _formatear_horas(horas):
     # Top 5 horas
     ordenado = sorted(horas.items(), key=lambda x: x[1], reverse=True)[:5]
     
@@ -98,26 +352,23 @@ def calcular_horas_peligrosas():
 
 # CALCULAR DÍAS PELIGROSOS
 
-def calcular_dias_peligrosos():
+def calcular_dias_peligrosos(reportes=None):
     """Identifica los días de la semana con más robos"""
-    reportes = db.obtener_todos_reportes()
+    if reportes is None:
+        reportes = obtener_snapshot()
     
     if not reportes:
         return []
     
-    dias_nombre = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-    dias = {}
-    
-    for r in reportes:
-        fecha = r['fecha_incidente']
-        dia = fecha.weekday()  # 0=Lunes, 6=Domingo
-        dias[dia] = dias.get(dia, 0) + 1
-    
+    return _formatear_dias(resumir_snapshot(reportes)['dias'])
+
+
+def _formatear_dias(dias):
     ordenado = sorted(dias.items(), key=lambda x: x[1], reverse=True)
     
     return [
         {
-            'dia': dias_nombre[dia],
+            'dia': DIAS_NOMBRE[dia],
             'cantidad': cantidad
         }
         for dia, cantidad in ordenado
@@ -127,37 +378,41 @@ def calcular_dias_peligrosos():
 
 # CALCULAR TIPO MÁS COMÚN
 
-def calcular_tipo_mas_comun():
-    reportes = db.obtener_todos_reportes()
+def calcular_tipo_mas_comun(reportes=None):
+    if reportes is None:
+        reportes = obtener_snapshot()
     
     if not reportes:
         return None
     
-    tipos = [r['tipo_robo'] for r in reportes]
-    contador = Counter(tipos)
-    mas_comun = contador.most_common(1)[0]
+    return _formatear_tipo_mas_comun(resumir_snapshot(reportes))
+
+
+def _formatear_tipo_mas_comun(resumen):
+    mas_comun = resumen['tipos'].most_common(1)[0]
     
     return {
         'tipo': mas_comun[0],
         'cantidad': mas_comun[1],
-        'porcentaje': round((mas_comun[1] / len(reportes)) * 100, 1)
+        'porcentaje': round((mas_comun[1] / resumen['total']) * 100, 1)
     }
 
 
 # CALCULAR TENDENCIA
 
-def calcular_tendencia():
-    reportes = db.obtener_todos_reportes()
+def calcular_tendencia(reportes=None):
+    if reportes is None:
+        reportes = obtener_snapshot()
     
     if not reportes:
         return None
     
-    ahora = datetime.now()
-    hace_7_dias = ahora - timedelta(days=7)
-    hace_14_dias = ahora - timedelta(days=14)
-    
-    semana_actual = sum(1 for r in reportes if r['fecha_creacion'] >= hace_7_dias)
-    semana_anterior = sum(1 for r in reportes if hace_14_dias <= r['fecha_creacion'] < hace_7_dias)
+    return _formatear_tendencia(resumir_snapshot(reportes))
+
+
+def _formatear_tendencia(resumen):
+    semana_actual = resumen['semana_actual']
+    semana_anterior = resumen['semana_anterior']
     
     if semana_anterior == 0:
         cambio = 0
@@ -180,39 +435,365 @@ def calcular_tendencia():
 
 # GENERAR REPORTE COMPLETO
 
-def generar_reporte_completo():
+def generar_reporte_completo(reportes=None):
+    """
+    Calcula todas las predicciones
+    Sin snapshot se leen del estado analítico incremental (sin recorrer los reportes);
+    con un snapshot se calculan sobre él.
+    """
     
     print(" Generando predicciones...")
     
+    if reportes is None:
+        estado = obtener_estado_analitico()
+        resumen = estado.resumen()
+        zonas = calcular_zonas_riesgo(estado.radio)
+    else:
+        resumen = resumir_snapshot(reportes) if reportes else None
+        zonas = calcular_zonas_riesgo(reportes=reportes) if reportes else []
+    
+    if not resumen or not resumen['total']:
+        return {
+            'zonas_riesgo': [],
+            'horas_peligrosas': [],
+            'dias_peligrosos': [],
+            'tipo_mas_comun': None,
+            'tendencia': None,
+            'total_reportes': 0,
+            'fecha_generacion': datetime.now().isoformat()
+        }
+    
     return {
-        'zonas_riesgo': calcular_zonas_riesgo(),
-        'horas_peligrosas': calcular_horas_peligrosas(),
-        'dias_peligrosos': calcular_dias_peligrosos(),
-        'tipo_mas_comun': calcular_tipo_mas_comun(),
-        'tendencia': calcular_tendencia(),
-        'total_reportes': len(db.obtener_todos_reportes()),
+        'zonas_riesgo': zonas,
+        'horas_peligrosas': _formatear_horas(resumen['horas']),
+        'dias_peligrosos': _formatear_dias(resumen['dias']),
+        'tipo_mas_comun': _formatear_tipo_mas_comun(resumen),
+        'tendencia': _formatear_tendencia(resumen),
+        'total_reportes': resumen['total'],
         'fecha_generacion': datetime.now().isoformat()
     }
 
+# ESTADO ANALÍTICO INCREMENTAL
+
+_estado = None
+_estado_lock = threading.RLock()               # publicación del estado y avisos pendientes
+_estado_construccion = threading.RLock()       # una reconstrucción a la vez
+_estado_pendientes = None                      # avisos recibidos durante la reconstrucción
+
+def obtener_estado_analitico():
+    """
+    Estado con los conteos de las predicciones (ver analitica.EstadoAnalitico)
+    Se construye al primer uso y luego se actualiza con cada reporte creado o eliminado
+    """
+    estado = _estado
+    if estado is None:
+        with _estado_construccion:
+            estado = _estado
+            if estado is None:
+                estado = reconstruir_estado_analitico()
+    return estado
+
+
+def reconstruir_estado_analitico(reportes=None):
+    """
+    Reconstruye el estado completo (arranque en frío o después de una importación)
+    Los avisos que llegan mientras se leen los reportes se guardan y se aplican
+    sobre el estado nuevo antes de publicarlo (agregar y eliminar son idempotentes
+    por id, así que repetir uno que ya estaba en la lectura no cambia nada)
+    Si no se pueden leer los reportes lanza ConnectionError y no publica nada:
+    la próxima consulta vuelve a intentarlo
+    """
+    global _estado, _estado_pendientes
+    with _estado_construccion:
+        with _estado_lock:
+            _estado_pendientes = []
+        try:
+            if reportes is None:
+                reportes = _leer_reportes()
+            estado = EstadoAnalitico.desde_reportes(reportes)
+            
+            with _estado_lock:
+                # Un lote confirmado durante la lectura puede no estar en ella:
+                # el estado sirve para esta consulta pero no se publica
+                if not any(evento == 'recargar' for evento, _ in _estado_pendientes):
+                    for evento, reporte in _estado_pendientes:
+                        _aplicar_aviso_estado(estado, evento, reporte)
+                    _estado = estado
+        finally:
+            with _estado_lock:
+                _estado_pendientes = None
+        return estado
+
+
+def _aplicar_aviso_estado(estado, evento, reporte):
+    if evento == 'creado':
+        estado.agregar(reporte)
+    elif evento == 'eliminado':
+        estado.eliminar(reporte)
+
+
+def _actualizar_estado(evento, reporte):
+    """Mantiene el estado al día con los avisos de database.py"""
+    global _estado
+    with _estado_lock:
+        if _estado_pendientes is not None:
+            _estado_pendientes.append((evento, reporte))
+        estado = _estado
+        if evento == 'recargar':
+            _estado = None  # se reconstruye en la próxima consulta
+            return
+    # Sin estado ni reconstrucción en curso no hay nada que hacer: la primera
+    # lectura ya incluye este cambio (se avisa después del commit)
+    if estado is not None:
+        _aplicar_aviso_estado(estado, evento, reporte)
+
+
+db.suscribir_cambios(_actualizar_estado)
+
+
+def _zonas_riesgo_estado(estado):
+    zonas = []
+    for miembros in estado.zonas():
+        latitudes = [m[0] for m in miembros]
+        longitudes = [m[1] for m in miembros]
+        tipos = [m[2] for m in miembros]
+        zonas.append(_crear_zona(range(len(miembros)), latitudes, longitudes, tipos, estado.radio))
+    return sorted(zonas, key=lambda x: x['cantidad_robos'], reverse=True)[:10]
+
+
+def verificar_estado_analitico(reportes=None, estado=None):
+    """
+    Compara el estado incremental contra el cálculo completo sobre el snapshot
+    (por defecto el mismo que usa calcular_zonas_riesgo, obtener_snapshot()).
+    Devuelve la lista de claves que no coinciden.
+    """
+    if reportes is None:
+        reportes = obtener_snapshot()
+    if estado is None:
+        estado = obtener_estado_analitico()
+    
+    ahora = datetime.now()
+    esperado = resumir_snapshot(reportes, ahora)
+    obtenido = estado.resumen(ahora)
+    diferencias = [clave for clave in esperado if esperado[clave] != obtenido[clave]]
+    
+    if _zonas_riesgo_estado(estado) != calcular_zonas_riesgo(estado.radio, reportes=reportes, algoritmo='voraz'):
+        diferencias.append('zonas_riesgo')
+    return diferencias
+
+# ÍNDICE DE UBICACIONES
+
+_indice = None
+_indice_lock = threading.RLock()               # lecturas y cambios del índice
+_indice_construccion = threading.RLock()       # una reconstrucción a la vez
+_indice_pendientes = None                      # avisos recibidos durante la reconstrucción
+
+def obtener_indice_ubicaciones():
+    """
+    Índice espacial de reportes (clave = id) para predecir riesgo por ubicación
+    Se construye al primer uso y luego se actualiza con cada reporte creado o eliminado
+    """
+    indice = _indice
+    if indice is None:
+        with _indice_construccion:
+            indice = _indice
+            if indice is None:
+                indice = reconstruir_indice_ubicaciones()
+    return indice
+
+
+def reconstruir_indice_ubicaciones(reportes=None):
+    """
+    Reconstruye el índice completo (arranque en frío o después de una importación)
+    Los avisos que llegan mientras se leen los reportes se guardan y se aplican
+    sobre el índice nuevo antes de publicarlo (agregar y eliminar por id son
+    idempotentes, así que repetir uno que ya estaba en la lectura no cambia nada)
+    Si no se pueden leer los reportes lanza ConnectionError y no publica nada
+    """
+    global _indice, _indice_pendientes
+    with _indice_construccion:
+        with _indice_lock:
+            _indice_pendientes = []
+        try:
+            if reportes is None:
+                reportes = obtener_snapshot()
+            
+            grilla = GrillaEspacial(Config.INDICE_TAM_CELDA)
+            if not len(reportes):
+                puntos = ()  # tabla vacía: el índice empieza vacío y se llena con los avisos
+            elif isinstance(reportes, SnapshotColumnar):
+                puntos = zip(reportes.ids.tolist(), reportes.latitud.tolist(), reportes.longitud.tolist())
+            else:
+                puntos = ((r['id'], float(r['latitud']), float(r['longitud'])) for r in reportes)
+            for reporte_id, lat, lng in puntos:
+                grilla.agregar(reporte_id, lat, lng)
+            
+            with _indice_lock:
+                # Igual que en reconstruir_estado_analitico: con un lote de por medio no se publica
+                if not any(evento == 'recargar' for evento, _ in _indice_pendientes):
+                    for evento, reporte in _indice_pendientes:
+                        _aplicar_aviso_indice(grilla, evento, reporte)
+                    _indice = grilla
+        finally:
+            with _indice_lock:
+                _indice_pendientes = None
+        return grilla
+
+
+def _aplicar_aviso_indice(grilla, evento, reporte):
+    if evento == 'creado':
+        grilla.agregar(reporte['id'], float(reporte['latitud']), float(reporte['longitud']))
+    elif evento == 'eliminado':
+        grilla.eliminar(reporte['id'])
+
+
+def _actualizar_indice(evento, reporte):
+    """Mantiene el índice al día con los avisos de database.py"""
+    global _indice
+    with _indice_lock:
+        if _indice_pendientes is not None:
+            _indice_pendientes.append((evento, reporte))
+        if evento == 'recargar':
+            _indice = None  # se reconstruye en la próxima consulta
+        elif _indice is not None:
+            _aplicar_aviso_indice(_indice, evento, reporte)
+        # Sin índice ni reconstrucción en curso no hay nada que hacer: la
+        # primera lectura ya incluye este cambio (se avisa después del commit)
+
+
+db.suscribir_cambios(_actualizar_indice)
+
 # PREDICCIÓN POR UBICACIÓN
 
-def predecir_riesgo_ubicacion(latitud, longitud, radio=0.005):
-    reportes = db.obtener_todos_reportes()
+def predecir_riesgo_ubicacion(latitud, longitud, radio=0.005, reportes=None):
+    if reportes is None:
+        return predecir_riesgo_ubicaciones([(latitud, longitud)], radio)[0]
     
     if not reportes:
         return {'nivel_riesgo': 'DESCONOCIDO', 'reportes_cercanos': 0}
     
     # Contar reportes cercanos
-    cercanos = 0
-    for r in reportes:
-        lat2 = float(r['latitud'])
-        lng2 = float(r['longitud'])
-        
-        distancia = ((latitud - lat2)**2 + (longitud - lng2)**2)**0.5
+    if isinstance(reportes, SnapshotColumnar):
+        cercanos = contar_cercanos_columnas(reportes, latitud, longitud, radio)
+    else:
+        cercanos = 0
+        for r in reportes:
+            lat2 = float(r['latitud'])
+            lng2 = float(r['longitud'])
+            
+            distancia = ((latitud - lat2)**2 + (longitud - lng2)**2)**0.5
+            
+            if distancia < radio:
+                cercanos += 1
+    
+    return _crear_prediccion(latitud, longitud, cercanos, radio)
+
+
+def predecir_riesgo_ubicaciones(puntos, radio=0.005):
+    """
+    Predice el riesgo de muchas ubicaciones a la vez (por ejemplo una ruta)
+    puntos: lista de (latitud, longitud)
+    Con Config.MOTOR_ESPACIAL 'sql' o 'postgis' se cuenta en PostgreSQL (Haversine,
+    una sola consulta); si no, o si la consulta falla, con el índice en memoria
+    """
+    conteos = espacial.contar_cercanos(puntos, radio * espacial.METROS_POR_GRADO)
+    if conteos is not None:
+        return [
+            _crear_prediccion(latitud, longitud, cercanos, radio)
+            for (latitud, longitud), cercanos in zip(puntos, conteos)
+        ]
+    
+    indice = obtener_indice_ubicaciones()
+    
+    with _indice_lock:
+        if not len(indice):
+            return [{'nivel_riesgo': 'DESCONOCIDO', 'reportes_cercanos': 0} for _ in puntos]
         
-        if distancia < radio:
-            cercanos += 1
+        return [
+            _crear_prediccion(latitud, longitud, indice.contar_cercanos(latitud, longitud, radio), radio)
+            for latitud, longitud in puntos
+        ]
+
+
+def predecir_riesgo_franja(latitud, longitud, dia_semana=None, hora=None, tipo=None, radio=0.005):
+    """
+    Riesgo de una ubicación en un día de la semana (0=Lunes) y/o una hora, desde
+    el cubo de riesgo (cubo.py): unas pocas posiciones del arreglo, sin recorrer
+    los reportes. relativo compara la franja con el promedio de las franjas del
+    mismo tamaño en ese lugar (2.0 = el doble de lo habitual).
+    """
+    cubo_riesgo = cubo.obtener_cubo()
+    if cubo_riesgo is None:
+        return {'nivel_riesgo': 'DESCONOCIDO', 'reportes_cercanos': 0}
+    
+    en_franja = cubo_riesgo.contar(latitud, longitud, radio, dia_semana, hora, tipo)
+    todas = cubo_riesgo.contar(latitud, longitud, radio, tipo=tipo)
+    franjas = (7 if dia_semana is not None else 1) * (24 if hora is not None else 1)
     
+    prediccion = _crear_prediccion(latitud, longitud, en_franja, radio)
+    prediccion.update({
+        'dia_semana': dia_semana,
+        'dia': DIAS_NOMBRE[dia_semana] if dia_semana is not None else None,
+        'hora': hora,
+        'tipo_robo': tipo,
+        'reportes_todas_franjas': todas,
+        'relativo': round(en_franja * franjas / todas, 2) if todas else None
+    })
+    return prediccion
+
+
+def predecir_riesgo_decaido(puntos, vida_media_dias, radio=0.005, ahora=None):
+    """
+    Riesgo de cada punto con los robos pesados por antigüedad: uno de hace
+    `vida_media_dias` cuenta la mitad que uno de hoy (decaimiento.py)
+    puntos: lista de (latitud, longitud)
+    """
+    riesgo = decaimiento.obtener_riesgo_decaido()
+    if riesgo is None:
+        return [{'nivel_riesgo': 'DESCONOCIDO', 'reportes_cercanos': 0} for _ in puntos]
+    
+    # Valida la vida media antes de recorrer los puntos
+    riesgo.indice_vida_media(vida_media_dias)
+    if ahora is None:
+        ahora = datetime.now()
+    
+    predicciones = []
+    for latitud, longitud in puntos:
+        efectivos = riesgo.valor(latitud, longitud, radio, vida_media_dias, ahora)
+        prediccion = _crear_prediccion(latitud, longitud, round(efectivos, 3), radio)
+        prediccion['vida_media_dias'] = vida_media_dias
+        predicciones.append(prediccion)
+    return predicciones
+
+
+def verificar_riesgo_decaido(reportes=None):
+    """
+    Compara los acumuladores armados en PostgreSQL contra sumar reporte a reporte
+    (las actualizaciones incrementales), llevados a la misma fecha
+    """
+    if reportes is None:
+        reportes = obtener_snapshot(columnar=False)
+    construido, _ = decaimiento.construir_riesgo_decaido()
+    esperado = decaimiento.RiesgoDecaido.desde_reportes(reportes)
+    if construido is None:
+        return False
+    ahora = datetime.now()
+    return bool(decaimiento.np.allclose(construido.decaido(ahora), esperado.decaido(ahora), rtol=1e-9, atol=1e-12))
+
+
+def verificar_cubo(reportes=None):
+    """
+    Compara el cubo construido en PostgreSQL contra sumar reporte a reporte
+    (el mismo camino que las actualizaciones incrementales)
+    """
+    if reportes is None:
+        reportes = obtener_snapshot(columnar=False)
+    construido, _ = cubo.construir_cubo()
+    esperado = cubo.CuboRiesgo.desde_reportes(reportes)
+    return construido is not None and (construido.conteos == esperado.conteos).all()
+
+
+def _crear_prediccion(latitud, longitud, cercanos, radio):
     return {
         'latitud': latitud,
         'longitud': longitud,
@@ -225,10 +806,68 @@ def predecir_riesgo_ubicacion(latitud, longitud, radio=0.005):
 if __name__ == '__main__':
     print(" Probando módulo de predicción...")
     
-    reporte = generar_reporte_completo()
+    # Equivalencia del clustering sobre filas sintéticas (no necesita la base de datos)
+    diferencias = verificar_zonas_riesgo(reportes_sinteticos())
+    if diferencias:
+        print(f"\n Zonas de riesgo sintéticas distintas a la implementación original (radios {diferencias})")
+        raise SystemExit(1)
+    print(f"   Zonas de riesgo (datos sintéticos): equivalentes a la implementación original")
+    
+    reportes = obtener_snapshot(columnar=False)
+    reporte = generar_reporte_completo(reportes)
     
     print(f"\n Resultados:")
     print(f"   Zonas de riesgo: {len(reporte['zonas_riesgo'])}")
     print(f"   Horas peligrosas: {len(reporte['horas_peligrosas'])}")
     print(f"   Tendencia: {reporte['tendencia']['tendencia'] if reporte['tendencia'] else 'N/A'}")
+    
+    # Equivalencia del clustering con índice espacial contra el algoritmo original
+    diferencias = verificar_zonas_riesgo(reportes)
+    if diferencias:
+        print(f"\n Zonas de riesgo distintas a la implementación original (radios {diferencias})")
+        raise SystemExit(1)
+    print(f"   Zonas de riesgo: equivalentes a la implementación original")
+    
+    # El camino vectorizado debe dar exactamente lo mismo que el de Python puro
+    if NUMPY_DISPONIBLE:
+        columnar = SnapshotColumnar.desde_reportes(reportes)
+        ahora = datetime.now()
+        if resumir_snapshot(columnar, ahora) != resumir_snapshot(reportes, ahora):
+            print(f"\n El resumen con NumPy no coincide con el de Python puro")
+            raise SystemExit(1)
+        print(f"   NumPy: resultados equivalentes al camino en Python puro")
+        
+        # Las columnas .npy abiertas con mmap deben ser las mismas que desde las filas
+        with tempfile.TemporaryDirectory() as directorio:
+            if not columnas_disco.verificar_snapshot_disco(reportes, Config.SNAPSHOT_DIR or directorio):
+                print(f"\n El snapshot en disco no coincide con las filas de la base de datos")
+                raise SystemExit(1)
+        print(f"   Snapshot en disco (mmap): equivalente a las filas de la base de datos")
+
+        # DBSCAN partido en teselas debe formar los mismos clusters que sin partir
+        if not agrupamiento.verificar_dbscan(columnar.latitud, columnar.longitud, 0.003,
+                                             Config.DBSCAN_MIN_PUNTOS, tesela=0.01):
+            print(f"\n DBSCAN por teselas no coincide con la implementación directa")
+            raise SystemExit(1)
+        print(f"   DBSCAN: teselas equivalentes a la implementación directa")
+
+    # El cubo de riesgo armado en SQL debe coincidir con sumar reporte a reporte
+    if cubo.np is not None:
+        if not verificar_cubo(reportes):
+            print(f"\n El cubo de riesgo no coincide con los reportes")
+            raise SystemExit(1)
+        print(f"   Cubo de riesgo: equivalente a sumar los reportes")
+        
+        if not verificar_riesgo_decaido(reportes):
+            print(f"\n El riesgo con decaimiento no coincide con los reportes")
+            raise SystemExit(1)
+        print(f"   Riesgo con decaimiento: equivalente a sumar los reportes")
+    
+    # El estado incremental debe coincidir con el cálculo completo
+    diferencias = verificar_estado_analitico()
+    if diferencias:
+        print(f"\n El estado analítico no coincide con el cálculo completo ({diferencias})")
+        raise SystemExit(1)
+    print(f"   Estado analítico: equivalente al cálculo completo")
+    
     print(f"\n Módulo funcionando correctamente")
\ No newline at end of file
@@ -0,0 +1,504 @@
+import base64
+from datetime import datetime, timedelta
+from config import Config
+import cache
+import predicciones as pred
+import teselas
+import mapa_calor
+import espacial
+import serializacion
+import formatos
+from indice_espacial import decodificar_polilinea, muestrear_polilinea, contar_muestras_polilinea
+
+# RUTAS COMPARTIDAS (FLASK Y QUART)
+#
+# app.py (Flask + psycopg2) y app_async.py (Quart + asyncpg) atienden las mismas
+# rutas con las mismas respuestas. Aquí está lo que no depende del servidor:
+# leer y validar la petición y armar el cuerpo de la respuesta. Cada app solo
+# hace la consulta (db o adb) y convierte el cuerpo con su jsonify.
+#
+# Las funciones devuelven (cuerpo, estado) o lanzan ErrorPeticion, que las dos
+# apps responden como {"success": false, "error": ...} con ese estado.
+
+class ErrorPeticion(Exception):
+    """Error que se responde al cliente con `estado` (400, 404, 503...)"""
+    
+    def __init__(self, mensaje, estado=400):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+SIN_BASE_DE_DATOS = 'No se pudo consultar la base de datos'
+
+def cuerpo_error(mensaje):
+    return {
+        'success': False,
+        'error': mensaje
+    }
+
+def exito(datos, estado=200):
+    return {
+        'success': True,
+        'data': datos
+    }, estado
+
+def lista(datos):
+    return {
+        'success': True,
+        'data': datos,
+        'total': len(datos)
+    }, 200
+
+def encontrado(dato, mensaje):
+    """El dato, o 404 con `mensaje` si la consulta no lo encontró"""
+    if not dato:
+        raise ErrorPeticion(mensaje, 404)
+    return exito(dato)
+
+# LECTURA DE PARÁMETROS
+
+def codificar_cursor(cursor):
+    """Convierte (fecha_creacion, id) en un token opaco para la URL"""
+    if cursor is None:
+        return None
+    fecha, reporte_id = cursor
+    texto = f"{fecha.isoformat()}|{reporte_id}"
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+def decodificar_cursor(token):
+    """Inverso de codificar_cursor; lanza ValueError si el token no es válido"""
+    try:
+        fecha, reporte_id = base64.urlsafe_b64decode(token.encode()).decode().split('|')
+        return datetime.fromisoformat(fecha), int(reporte_id)
+    except Exception:
+        raise ValueError('Cursor inválido')
+
+def leer_filtros_reportes(args):
+    """
+    Lee los filtros de reportes de la query string
+    bbox=oeste,sur,este,norte  desde=<fecha ISO>  hasta=<fecha ISO>  tipo_robo=<tipo>
+    Un hasta sin hora incluye el día completo (queda como antes_de = día siguiente)
+    Lanza ValueError si algún valor no es válido
+    """
+    filtros = {}
+    
+    if args.get('bbox'):
+        try:
+            oeste, sur, este, norte = (float(v) for v in args['bbox'].split(','))
+        except ValueError:
+            raise ValueError('bbox debe ser oeste,sur,este,norte')
+        if sur > norte or oeste > este:
+            raise ValueError('bbox debe ser oeste,sur,este,norte')
+        filtros['bbox'] = (oeste, sur, este, norte)
+    
+    for campo in ('desde', 'hasta'):
+        if args.get(campo):
+            try:
+                filtros[campo] = datetime.fromisoformat(args[campo])
+            except ValueError:
+                raise ValueError(f'{campo} debe ser una fecha ISO 8601')
+    
+    # hasta=2024-05-31 incluye todo ese día: se filtra como "antes del 1 de junio"
+    if args.get('hasta') and len(args['hasta']) == 10:
+        filtros['antes_de'] = filtros.pop('hasta') + timedelta(days=1)
+    
+    if args.get('tipo_robo'):
+        filtros['tipo_robo'] = args['tipo_robo']
+    
+    return filtros
+
+def leer_version_cambios(args):
+    """
+    Lee version=<entero> o fecha=<fecha ISO> de GET /api/reportes/cambios
+    Devuelve (version, fecha); ambos None si no vino ninguno
+    """
+    version = fecha = None
+    if args.get('version'):
+        try:
+            version = int(args['version'])
+        except ValueError:
+            raise ValueError('version debe ser un entero')
+        if version < 0:
+            raise ValueError('version debe ser un entero')
+    elif args.get('fecha'):
+        try:
+            fecha = datetime.fromisoformat(args['fecha'])
+        except ValueError:
+            raise ValueError('fecha debe ser una fecha ISO 8601')
+    return version, fecha
+
+def leer_franja(datos):
+    """
+    Lee dia_semana (0=Lunes), hora (0-23) y tipo_robo de POST /api/predicciones/ubicacion
+    Devuelve None si no vino ninguno (riesgo de todas las franjas)
+    """
+    if not any(campo in datos for campo in ('dia_semana', 'hora', 'tipo_robo')):
+        return None
+    franja = {'dia_semana': None, 'hora': None, 'tipo': datos.get('tipo_robo')}
+    for campo, clave, maximo in (('dia_semana', 'dia_semana', 6), ('hora', 'hora', 23)):
+        if datos.get(campo) is None:
+            continue
+        try:
+            franja[clave] = int(datos[campo])
+        except (TypeError, ValueError):
+            raise ValueError(f'{campo} debe ser un entero entre 0 y {maximo}')
+        if not 0 <= franja[clave] <= maximo:
+            raise ValueError(f'{campo} debe ser un entero entre 0 y {maximo}')
+    return franja
+
+def leer_vida_media(datos):
+    """vida_media_dias de las predicciones con decaimiento (None si no vino)"""
+    if datos.get('vida_media_dias') is None:
+        return None
+    disponibles = Config.RIESGO_VIDAS_MEDIAS_DIAS
+    try:
+        vida_media = float(datos['vida_media_dias'])
+    except (TypeError, ValueError):
+        vida_media = None
+    if vida_media not in disponibles:
+        raise ValueError(f"vida_media_dias debe ser una de: {', '.join(str(d) for d in disponibles)}")
+    return disponibles[disponibles.index(vida_media)]
+
+def leer_lote_ubicaciones(datos):
+    """
+    Lee los puntos y el radio de POST /api/predicciones/ubicaciones
+    Los puntos vienen como lista o como polilínea (codificada o lista de vértices
+    [lat, lng]) que se muestrea cada `paso` grados. Devuelve (puntos, radio)
+    Lanza ValueError si algún valor no es válido o si hay más de MAX_PUNTOS_LOTE puntos
+    """
+    radio = float(datos.get('radio', 0.005))
+    if not 0 < radio <= Config.MAX_RADIO_PREDICCION:
+        raise ValueError(f'radio debe estar entre 0 y {Config.MAX_RADIO_PREDICCION}')
+    
+    if 'puntos' in datos:
+        puntos = [
+            (float(p['latitud']), float(p['longitud'])) if isinstance(p, dict) else (float(p[0]), float(p[1]))
+            for p in datos['puntos']
+        ]
+    elif 'polilinea' in datos:
+        vertices = datos['polilinea']
+        if isinstance(vertices, str):
+            vertices = decodificar_polilinea(vertices)
+        else:
+            vertices = [(float(v[0]), float(v[1])) for v in vertices]
+        paso = float(datos.get('paso', radio))
+        # Se cuenta antes de muestrear: un paso diminuto no llega a generar la lista
+        if contar_muestras_polilinea(vertices, paso) > Config.MAX_PUNTOS_LOTE:
+            raise ValueError(f'Máximo {Config.MAX_PUNTOS_LOTE} puntos por consulta')
+        puntos = muestrear_polilinea(vertices, paso)
+    else:
+        raise ValueError('Se requiere una lista de puntos o una polilinea')
+    
+    if len(puntos) > Config.MAX_PUNTOS_LOTE:
+        raise ValueError(f'Máximo {Config.MAX_PUNTOS_LOTE} puntos por consulta')
+    return puntos, radio
+
+# Rutas que se listan en la página de inicio
+RUTAS_API = {
+    'GET /': 'Documentación de la API',
+    'GET /api/reportes': 'Obtener reportes paginados (limit, cursor, bbox, desde, hasta, tipo_robo) o todos con formato=ndjson; Accept elige JSON por columnas, MessagePack o binario',
+    'POST /api/reportes': 'Crear un nuevo reporte',
+    'POST /api/reportes/importar': 'Importación masiva de reportes (CSV o NDJSON)',
+    'GET /api/reportes/clusters': 'Reportes agrupados por zoom y bbox',
+    'GET /api/reportes/cercanos': 'Reportes más cercanos a un punto (latitud, longitud, cantidad)',
+    'GET /api/reportes/cambios': 'Reportes creados y eliminados desde una versión (version o fecha)',
+    'GET /api/eventos': 'Reportes nuevos/eliminados y zonas de riesgo en tiempo real (SSE, solo app_async.py)',
+    'GET /api/reportes/<id>': 'Obtener un reporte específico',
+    'DELETE /api/reportes/<id>': 'Eliminar un reporte',
+    'GET /api/reportes-con-usuarios': 'Obtener reportes con info de usuarios',
+    'GET /api/usuarios': 'Obtener todos los usuarios',
+    'POST /api/usuarios': 'Crear un nuevo usuario',
+    'GET /api/usuarios/<id>': 'Obtener un usuario específico',
+    'GET /api/usuarios/<id>/reportes': 'Obtener reportes de un usuario',
+    'GET /api/estadisticas': 'Obtener estadísticas generales',
+    'POST /api/predicciones/ubicacion': 'Riesgo de un punto; con dia_semana / hora / tipo_robo, el de esa franja; con vida_media_dias, con decaimiento',
+    'POST /api/predicciones/ubicaciones': 'Riesgo de varios puntos o de una ruta (vida_media_dias opcional)',
+    'GET /api/predicciones/heatmap/<z>/<x>/<y>': 'Tesela PNG del mapa de calor',
+    'GET /api/sistema/pool': 'Estado del pool de conexiones',
+    'GET /api/sistema/cache': 'Estado de las cachés'
+}
+
+
+def inicio(**extra):
+    """Página de inicio - Documentación de la API"""
+    return {
+        'mensaje': 'API de Sistema de Reportes de Robos',
+        'version': '1.0',
+        'estado': 'activo',
+        **extra,
+        'endpoints': RUTAS_API
+    }
+
+# REPORTES
+
+CAMPOS_REPORTE = ('usuario_id', 'tipo_robo', 'descripcion', 'latitud', 'longitud', 'fecha_incidente')
+
+def leer_pagina_reportes(args, formato):
+    """
+    Parámetros de GET /api/reportes para db.obtener_reportes_pagina
+    (limite, cursor, filtros, con_usuarios, compacto)
+    """
+    compacto = formato in formatos.FORMATOS_COMPACTOS
+    try:
+        limite = int(args.get('limit', Config.MAX_RESULTS_PER_PAGE))
+        cursor = args.get('cursor')
+        cursor = decodificar_cursor(cursor) if cursor else None
+        filtros = leer_filtros_reportes(args)
+    except ValueError as e:
+        raise ErrorPeticion(str(e))
+    
+    if limite < 1:
+        raise ErrorPeticion('limit debe ser mayor que 0')
+    return {
+        'limite': min(limite, Config.MAX_RESULTS_COMPACTO if compacto else Config.MAX_RESULTS_PER_PAGE),
+        'cursor': cursor,
+        'filtros': filtros,
+        'con_usuarios': args.get('con_usuarios') == '1',
+        'compacto': compacto
+    }
+
+def pagina_reportes(formato, reportes, siguiente):
+    """Cuerpo de una página: bytes en los formatos compactos (ver formatos.py), un dict en JSON"""
+    if formato in formatos.FORMATOS_COMPACTOS:
+        return formatos.codificar(formato, reportes, codificar_cursor(siguiente))
+    return {
+        'success': True,
+        'data': reportes,
+        'total': len(reportes),
+        'siguiente_cursor': codificar_cursor(siguiente)
+    }
+
+def clusters(args):
+    """
+    Reportes agrupados para el mapa
+    Parámetros: zoom (nivel del mapa) y bbox=oeste,sur,este,norte
+    """
+    try:
+        zoom = int(args['zoom'])
+        filtros = leer_filtros_reportes(args)
+        if 'bbox' not in filtros or not 0 <= zoom <= Config.ZOOM_MAX:
+            raise ValueError('Se requieren zoom (0-%d) y bbox' % Config.ZOOM_MAX)
+        resultado = teselas.clusters_bbox(filtros['bbox'], zoom)
+    except KeyError:
+        raise ErrorPeticion('Se requieren zoom y bbox')
+    except ValueError as e:
+        raise ErrorPeticion(str(e))
+    
+    if resultado is None:
+        raise ErrorPeticion(SIN_BASE_DE_DATOS, 503)
+    return lista(resultado)
+
+def reportes_cercanos(args):
+    """
+    Los reportes más cercanos a un punto (distancia real en metros)
+    Parámetros: latitud, longitud y cantidad (máximo Config.VECINOS_MAX)
+    Se resuelve en PostgreSQL con el motor de espacial.py
+    """
+    try:
+        latitud = float(args['latitud'])
+        longitud = float(args['longitud'])
+        cantidad = int(args.get('cantidad', 10))
+        if not -90 <= latitud <= 90 or not -180 <= longitud <= 180 or cantidad < 1:
+            raise ValueError
+    except (KeyError, ValueError):
+        raise ErrorPeticion('Se requieren latitud, longitud y cantidad válidas')
+    
+    reportes = espacial.reportes_mas_cercanos(latitud, longitud, min(cantidad, Config.VECINOS_MAX))
+    if reportes is None:
+        raise ErrorPeticion('No se pudieron buscar los reportes cercanos', 500)
+    return lista(reportes)
+
+def leer_cambios(args):
+    """(version, fecha) de GET /api/reportes/cambios (ver leer_version_cambios)"""
+    try:
+        return leer_version_cambios(args)
+    except ValueError as e:
+        raise ErrorPeticion(str(e))
+
+def respuesta_cambios(cambios):
+    if cambios is None:
+        raise ErrorPeticion('No se pudieron obtener los cambios', 500)
+    return {
+        'success': True,
+        **cambios
+    }, 200
+
+def leer_reporte_nuevo(datos):
+    """Argumentos de crear_reporte a partir del JSON de POST /api/reportes"""
+    for campo in CAMPOS_REPORTE:
+        if campo not in datos:
+            raise ErrorPeticion(f'Falta el campo requerido: {campo}')
+    return {
+        'usuario_id': int(datos['usuario_id']),
+        'tipo_robo': datos['tipo_robo'],
+        'descripcion': datos['descripcion'],
+        'latitud': float(datos['latitud']),
+        'longitud': float(datos['longitud']),
+        'fecha_incidente': datos['fecha_incidente'],
+        'barrio': datos.get('barrio')
+    }
+
+def respuesta_reporte_creado(reporte):
+    if not reporte:
+        raise ErrorPeticion('No se pudo crear el reporte', 500)
+    return {
+        'success': True,
+        'data': reporte,
+        'mensaje': 'Reporte creado exitosamente'
+    }, 201
+
+def leer_formato_importacion(args, content_type):
+    """Formato de POST /api/reportes/importar: ?formato=csv|ndjson o el Content-Type"""
+    formato = args.get('formato')
+    if not formato:
+        formato = 'csv' if 'csv' in (content_type or '') else 'ndjson'
+    if formato not in ('csv', 'ndjson'):
+        raise ErrorPeticion('formato debe ser csv o ndjson')
+    return formato
+
+def respuesta_importacion(resumen):
+    return {
+        'success': True,
+        'data': resumen,
+        'mensaje': f"{resumen['insertados']} de {resumen['filas']} reportes importados"
+    }, 200
+
+def respuesta_reporte_eliminado(eliminado, reporte_id):
+    if not eliminado:
+        raise ErrorPeticion('Reporte no encontrado', 404)
+    return {
+        'success': True,
+        'mensaje': f'Reporte {reporte_id} eliminado exitosamente'
+    }, 200
+
+# USUARIOS
+
+def leer_usuario_nuevo(datos):
+    """Argumentos de crear_usuario a partir del JSON de POST /api/usuarios"""
+    if not datos.get('nombre') or not datos.get('email'):
+        raise ErrorPeticion('Nombre y email son requeridos')
+    
+    # Por ahora usamos un hash simple (en producción usar bcrypt)
+    password = datos.get('password', 'password123')
+    return {
+        'nombre': datos['nombre'],
+        'email': datos['email'],
+        'telefono': datos.get('telefono'),
+        'password_hash': f"hash_{password}"
+    }
+
+def respuesta_usuario_creado(usuario):
+    if not usuario:
+        raise ErrorPeticion('No se pudo crear el usuario. Es posible que el email ya esté registrado.')
+    cache.incrementar_version()  # total_usuarios de las estadísticas
+    return {
+        'success': True,
+        'data': serializacion.usuario_publico(usuario),  # sin password_hash
+        'mensaje': 'Usuario creado exitosamente'
+    }, 201
+
+def leer_usuario_actualizado(datos):
+    """Argumentos de actualizar_usuario (sin usuario_id) del JSON de PUT /api/usuarios/<id>"""
+    return {
+        'nombre': datos.get('nombre'),
+        'telefono': datos.get('telefono')
+    }
+
+def respuesta_usuario_actualizado(usuario):
+    if not usuario:
+        raise ErrorPeticion('Usuario no encontrado o no se pudo actualizar', 404)
+    cache.incrementar_version()  # usuario_mas_activo muestra el nombre
+    return {
+        'success': True,
+        'data': serializacion.usuario_publico(usuario),
+        'mensaje': 'Usuario actualizado exitosamente'
+    }, 200
+
+# ESTADÍSTICAS Y SISTEMA
+
+def cuerpo_estadisticas(stats):
+    """Cuerpo cacheable de GET /api/estadisticas (None si la consulta falló: no se guarda)"""
+    if stats is None:
+        return None
+    return {
+        'success': True,
+        'data': stats
+    }
+
+def estado_cache():
+    """Estadísticas de las cachés de resultados y de teselas"""
+    return exito({
+        'resultados': cache.resultados.estadisticas(),
+        'clusters': teselas.estadisticas_cache_clusters()
+    })
+
+# PREDICCIONES
+
+def cuerpo_predicciones():
+    return {
+        'success': True,
+        'data': pred.generar_reporte_completo()
+    }
+
+def leer_radio_zonas(args):
+    try:
+        radio = float(args.get('radio', 0.01))
+        if radio <= 0:
+            raise ValueError
+    except ValueError:
+        raise ErrorPeticion('radio debe ser un número mayor que 0')
+    return radio
+
+def cuerpo_zonas_riesgo(radio):
+    zonas = pred.calcular_zonas_riesgo(radio)
+    return {
+        'success': True,
+        'data': zonas,
+        'total': len(zonas)
+    }
+
+def tesela_calor(z, x, y):
+    """PNG de la tesela del mapa de calor; 404 fuera de rango y 503 si falló la base de datos"""
+    if z > Config.ZOOM_MAX or x >= 2 ** z or y >= 2 ** z:
+        raise ErrorPeticion('Tesela fuera de rango', 404)
+    png = mapa_calor.obtener_tesela(z, x, y)
+    if png is None:
+        raise ErrorPeticion(SIN_BASE_DE_DATOS, 503)
+    return png
+
+def predecir_ubicacion(datos):
+    """Predecir riesgo de una ubicación específica"""
+    if 'latitud' not in datos or 'longitud' not in datos:
+        raise ErrorPeticion('Se requieren latitud y longitud')
+    
+    try:
+        franja = leer_franja(datos)
+        vida_media = leer_vida_media(datos)
+        if franja is not None and vida_media is not None:
+            raise ValueError('vida_media_dias no se puede combinar con dia_semana / hora / tipo_robo')
+    except ValueError as e:
+        raise ErrorPeticion(str(e))
+    
+    latitud = float(datos['latitud'])
+    longitud = float(datos['longitud'])
+    if vida_media is not None:
+        prediccion = pred.predecir_riesgo_decaido([(latitud, longitud)], vida_media)[0]
+    elif franja is not None:
+        prediccion = pred.predecir_riesgo_franja(latitud, longitud, **franja)
+    else:
+        prediccion = pred.predecir_riesgo_ubicacion(latitud, longitud)
+    return exito(prediccion)
+
+def predecir_ubicaciones(datos):
+    """Predecir riesgo de muchas ubicaciones (lista de puntos o una ruta)"""
+    try:
+        puntos, radio = leer_lote_ubicaciones(datos)
+        vida_media = leer_vida_media(datos)
+    except ValueError as e:
+        raise ErrorPeticion(str(e))
+    
+    if vida_media is not None:
+        predicciones = pred.predecir_riesgo_decaido(puntos, vida_media, radio)
+    else:
+        predicciones = pred.predecir_riesgo_ubicaciones(puntos, radio)
+    return lista(predicciones)
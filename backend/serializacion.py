@@ -0,0 +1,61 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # sin orjson se usa el módulo json estándar
+    orjson = None
+
+# SERIALIZACIÓN JSON
+#
+# Un solo lugar para convertir a JSON lo que devuelve la base de datos:
+# las filas (RealDictRow de psycopg2 o dicts de asyncpg) se pasan tal cual,
+# sin copiarlas ni convertir latitud/longitud (Decimal) y fechas fila por fila.
+
+def _convertir(valor):
+    """Tipos de la base de datos que JSON no conoce"""
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f'{type(valor).__name__} no es serializable a JSON')
+
+
+def dumps(valor, ordenar=False):
+    """
+    Convierte a JSON (bytes UTF-8)
+    Decimal -> número y datetime/date -> texto ISO 8601, igual que float() e .isoformat()
+    ordenar: ordena las claves (para que el resultado sea estable, por ejemplo en ETags)
+    """
+    if orjson is not None:
+        opciones = orjson.OPT_NON_STR_KEYS
+        if ordenar:
+            opciones |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(valor, default=_convertir, option=opciones)
+    return json.dumps(valor, default=_convertir, ensure_ascii=False, sort_keys=ordenar).encode()
+
+
+def lineas_ndjson(filas):
+    """
+    Una línea JSON por fila, para transmitir resultados grandes
+    Si `filas` falla a mitad de camino la respuesta ya salió con 200: se cierra con
+    una última línea {"success": false, "error": ...} para que el cliente no la tome por completa
+    """
+    try:
+        for fila in filas:
+            yield dumps(fila) + b'\n'
+    except Exception as e:
+        yield linea_error_ndjson(e)
+
+
+def linea_error_ndjson(error):
+    """Línea final de una transmisión NDJSON que se cortó por un error"""
+    return dumps({'success': False, 'error': str(error)}) + b'\n'
+
+
+def usuario_publico(usuario):
+    """Copia del usuario sin password_hash"""
+    usuario_dict = dict(usuario)
+    usuario_dict.pop('password_hash', None)
+    return usuario_dict
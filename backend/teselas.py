@@ -0,0 +1,199 @@
+import math
+import threading
+from collections import OrderedDict
+from config import Config
+import database as db
+
+# TESELAS (ESQUEMA SLIPPY MAP / OPENSTREETMAP)
+
+LATITUD_MAX = 85.0511287798
+
+
+def lat_lng_a_tesela(lat, lng, zoom):
+    """Tesela (x, y) que contiene el punto en el nivel de zoom dado"""
+    lat = max(-LATITUD_MAX, min(LATITUD_MAX, lat))
+    n = 2 ** zoom
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tesela_del_reporte(lat, lng, zoom):
+    """
+    Tesela (x, y) en la que database.obtener_clusters_bbox cuenta el punto: la de
+    limites_tesela con sur <= lat < norte y oeste <= lng < este. Sobre un borde
+    lat_lng_a_tesela puede dar la vecina (el borde norte de una tesela es el sur
+    de la de arriba), así que se corrige comparando con los mismos límites.
+    """
+    n = 2 ** zoom
+    x, y = lat_lng_a_tesela(lat, lng, zoom)
+    oeste, sur, este, norte = limites_tesela(zoom, x, y)
+    if lat >= norte and y > 0:
+        y -= 1
+    elif lat < sur and y < n - 1:
+        y += 1
+    if lng >= este and x < n - 1:
+        x += 1
+    elif lng < oeste and x > 0:
+        x -= 1
+    return x, y
+
+
+def limites_tesela(zoom, x, y):
+    """Límites (oeste, sur, este, norte) en grados de una tesela"""
+    n = 2 ** zoom
+    oeste = x / n * 360.0 - 180.0
+    este = (x + 1) / n * 360.0 - 180.0
+    norte = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    sur = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return oeste, sur, este, norte
+
+
+def lat_lng_a_pixel(lat, lng, zoom, tam=256):
+    """Posición en píxeles globales (Web Mercator) del punto en ese zoom"""
+    lat = max(-LATITUD_MAX, min(LATITUD_MAX, lat))
+    n = tam * 2 ** zoom
+    px = (lng + 180.0) / 360.0 * n
+    py = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return px, py
+
+
+def pixel_a_lat_lng(px, py, zoom, tam=256):
+    """Inverso de lat_lng_a_pixel"""
+    n = tam * 2 ** zoom
+    lng = px / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * py / n))))
+    return lat, lng
+
+
+def teselas_en_bbox(bbox, zoom):
+    """Lista de teselas (x, y) que cubren un bbox (oeste, sur, este, norte)"""
+    oeste, sur, este, norte = bbox
+    x1, y1 = lat_lng_a_tesela(norte, max(oeste, -180.0), zoom)
+    x2, y2 = lat_lng_a_tesela(sur, min(este, 179.999999), zoom)
+    return [(x, y) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1)]
+
+# CACHÉ DE TESELAS
+
+class CacheTeselas:
+    """
+    Caché LRU de resultados por tesela (zoom, x, y), segura entre hilos
+    Cuando cambia un reporte solo se invalidan las teselas que lo contienen.
+    """
+
+    def __init__(self, maximo=5000):
+        self.maximo = maximo
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave, calcular):
+        """
+        Devuelve el valor de la tesela, calculándolo con calcular() si no está
+        Si calcular() devuelve None (no se pudo leer la base) no se guarda
+        """
+        with self._lock:
+            if clave in self._datos:
+                self._datos.move_to_end(clave)
+                self.aciertos += 1
+                return self._datos[clave]
+            self.fallos += 1
+            version = self._version
+
+        valor = calcular()
+
+        with self._lock:
+            # Si hubo una invalidación mientras se calculaba, el valor puede estar viejo
+            if valor is not None and version == self._version:
+                self._datos[clave] = valor
+                self._datos.move_to_end(clave)
+                while len(self._datos) > self.maximo:
+                    self._datos.popitem(last=False)
+        return valor
+
+    def invalidar(self, claves):
+        """Quita de la caché las teselas indicadas"""
+        with self._lock:
+            self._version += 1
+            for clave in claves:
+                self._datos.pop(clave, None)
+
+    def limpiar(self):
+        with self._lock:
+            self._version += 1
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'teselas': len(self._datos),
+                'maximo': self.maximo,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos
+            }
+
+# CLUSTERS DE REPORTES POR TESELA
+
+_cache_clusters = CacheTeselas(Config.CACHE_TESELAS_MAX)
+
+
+def clusters_tesela(zoom, x, y):
+    """
+    Clusters (conteo, centro y tipo más común) de una tesela, desde la caché si está
+    Devuelve None si la base de datos falló
+    """
+    def calcular():
+        filas = db.obtener_clusters_bbox(limites_tesela(zoom, x, y), Config.CLUSTER_DIVISIONES)
+        if filas is None:
+            return None
+        return [
+            {
+                'latitud': float(f['latitud']),
+                'longitud': float(f['longitud']),
+                'cantidad': f['cantidad'],
+                'tipo_mas_comun': f['tipo_mas_comun']
+            }
+            for f in filas
+        ]
+
+    return _cache_clusters.obtener((zoom, x, y), calcular)
+
+
+def clusters_bbox(bbox, zoom):
+    """
+    Clusters de todas las teselas que cubren el bbox en ese zoom
+    Devuelve None si alguna tesela no se pudo leer de la base de datos
+    """
+    teselas = teselas_en_bbox(bbox, zoom)
+    if len(teselas) > Config.CLUSTER_MAX_TESELAS:
+        raise ValueError(f'El bbox cubre {len(teselas)} teselas (máximo {Config.CLUSTER_MAX_TESELAS})')
+
+    clusters = []
+    for x, y in teselas:
+        tesela = clusters_tesela(zoom, x, y)
+        if tesela is None:
+            return None
+        clusters.extend(tesela)
+    return clusters
+
+
+def estadisticas_cache_clusters():
+    return _cache_clusters.estadisticas()
+
+
+def _invalidar_clusters(evento, reporte):
+    """Un reporte nuevo o eliminado solo afecta a la tesela que lo contiene en cada zoom"""
+    if evento == 'recargar':
+        _cache_clusters.limpiar()
+        return
+    lat = float(reporte['latitud'])
+    lng = float(reporte['longitud'])
+    _cache_clusters.invalidar(
+        (zoom,) + tesela_del_reporte(lat, lng, zoom)
+        for zoom in range(Config.ZOOM_MAX + 1)
+    )
+
+
+db.suscribir_cambios(_invalidar_clusters)
@@ -0,0 +1,8 @@
+from app import crear_app
+
+# PUNTO DE ENTRADA WSGI
+#
+# Uso: gunicorn -c gunicorn.conf.py wsgi:app
+# (workers, hilos y dirección se leen de Config; ver gunicorn.conf.py)
+
+app = crear_app()